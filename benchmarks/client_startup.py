@@ -0,0 +1,73 @@
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import statistics
+
+# Compare client startup time and memory of the onnxruntime VAD against the
+# previous torch-based stack (torch + torchaudio + silero_vad):
+#
+#   uv run benchmarks/client_startup.py --runs 5
+#
+# Each run is a fresh interpreter that imports the client and scores one VAD frame,
+# so the numbers include module imports and model loading.
+
+CLIENT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "client")
+
+
+def run_stack(stack):
+    import numpy as np
+    frame = np.zeros(512, dtype=np.float32)
+    if stack == "torch":
+        # What the client imported before the switch to onnxruntime
+        import sounddevice, requests, pyperclip, opencc
+        import torch
+        import torchaudio
+        from silero_vad import load_silero_vad
+        model = load_silero_vad()
+        with torch.no_grad():
+            model(torch.from_numpy(frame), 16000).item()
+    else:
+        sys.path.insert(0, CLIENT_DIR)
+        import main
+        from vad import SileroVAD
+        SileroVAD()(frame)
+    # ru_maxrss is reported in KiB on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"stack": stack, "peak_rss_mb": peak_rss_mb, "torch_loaded": "torch" in sys.modules}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Client startup time and RSS benchmark")
+    parser.add_argument("--stacks", nargs="+", default=["torch", "onnx"], choices=["torch", "onnx"])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--run-stack", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stack:
+        run_stack(args.run_stack)
+        return
+
+    print(f"{'stack':<8} {'startup':>9} {'peak RSS':>10}  torch loaded")
+    for stack in args.stacks:
+        times, rss, torch_loaded = [], [], False
+        for _ in range(args.runs):
+            start_time = time.time()
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-stack", stack], capture_output=True, text=True)
+            elapsed = time.time() - start_time
+            if proc.returncode != 0:
+                print(f"{stack} failed:\n{proc.stderr}")
+                break
+            report = json.loads(proc.stdout.strip().splitlines()[-1])
+            times.append(elapsed)
+            rss.append(report["peak_rss_mb"])
+            torch_loaded = report["torch_loaded"]
+        if times:
+            print(f"{stack:<8} {statistics.median(times):>8.2f}s {statistics.median(rss):>8.0f}MB  {torch_loaded}")
+
+
+if __name__ == "__main__":
+    main()
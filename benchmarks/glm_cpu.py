@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+# Benchmark GLM-ASR CPU modes (fp32 / bf16 / int8) for latency, memory and accuracy.
+# Each mode runs in its own process so peak RSS is measured per model.
+#
+#   uv run benchmarks/glm_cpu.py --audio-dir /path/to/wavs --modes fp32 int8
+#
+# A reference transcript may sit next to each WAV as <name>.txt.
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server")
+
+
+def edit_distance(a, b):
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def cer(hypothesis, reference):
+    hypothesis = "".join(hypothesis.split())
+    reference = "".join(reference.split())
+    if not reference:
+        return 0.0 if not hypothesis else 1.0
+    return edit_distance(hypothesis, reference) / len(reference)
+
+
+def list_audio(audio_dir):
+    return sorted(os.path.join(audio_dir, f) for f in os.listdir(audio_dir) if f.lower().endswith(".wav"))
+
+
+def run_mode(mode, audio_dir, num_threads, system_prompt):
+    import soundfile as sf
+    sys.path.insert(0, SERVER_DIR)
+    from backends.glm_backend import GLMBackend
+
+    start_time = time.time()
+    backend = GLMBackend(config={"glm": {"device": "cpu", "cpu_dtype": mode, "num_threads": num_threads}})
+    load_time = time.time() - start_time
+
+    results = []
+    for path in list_audio(audio_dir):
+        audio, sample_rate = sf.read(path, dtype="float32", always_2d=True)
+        audio = audio.mean(axis=1)
+        start_time = time.time()
+        text = backend.transcribe(audio, sample_rate, system_prompt=system_prompt)
+        results.append({"file": os.path.basename(path), "text": text, "latency": time.time() - start_time, "audio_s": len(audio) / sample_rate})
+
+    # ru_maxrss is reported in KiB on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"mode": mode, "load_s": load_time, "peak_rss_mb": peak_rss_mb, "results": results}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GLM-ASR CPU quantization benchmark")
+    parser.add_argument("--audio-dir", required=True, help="Directory of WAV files (optional <name>.txt references)")
+    parser.add_argument("--modes", nargs="+", default=["fp32", "int8"], choices=["fp32", "bf16", "int8"])
+    parser.add_argument("--num-threads", type=int, default=os.cpu_count())
+    parser.add_argument("--system-prompt", type=str, default=None)
+    parser.add_argument("--run-mode", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        run_mode(args.run_mode, args.audio_dir, args.num_threads, args.system_prompt)
+        return
+
+    reports = {}
+    for mode in args.modes:
+        cmd = [sys.executable, os.path.abspath(__file__), "--audio-dir", args.audio_dir, "--run-mode", mode, "--num-threads", str(args.num_threads)]
+        if args.system_prompt:
+            cmd += ["--system-prompt", args.system_prompt]
+        print(f"Running {mode}...")
+        output = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        reports[mode] = json.loads(output.strip().splitlines()[-1])
+
+    references = {}
+    for path in list_audio(args.audio_dir):
+        ref_path = os.path.splitext(path)[0] + ".txt"
+        if os.path.exists(ref_path):
+            with open(ref_path, encoding="utf-8") as f:
+                references[os.path.basename(path)] = f.read().strip()
+
+    baseline = reports.get("fp32")
+    print(f"\n{'mode':<6} {'load':>7} {'avg lat':>8} {'RTF':>6} {'RSS MB':>8} {'CER ref':>8} {'CER fp32':>9}")
+    for mode, report in reports.items():
+        results = report["results"]
+        total_latency = sum(r["latency"] for r in results)
+        total_audio = sum(r["audio_s"] for r in results)
+        avg_latency = total_latency / len(results) if results else 0.0
+        rtf = total_latency / total_audio if total_audio else 0.0
+
+        ref_scores = [cer(r["text"], references[r["file"]]) for r in results if r["file"] in references]
+        cer_ref = f"{sum(ref_scores) / len(ref_scores):.3f}" if ref_scores else "-"
+        cer_base = "-"
+        if baseline and mode != "fp32":
+            base_texts = {r["file"]: r["text"] for r in baseline["results"]}
+            scores = [cer(r["text"], base_texts[r["file"]]) for r in results if r["file"] in base_texts]
+            cer_base = f"{sum(scores) / len(scores):.3f}" if scores else "-"
+        print(f"{mode:<6} {report['load_s']:>6.1f}s {avg_latency:>7.2f}s {rtf:>6.2f} {report['peak_rss_mb']:>8.0f} {cer_ref:>8} {cer_base:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+import argparse
+
+# Check that GLM-ASR gives the same transcript with and without the prompt cache.
+# Every clip is transcribed uncached, then twice cached (filling the cache, then
+# hitting it); any difference is reported and makes the script exit with status 1.
+#
+#   uv run benchmarks/glm_prompt_cache.py --audio-dir /path/to/wavs --system-prompt "..."
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GLM-ASR prompt cache equivalence check")
+    parser.add_argument("--audio-dir", required=True, help="Directory of WAV files")
+    parser.add_argument("--system-prompt", type=str, default=None)
+    parser.add_argument("--device", default="auto", help="glm device setting (auto, cpu, cuda)")
+    args = parser.parse_args()
+
+    import soundfile as sf
+    sys.path.insert(0, SERVER_DIR)
+    from backends.glm_backend import GLMBackend
+
+    backend = GLMBackend(config={"glm": {"device": args.device}})
+    cache_size = backend.prompt_cache_size or 8
+    paths = sorted(os.path.join(args.audio_dir, f) for f in os.listdir(args.audio_dir) if f.lower().endswith(".wav"))
+
+    mismatches = 0
+    for path in paths:
+        audio, sample_rate = sf.read(path, dtype="float32", always_2d=True)
+        audio = audio.mean(axis=1)
+        texts = {}
+        for label, size in (("uncached", 0), ("cache fill", cache_size), ("cache hit", cache_size)):
+            backend.prompt_cache_size = size
+            start_time = time.time()
+            texts[label] = backend.transcribe(audio, sample_rate, system_prompt=args.system_prompt)
+            print(f"{os.path.basename(path)} {label}: {time.time() - start_time:.2f}s")
+        if backend.prompt_cache_size == 0:
+            print("Prompt cache was disabled after an error, see the log above")
+            sys.exit(1)
+        if len(set(texts.values())) > 1:
+            mismatches += 1
+            print(f"MISMATCH {os.path.basename(path)}")
+            for label, text in texts.items():
+                print(f"  {label}: {text}")
+
+    print(f"{len(paths) - mismatches}/{len(paths)} clips identical with and without the prompt cache")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
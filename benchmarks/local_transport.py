@@ -0,0 +1,81 @@
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+# Compare the round-trip overhead of the local server's transports: multipart WAV over
+# HTTP on loopback against the Unix socket with audio in shared memory.
+#
+#   uv run benchmarks/local_transport.py --durations 1 5 15 --requests 200
+#
+# The server runs the null backend with silence trimming off, so the numbers are
+# transport and request handling only.
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "client"))
+
+from server_pool import HttpServer
+from shm_transport import UnixSocketServer, UNIX_URL_PREFIX
+
+
+def start_server(port, socket_path):
+    config = {"server": {"trim_silence": False}}
+    cmd = [sys.executable, os.path.join(ROOT_DIR, "server", "server.py"), "--backend", "null",
+           "--port", str(port), "--unix-socket", socket_path, "--config-json", json.dumps(config)]
+    return subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+
+
+def measure(member, audio, sample_rate, requests):
+    latencies = []
+    for _ in range(requests):
+        start_time = time.perf_counter()
+        member.transcribe(audio, sample_rate, {}, uuid.uuid4().hex, timeout=10)
+        latencies.append(time.perf_counter() - start_time)
+    return np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local server transport benchmark")
+    parser.add_argument("--durations", type=float, nargs="+", default=[1, 5, 15], help="Utterance lengths in seconds")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per transport and duration")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    sample_rate = 16000
+    socket_path = os.path.join(tempfile.gettempdir(), f"wtako_asr_bench_{os.getpid()}.sock")
+    proc = start_server(args.port, socket_path)
+    members = {
+        "http": HttpServer(f"http://localhost:{args.port}"),
+        "unix+shm": UnixSocketServer(UNIX_URL_PREFIX + socket_path),
+    }
+    try:
+        deadline = time.time() + 30
+        while not all(member.probe() for member in members.values()):
+            if proc.poll() is not None or time.time() > deadline:
+                print("Server failed to start")
+                return
+            time.sleep(0.2)
+
+        rng = np.random.default_rng(0)
+        print(f"{'audio':>6} {'transport':<10} {'median':>9} {'p90':>9}")
+        for duration in args.durations:
+            audio = (rng.standard_normal(int(duration * sample_rate)) * 0.1).astype(np.float32)
+            for name, member in members.items():
+                # Warm up connections, page mappings and the server's threads
+                measure(member, audio, sample_rate, 5)
+                latencies = measure(member, audio, sample_rate, args.requests)
+                print(f"{duration:>5.1f}s {name:<10} {np.median(latencies):>7.2f}ms {np.percentile(latencies, 90):>7.2f}ms")
+    finally:
+        for member in members.values():
+            member.close()
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    main()
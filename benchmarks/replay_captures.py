@@ -0,0 +1,92 @@
+import os
+import io
+import sys
+import time
+import wave
+import argparse
+import numpy as np
+import requests
+
+from glm_cpu import cer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "client"))
+from capture_store import CaptureReader, CAPTURE_SAMPLE_RATE
+
+# Replays captured utterances against a server or an in-process backend and compares
+# latency and transcripts with what was recorded at capture time:
+#
+#   uv run benchmarks/replay_captures.py ~/.local/share/wtako-asr-ime/captures --server http://localhost:8000
+#   uv run benchmarks/replay_captures.py <capture dir> --backend sensevoice --since-days 7
+
+
+def to_wav(pcm):
+    with io.BytesIO() as bio:
+        with wave.open(bio, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(CAPTURE_SAMPLE_RATE)
+            wav_file.writeframes(np.asarray(pcm).tobytes())
+        return bio.getvalue()
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured utterances")
+    parser.add_argument("capture_dir")
+    parser.add_argument("--server", type=str, help="ASR server URL to replay against")
+    parser.add_argument("--backend", type=str, help="Load this backend in-process instead of using a server")
+    parser.add_argument("--since-days", type=float, help="Only replay captures from the last N days")
+    parser.add_argument("--limit", type=int, help="Replay at most N utterances")
+    args = parser.parse_args()
+    if not args.server and not args.backend:
+        parser.error("one of --server or --backend is required")
+
+    reader = CaptureReader(args.capture_dir)
+    records = reader.records
+    if args.since_days:
+        cutoff = time.time() - args.since_days * 86400
+        records = [r for r in records if r["timestamp"] >= cutoff]
+    if args.limit:
+        records = records[:args.limit]
+    print(f"Replaying {len(records)} of {len(reader)} captured utterances")
+
+    backend = None
+    if args.backend:
+        sys.path.insert(0, os.path.join(ROOT_DIR, "server"))
+        from backends import create_backend
+        backend = create_backend(args.backend, config={})
+
+    old_latencies, new_latencies, scores = [], [], []
+    for record in records:
+        pcm = reader.audio(record)
+        system_prompt = record.get("settings", {}).get("system_prompt")
+        start_time = time.time()
+        if backend is not None:
+            text = backend.transcribe(pcm.astype(np.float32) / 32768.0, CAPTURE_SAMPLE_RATE, system_prompt=system_prompt)
+        else:
+            data = {"system_prompt": system_prompt} if system_prompt else {}
+            response = requests.post(args.server, files={"audio": ("audio.wav", to_wav(pcm), "audio/wav")}, data=data, timeout=120)
+            response.encoding = "utf-8"
+            text = response.text if response.status_code == 200 else ""
+        latency = time.time() - start_time
+
+        old_latencies.append(record.get("latency_s", 0.0))
+        new_latencies.append(latency)
+        # Compare against the backend's raw output, before client-side post-processing
+        scores.append(cer(text, record.get("raw_text", record.get("text", ""))))
+
+    if not records:
+        return
+    print(f"{'':<10} {'p50':>7} {'p90':>7} {'p99':>7}")
+    for name, values in (("captured", old_latencies), ("replayed", new_latencies)):
+        print(f"{name:<10} {percentile(values, 50):>6.2f}s {percentile(values, 90):>6.2f}s {percentile(values, 99):>6.2f}s")
+    changed = sum(1 for s in scores if s > 0)
+    print(f"Transcript CER vs captured: mean {np.mean(scores):.3f}, {changed}/{len(scores)} utterances changed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import numpy as np
+import soxr
+
+FRONTEND_SAMPLE_RATE = 16000
+# 32 ms at 16 kHz, the frame size Silero VAD expects
+FRAME_SAMPLES = 512
+
+
+def negotiate_input_format(device, default_rate, default_channels):
+    """Returns (sample_rate, channels) for the input stream, preferring 16 kHz mono.
+
+    Opening the device at the front-end rate skips resampling and downmixing entirely;
+    devices that reject it keep their default format.
+    """
+    import sounddevice as sd
+    try:
+        sd.check_input_settings(device=device, samplerate=FRONTEND_SAMPLE_RATE, channels=1, dtype="float32")
+        return FRONTEND_SAMPLE_RATE, 1
+    except Exception:
+        return default_rate, default_channels
+
+
+class AudioFrontend:
+    """Converts input blocks to 16 kHz mono frames of FRAME_SAMPLES.
+
+    The resampler is a persistent soxr stream, so block boundaries don't cause
+    discontinuities and its filter is built once per recording instead of once per block.
+    Every frame is produced exactly once and shared by the VAD and the upload buffer.
+    """
+
+    def __init__(self, input_sample_rate, channels, frame_samples=FRAME_SAMPLES):
+        self.input_sample_rate = input_sample_rate
+        self.channels = channels
+        self.frame_samples = frame_samples
+        self.resampler = None
+        if input_sample_rate != FRONTEND_SAMPLE_RATE:
+            self.resampler = soxr.ResampleStream(input_sample_rate, FRONTEND_SAMPLE_RATE, 1, dtype="float32")
+        self.remainder = np.zeros(0, dtype=np.float32)
+
+    def process(self, block):
+        """Returns the complete frames made available by one input block."""
+        block = np.asarray(block, dtype=np.float32)
+        if block.ndim == 1:
+            mono = block
+        elif block.shape[1] == 1:
+            mono = block[:, 0]
+        else:
+            mono = block.mean(axis=1, dtype=np.float32)
+        if self.resampler is not None:
+            mono = self.resampler.resample_chunk(np.ascontiguousarray(mono))
+
+        samples = np.concatenate((self.remainder, mono)) if len(self.remainder) else mono
+        count = len(samples) // self.frame_samples
+        self.remainder = samples[count * self.frame_samples:].copy()
+        # Copies so frames don't keep the whole block alive once they are stored
+        return list(samples[:count * self.frame_samples].reshape(count, self.frame_samples).copy())
+
+    def flush(self):
+        """Returns the audio still held back at the end of a recording: the resampler's
+        delayed output and the last partial frame, zero-padded to a full frame."""
+        samples = self.remainder
+        if self.resampler is not None:
+            tail = self.resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+            samples = np.concatenate((samples, tail))
+        self.remainder = np.zeros(0, dtype=np.float32)
+        if not len(samples):
+            return []
+        count = -(-len(samples) // self.frame_samples)
+        frames = np.zeros(count * self.frame_samples, dtype=np.float32)
+        frames[:len(samples)] = samples
+        return list(frames.reshape(count, self.frame_samples))
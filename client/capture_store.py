@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import uuid
+import threading
+import numpy as np
+
+CAPTURE_SAMPLE_RATE = 16000
+INDEX_FILE = "index.jsonl"
+
+
+def to_capture_pcm(audio_data, sample_rate):
+    """Converts float32 audio at any rate to the store's 16 kHz int16 format."""
+    if sample_rate != CAPTURE_SAMPLE_RATE:
+        import soxr
+        audio_data = soxr.resample(audio_data, sample_rate, CAPTURE_SAMPLE_RATE)
+    return (np.clip(audio_data, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+class CaptureStore:
+    """Append-only store of utterance audio for replay and benchmarking.
+
+    PCM is appended to numbered segment files and described by one JSON line per
+    utterance in index.jsonl. When the segments exceed max_bytes the oldest ones
+    are deleted together with their index entries.
+    """
+
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3, segment_bytes=64 * 1024 ** 2):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        segments = self._segments()
+        self.segment_id = segments[-1] if segments else 0
+        if not segments or self._segment_size(self.segment_id) >= self.segment_bytes:
+            self.segment_id += 1
+
+    def _segment_path(self, segment_id):
+        return os.path.join(self.directory, f"seg-{segment_id:06d}.pcm")
+
+    def _segment_size(self, segment_id):
+        path = self._segment_path(segment_id)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _segments(self):
+        return sorted(int(f[4:10]) for f in os.listdir(self.directory) if f.startswith("seg-") and f.endswith(".pcm"))
+
+    def append(self, pcm, **metadata):
+        """Stores 16 kHz int16 PCM with its metadata and returns the index record."""
+        pcm = np.ascontiguousarray(pcm, dtype=np.int16)
+        with self._lock:
+            if self._segment_size(self.segment_id) >= self.segment_bytes:
+                self.segment_id += 1
+            path = self._segment_path(self.segment_id)
+            with open(path, "ab") as f:
+                offset = f.tell()
+                f.write(pcm.tobytes())
+            record = {
+                "id": uuid.uuid4().hex,
+                "timestamp": time.time(),
+                "segment": self.segment_id,
+                "offset": offset,
+                "samples": len(pcm),
+                "duration_s": len(pcm) / CAPTURE_SAMPLE_RATE,
+                **metadata,
+            }
+            with open(os.path.join(self.directory, INDEX_FILE), "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._enforce_retention()
+        return record
+
+    def _enforce_retention(self):
+        segments = self._segments()
+        total = sum(self._segment_size(s) for s in segments)
+        removed = set()
+        # Never delete the segment currently being written
+        while total > self.max_bytes and len(segments) > 1:
+            oldest = segments.pop(0)
+            total -= self._segment_size(oldest)
+            os.remove(self._segment_path(oldest))
+            removed.add(oldest)
+        if removed:
+            index_path = os.path.join(self.directory, INDEX_FILE)
+            records = [r for r in read_index(self.directory) if r["segment"] not in removed]
+            tmp_path = index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, index_path)
+
+
+def read_index(directory):
+    records = []
+    index_path = os.path.join(os.path.expanduser(directory), INDEX_FILE)
+    if not os.path.exists(index_path):
+        return records
+    with open(index_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+class CaptureReader:
+    """Reads a capture store through memory-mapped segments without loading them."""
+
+    def __init__(self, directory):
+        self.directory = os.path.expanduser(directory)
+        self.records = read_index(self.directory)
+        self._maps = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def audio(self, record):
+        """Returns the utterance's int16 samples as a view into the mapped segment."""
+        segment = record["segment"]
+        if segment not in self._maps:
+            path = os.path.join(self.directory, f"seg-{segment:06d}.pcm")
+            self._maps[segment] = np.memmap(path, dtype=np.int16, mode="r")
+        start = record["offset"] // 2
+        return self._maps[segment][start:start + record["samples"]]
+
+    def __iter__(self):
+        for record in self.records:
+            yield record, self.audio(record)
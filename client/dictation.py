@@ -0,0 +1,51 @@
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SegmentPipeline:
+    """Transcribes dictation segments concurrently and delivers results in order.
+
+    Results that finish while is_cancelled() is true are dropped instead of delivered,
+    so segments of a cancelled utterance aren't typed after the cancel.
+    """
+
+    def __init__(self, transcribe_fn, deliver_fn, max_workers=2, is_cancelled=None):
+        self.transcribe_fn = transcribe_fn
+        self.deliver_fn = deliver_fn
+        self.is_cancelled = is_cancelled or (lambda: False)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="asr-segment")
+        self.pending = queue.Queue()
+        self.delivery_thread = threading.Thread(target=self._deliver_loop, daemon=True)
+        self.delivery_thread.start()
+
+    def submit(self, audio_data, sample_rate):
+        future = self.executor.submit(self.transcribe_fn, audio_data, sample_rate)
+        self.pending.put(future)
+        return future
+
+    def _deliver_loop(self):
+        while True:
+            future = self.pending.get()
+            if future is None:
+                self.pending.task_done()
+                return
+            try:
+                text = future.result()
+                if text and self.is_cancelled():
+                    print("Dropping segment result of cancelled utterance")
+                elif text:
+                    self.deliver_fn(text)
+            except Exception as e:
+                print(f"Segment transcription failed: {e}")
+            finally:
+                self.pending.task_done()
+
+    def drain(self):
+        # Block until every submitted segment has been transcribed and delivered or dropped
+        self.pending.join()
+
+    def close(self):
+        self.pending.put(None)
+        self.delivery_thread.join(timeout=1)
+        self.executor.shutdown(wait=False)
@@ -15,9 +15,13 @@ import sounddevice as sd
 # Import the existing ASRClient logic
 try:
     from main import ASRClient, CONFIG, play_sound, save_config
+    from recorder_state import CAPTURE_STATES, RecorderState
+    from level_meter import LevelMeter
 except ImportError:
     sys.path.append(os.path.dirname(os.path.abspath(__file__)))
     from main import ASRClient, CONFIG, play_sound, save_config
+    from recorder_state import CAPTURE_STATES, RecorderState
+    from level_meter import LevelMeter
 
 # i18n helper
 def get_i18n(config):
@@ -171,10 +175,27 @@ class ASRGui(ctk.CTk):
 
         self.volume_label = ctk.CTkLabel(self.settings_frame, text=self.i18n.get("volume", "Volume:"))
         self.volume_label.grid(row=2, column=0, padx=10, pady=5, sticky="w")
-        self.volume_meter = ctk.CTkProgressBar(self.settings_frame)
-        self.volume_meter.grid(row=2, column=1, padx=10, pady=5, sticky="ew")
+        self.volume_frame = ctk.CTkFrame(self.settings_frame, fg_color="transparent")
+        self.volume_frame.grid(row=2, column=1, padx=10, pady=5, sticky="ew")
+        self.volume_frame.grid_columnconfigure(0, weight=1)
+        self.volume_meter = ctk.CTkProgressBar(self.volume_frame)
+        self.volume_meter.grid(row=0, column=0, sticky="ew")
         self.volume_meter.set(0)
 
+        # The audio thread only publishes levels; the meter is redrawn on a fixed-rate timer
+        self.level_meter = LevelMeter()
+        self.meter_count = 0
+        self.meter_last_update = 0.0
+        self.meter_interval_ms = max(1, int(1000 / self.config.get("gui_meter_fps", 30)))
+        self.waveform_canvas = None
+        if self.config.get("gui_waveform", False):
+            self.waveform_canvas = ctk.CTkCanvas(self.volume_frame, height=40, highlightthickness=0)
+            self.waveform_canvas.grid(row=1, column=0, pady=(5, 0), sticky="ew")
+            self.waveform_item = self.waveform_canvas.create_polygon(0, 0, 0, 0, outline="")
+            self.waveform_peaks = np.zeros(128, dtype=np.float32)
+            self.waveform_mode = None
+        self.after(self.meter_interval_ms, self.render_meter)
+
         ctk.CTkLabel(self.settings_frame, text=self.i18n.get("hotkey", "Hotkey:")).grid(row=3, column=0, padx=10, pady=5, sticky="w")
         
         self.hotkey_frame = ctk.CTkFrame(self.settings_frame, fg_color="transparent")
@@ -194,7 +215,7 @@ class ASRGui(ctk.CTk):
         self.record_button.grid(row=0, column=1, padx=0, pady=0)
 
         ctk.CTkLabel(self.settings_frame, text=self.i18n.get("asr_backend", "ASR Backend:")).grid(row=4, column=0, padx=10, pady=5, sticky="w")
-        self.backend_option = ctk.CTkOptionMenu(self.settings_frame, values=["glm", "sherpa-onnx/sense-voice", "whisper"], command=self.on_backend_change)
+        self.backend_option = ctk.CTkOptionMenu(self.settings_frame, values=["glm", "glm-onnx", "sherpa-onnx/sense-voice", "whisper", "sherpa-onnx/whisper"], command=self.on_backend_change)
         self.backend_option.grid(row=4, column=1, padx=10, pady=5, sticky="ew")
         
         current_backend = self.config.get("asr_backend", "glm")
@@ -207,6 +228,7 @@ class ASRGui(ctk.CTk):
         self.system_prompt_entry = ctk.CTkEntry(self.settings_frame)
         self.system_prompt_entry.grid(row=5, column=1, padx=10, pady=5, sticky="ew")
         self.system_prompt_entry.insert(0, self.config.get("glm", {}).get("system_prompt", ""))
+        self.system_prompt_entry.bind("<KeyRelease>", self.on_setting_changed)
 
         # SenseVoice specific settings
         self.sensevoice_frame = ctk.CTkFrame(self.settings_frame, fg_color="transparent")
@@ -217,14 +239,15 @@ class ASRGui(ctk.CTk):
         self.threads_entry = ctk.CTkEntry(self.sensevoice_frame)
         self.threads_entry.grid(row=0, column=1, padx=10, pady=5, sticky="ew")
         self.threads_entry.insert(0, str(self.config.get("sensevoice", {}).get("num_threads", 2)))
+        self.threads_entry.bind("<KeyRelease>", self.on_setting_changed)
 
         ctk.CTkLabel(self.sensevoice_frame, text=self.i18n.get("sensevoice_language", "SenseVoice Language:")).grid(row=1, column=0, padx=10, pady=5, sticky="w")
-        self.sv_lang_option = ctk.CTkOptionMenu(self.sensevoice_frame, values=["auto", "zh", "en", "ja", "ko", "yue"])
+        self.sv_lang_option = ctk.CTkOptionMenu(self.sensevoice_frame, values=["auto", "zh", "en", "ja", "ko", "yue"], command=self.on_setting_changed)
         self.sv_lang_option.grid(row=1, column=1, padx=10, pady=5, sticky="ew")
         self.sv_lang_option.set(self.config.get("sensevoice", {}).get("language", "auto"))
 
         ctk.CTkLabel(self.sensevoice_frame, text=self.i18n.get("provider", "Provider:")).grid(row=2, column=0, padx=10, pady=5, sticky="w")
-        self.provider_option = ctk.CTkOptionMenu(self.sensevoice_frame, values=["cpu", "cuda", "coreml"])
+        self.provider_option = ctk.CTkOptionMenu(self.sensevoice_frame, values=["cpu", "cuda", "coreml"], command=self.on_setting_changed)
         self.provider_option.grid(row=2, column=1, padx=10, pady=5, sticky="ew")
         self.provider_option.set(self.config.get("sensevoice", {}).get("provider", "cpu"))
         
@@ -234,24 +257,24 @@ class ASRGui(ctk.CTk):
         self.whisper_frame.grid_columnconfigure(1, weight=1)
 
         ctk.CTkLabel(self.whisper_frame, text=self.i18n.get("whisper_device", "Device:")).grid(row=0, column=0, padx=10, pady=5, sticky="w")
-        self.whisper_device_option = ctk.CTkOptionMenu(self.whisper_frame, values=["cuda", "cpu"])
+        self.whisper_device_option = ctk.CTkOptionMenu(self.whisper_frame, values=["cuda", "cpu"], command=self.on_setting_changed)
         self.whisper_device_option.grid(row=0, column=1, padx=10, pady=5, sticky="ew")
         self.whisper_device_option.set(self.config.get("whisper", {}).get("device", "cuda"))
 
         ctk.CTkLabel(self.whisper_frame, text=self.i18n.get("whisper_language", "Language:")).grid(row=1, column=0, padx=10, pady=5, sticky="w")
-        self.whisper_lang_option = ctk.CTkOptionMenu(self.whisper_frame, values=["auto", "en", "zh", "ja", "ko", "yue"])
+        self.whisper_lang_option = ctk.CTkOptionMenu(self.whisper_frame, values=["auto", "en", "zh", "ja", "ko", "yue"], command=self.on_setting_changed)
         self.whisper_lang_option.grid(row=1, column=1, padx=10, pady=5, sticky="ew")
         self.whisper_lang_option.set(self.config.get("whisper", {}).get("language", "auto"))
 
         ctk.CTkLabel(self.whisper_frame, text=self.i18n.get("whisper_task", "Task:")).grid(row=2, column=0, padx=10, pady=5, sticky="w")
-        self.whisper_task_option = ctk.CTkOptionMenu(self.whisper_frame, values=["transcribe", "translate"])
+        self.whisper_task_option = ctk.CTkOptionMenu(self.whisper_frame, values=["transcribe", "translate"], command=self.on_setting_changed)
         self.whisper_task_option.grid(row=2, column=1, padx=10, pady=5, sticky="ew")
         self.whisper_task_option.set(self.config.get("whisper", {}).get("task", "transcribe"))
 
-        if self.backend_option.get() == "glm":
+        if self.backend_option.get() in ("glm", "glm-onnx"):
             self.sensevoice_frame.grid_remove()
             self.whisper_frame.grid_remove()
-        elif self.backend_option.get() == "whisper":
+        elif self.backend_option.get() in ("whisper", "sherpa-onnx/whisper"):
             self.system_prompt_label.grid_remove()
             self.system_prompt_entry.grid_remove()
             self.sensevoice_frame.grid_remove()
@@ -263,7 +286,7 @@ class ASRGui(ctk.CTk):
             self.whisper_frame.grid_remove()
 
         self.disable_log_var = ctk.BooleanVar(value=self.config.get("disable_log", False))
-        self.disable_log_checkbox = ctk.CTkCheckBox(self.settings_frame, text=self.i18n.get("disable_log", "Disable Transcribe Log"), variable=self.disable_log_var)
+        self.disable_log_checkbox = ctk.CTkCheckBox(self.settings_frame, text=self.i18n.get("disable_log", "Disable Transcribe Log"), variable=self.disable_log_var, command=self.on_setting_changed)
         self.disable_log_checkbox.grid(row=6, column=0, padx=10, pady=5, sticky="w")
 
         self.opencc_frame = ctk.CTkFrame(self.settings_frame, fg_color="transparent")
@@ -277,7 +300,7 @@ class ASRGui(ctk.CTk):
             self.i18n.get("opencc_s2t", "Simplified to Traditional"): "s2t",
             self.i18n.get("opencc_t2s", "Traditional to Simplified"): "t2s"
         }
-        self.opencc_option = ctk.CTkOptionMenu(self.opencc_frame, values=list(self.opencc_map.keys()))
+        self.opencc_option = ctk.CTkOptionMenu(self.opencc_frame, values=list(self.opencc_map.keys()), command=self.on_setting_changed)
         self.opencc_option.grid(row=0, column=1, padx=0, pady=0, sticky="ew")
         
         current_opencc = self.config.get("opencc_convert")
@@ -310,12 +333,12 @@ class ASRGui(ctk.CTk):
             self.whisper_frame.grid_remove()
             return
 
-        if backend == "glm":
+        if backend in ("glm", "glm-onnx"):
             self.system_prompt_label.grid()
             self.system_prompt_entry.grid()
             self.sensevoice_frame.grid_remove()
             self.whisper_frame.grid_remove()
-        elif backend == "whisper":
+        elif backend in ("whisper", "sherpa-onnx/whisper"):
             self.system_prompt_label.grid_remove()
             self.system_prompt_entry.grid_remove()
             self.sensevoice_frame.grid_remove()
@@ -333,7 +356,7 @@ class ASRGui(ctk.CTk):
             # Disable/Enable settings based on running state
             is_running = new_state != AppState.DISCONNECTED and new_state != AppState.ERROR
             
-            # Disallow changing settings when running
+            # Settings the model or audio pipeline was started with need a restart
             state = "disabled" if is_running else "normal"
             
             self.url_checkbox.configure(state="disabled" if is_running else "normal")
@@ -347,17 +370,15 @@ class ASRGui(ctk.CTk):
             self.record_button.configure(state="disabled" if is_running else "normal")
             self.backend_option.configure(state="disabled" if is_running else "normal")
             
-            # These settings can be changed while running
-            self.system_prompt_entry.configure(state=state)
             self.threads_entry.configure(state=state)
-            self.sv_lang_option.configure(state=state)
             self.provider_option.configure(state=state)
             self.whisper_device_option.configure(state=state)
-            self.whisper_lang_option.configure(state=state)
-            self.whisper_task_option.configure(state=state)
-            self.opencc_option.configure(state=state)
-            self.disable_log_checkbox.configure(state=state)
-            self.save_button.configure(state=state)
+
+            # Sent with every request or applied to its result, so they stay editable
+            # and on_setting_changed() pushes them to the running client
+            for widget in (self.system_prompt_entry, self.sv_lang_option, self.whisper_lang_option,
+                           self.whisper_task_option, self.opencc_option, self.disable_log_checkbox, self.save_button):
+                widget.configure(state="normal")
 
             if new_state == AppState.DISCONNECTED:
                 self.update_status(self.i18n.get("status_disconnected", "Disconnected").replace(self.i18n.get("status_prefix", "Status: "), ""))
@@ -451,10 +472,53 @@ class ASRGui(ctk.CTk):
             self.volume_monitor_lock.release()
 
     def update_volume_meter(self, indata):
-        volume_norm = np.linalg.norm(indata) * 10
-        # Scale to 0-1 for progress bar
-        level = min(1.0, volume_norm / 100)
-        self.after(0, lambda: self.volume_meter.set(level))
+        # Called from the audio thread: no Tk calls here
+        self.level_meter.publish(indata)
+
+    def render_meter(self):
+        try:
+            count, level, peaks = self.level_meter.read(self.meter_count)
+            now = time.monotonic()
+            if count != self.meter_count:
+                self.meter_count = count
+                self.meter_last_update = now
+                self.volume_meter.set(level)
+                if self.waveform_canvas is not None:
+                    self.draw_waveform(peaks)
+            elif self.meter_last_update and now - self.meter_last_update > 0.2:
+                # The stream stopped delivering audio: drop the meter instead of freezing it
+                self.meter_last_update = 0.0
+                self.volume_meter.set(0)
+                if self.waveform_canvas is not None:
+                    self.draw_waveform(np.zeros(len(self.waveform_peaks), dtype=np.float32))
+            self.after(self.meter_interval_ms, self.render_meter)
+        except tk.TclError:
+            # Window destroyed
+            pass
+
+    def draw_waveform(self, peaks):
+        canvas = self.waveform_canvas
+        mode = ctk.get_appearance_mode()
+        if mode != self.waveform_mode:
+            self.waveform_mode = mode
+            canvas.configure(bg=self.volume_frame._apply_appearance_mode(ctk.ThemeManager.theme["CTkFrame"]["fg_color"]))
+            canvas.itemconfigure(self.waveform_item, fill=self.volume_frame._apply_appearance_mode(ctk.ThemeManager.theme["CTkProgressBar"]["progress_color"]))
+
+        n = len(self.waveform_peaks)
+        peaks = peaks[-n:]
+        self.waveform_peaks = np.concatenate((self.waveform_peaks[len(peaks):], peaks))
+        width = max(canvas.winfo_width(), 1)
+        mid = max(canvas.winfo_height(), 1) / 2
+        xs = np.linspace(0, width, n)
+        top = mid - self.waveform_peaks * mid
+        bottom = (mid + self.waveform_peaks * mid)[::-1]
+        # Upper edge left to right, then the mirrored lower edge back, as one polygon
+        coords = np.empty(4 * n, dtype=np.float32)
+        coords[0:2 * n:2] = xs
+        coords[1:2 * n:2] = top
+        coords[2 * n::2] = xs[::-1]
+        coords[2 * n + 1::2] = bottom
+        canvas.coords(self.waveform_item, *coords.tolist())
 
     def find_default_device_index(self, name_substrings):
         devices = sd.query_devices()
@@ -573,10 +637,26 @@ class ASRGui(ctk.CTk):
         if self.disable_log_var.get() and "Config saved" not in text:
             return
         self.textbox.configure(state="normal")
+        self.clear_partial_line()
         self.textbox.insert("end", f"> {text}\n")
         self.textbox.see("end")
         self.textbox.configure(state="disabled")
 
+    def show_partial(self, text):
+        # The line of a streaming result is replaced as it grows and removed by the final result
+        if self.disable_log_var.get():
+            return
+        self.textbox.configure(state="normal")
+        self.clear_partial_line()
+        self.textbox.insert("end", f"… {text}\n", "partial")
+        self.textbox.see("end")
+        self.textbox.configure(state="disabled")
+
+    def clear_partial_line(self):
+        ranges = self.textbox.tag_ranges("partial")
+        if ranges:
+            self.textbox.delete(ranges[0], ranges[-1])
+
     def clear_log(self):
         self.textbox.configure(state="normal")
         self.textbox.delete("0.0", "end")
@@ -628,16 +708,15 @@ class ASRGui(ctk.CTk):
     def get_current_ui_settings(self):
         """Returns a dictionary of current settings from UI without modifying global CONFIG."""
         backend = self.backend_option.get()
-        print(backend)
         settings = {
             "asr_backend": backend,
             "disable_log": self.disable_log_var.get(),
             "opencc_convert": self.opencc_map.get(self.opencc_option.get())
         }
         
-        if backend == "glm":
-            settings["glm"] = {"system_prompt": self.system_prompt_entry.get()}
-        elif backend == "whisper":
+        if backend in ("glm", "glm-onnx"):
+            settings[backend] = {"system_prompt": self.system_prompt_entry.get()}
+        elif backend in ("whisper", "sherpa-onnx/whisper"):
             settings["whisper"] = {
                 "device": self.whisper_device_option.get(),
                 "language": self.whisper_lang_option.get(),
@@ -703,6 +782,8 @@ class ASRGui(ctk.CTk):
         if "glm" not in self.config:
             self.config["glm"] = {}
         self.config["glm"]["system_prompt"] = self.system_prompt_entry.get()
+        if backend == "glm-onnx":
+            self.config.setdefault("glm-onnx", {})["system_prompt"] = self.system_prompt_entry.get()
 
         if "sensevoice" not in self.config:
             self.config["sensevoice"] = {}
@@ -730,50 +811,17 @@ class ASRGui(ctk.CTk):
             # Override device from UI
             try:
                 dev_info = sd.query_devices(device_id)
-                self.client.input_device = device_id
-                self.client.input_sample_rate = int(dev_info['default_samplerate'])
-                self.client.input_channels = dev_info['max_input_channels']
+                self.client.set_input_device(device_id, int(dev_info['default_samplerate']), dev_info['max_input_channels'])
             except Exception as e:
                 self.transition_to(AppState.ERROR, self.i18n.get("invalid_device_error", "Invalid device - {e}").format(e=e))
                 self.after(0, self.stop_client)
                 return
 
-            # Monkey patch the client to update UI
-            original_send_to_asr = self.client.send_to_asr
-            def patched_send_to_asr(audio_data, sample_rate):
-                self.transition_to(AppState.PROCESSING)
-                
-                # Get current UI settings to "try" them without saving to file
-                ui_settings = self.get_current_ui_settings()
-                
-                # Update self.config for the duration of this request
-                # ASRClient uses self.config
-                # Deep update to avoid losing settings not in UI (e.g. model_dir)
-                for k, v in ui_settings.items():
-                    if isinstance(v, dict) and k in self.config and isinstance(self.config[k], dict):
-                        self.config[k].update(v)
-                    else:
-                        self.config[k] = v
-                
-                try:
-                    res = original_send_to_asr(audio_data, sample_rate)
-                finally:
-                    pass
-
-                if res:
-                    self.after(0, lambda r=res: self.log_transcription(r))
-                self.transition_to(AppState.LISTENING)
-                return res
-            
-            self.client.send_to_asr = patched_send_to_asr
-
-            # Patch audio_callback to update volume meter
-            original_audio_callback = self.client.audio_callback
-            def patched_audio_callback(indata, frames, time_info, status):
-                self.update_volume_meter(indata)
-                original_audio_callback(indata, frames, time_info, status)
-            
-            self.client.audio_callback = patched_audio_callback
+            # Only publishing to the level meter and scheduling Tk updates happens in these callbacks
+            self.client.on("state_changed", self.on_client_state_changed)
+            self.client.on("level", self.update_volume_meter)
+            self.client.on("result", lambda text: self.after(0, lambda: self.log_transcription(text)))
+            self.client.on("partial", lambda text: self.after(0, lambda: self.show_partial(text)))
 
             # Stop the standalone volume monitor before starting ASR stream
             self.stop_volume_monitor()
@@ -795,7 +843,7 @@ class ASRGui(ctk.CTk):
             while self.is_running and self.client and not self.client.stop_event.is_set():
                 if self.client.check_server_ready():
                     break
-                time.sleep(1)
+                self.client.stop_event.wait(1)
             
             if not self.is_running or not self.client or self.client.stop_event.is_set():
                 return
@@ -805,38 +853,47 @@ class ASRGui(ctk.CTk):
             # Start audio input stream management
             CHUNK_SIZE = int(self.client.input_sample_rate * 32 / 1000)
             
-            while self.is_running and self.client and not self.client.stop_event.is_set():
-                # Check if recording is active to update UI status and manage stream
-                is_active = self.client.is_recording_dict.get("active") or self.client.is_recording_dict.get("internal_active")
-                
-                if is_active:
-                    if self.app_state != AppState.RECORDING:
-                        self.transition_to(AppState.RECORDING)
-                    
-                    # Open stream only when active
-                    try:
-                        print("GUI: Opening InputStream...")
-                        with sd.InputStream(device=self.client.input_device, 
-                                          samplerate=self.client.input_sample_rate, 
-                                          channels=self.client.input_channels, 
-                                          callback=self.client.audio_callback, 
-                                          blocksize=CHUNK_SIZE):
-                            while self.is_running and self.client and not self.client.stop_event.is_set() and \
-                                  (self.client.is_recording_dict.get("active") or self.client.is_recording_dict.get("internal_active")):
-                                time.sleep(0.1)
-                        print("GUI: InputStream closed.")
-                    except Exception as e:
-                        print(f"GUI: Audio Error: {e}")
-                        self.transition_to(AppState.ERROR, self.i18n.get("audio_error", "Audio Error: {e}").format(e=e))
-                        break
-                else:
-                    if self.is_running and self.app_state == AppState.RECORDING:
-                        self.transition_to(AppState.LISTENING)
-                    time.sleep(0.1)
+            client = self.client
+            while self.is_running and not client.stop_event.is_set():
+                # Block until a hotkey press starts a cycle; stop_client closes the state machine
+                if not client.state.wait_for_state(CAPTURE_STATES):
+                    break
+
+                # Open stream only when active
+                try:
+                    print("GUI: Opening InputStream...")
+                    with sd.InputStream(device=client.input_device, 
+                                      samplerate=client.input_sample_rate, 
+                                      channels=client.input_channels, 
+                                      callback=client.audio_callback, 
+                                      blocksize=CHUNK_SIZE):
+                        client.state.wait_for(lambda m: m.state not in CAPTURE_STATES)
+                    print("GUI: InputStream closed.")
+                except Exception as e:
+                    print(f"GUI: Audio Error: {e}")
+                    self.transition_to(AppState.ERROR, self.i18n.get("audio_error", "Audio Error: {e}").format(e=e))
+                    break
         except Exception as e:
             print(f"Client error: {e}")
             self.transition_to(AppState.ERROR, str(e))
 
+    def on_client_state_changed(self, old_state, new_state):
+        # Recorder states only drive the UI once the client is up and listening
+        if self.app_state not in (AppState.LISTENING, AppState.RECORDING, AppState.PROCESSING):
+            return
+        if new_state in CAPTURE_STATES:
+            self.transition_to(AppState.RECORDING)
+        elif new_state == RecorderState.PROCESSING:
+            self.transition_to(AppState.PROCESSING)
+        else:
+            self.transition_to(AppState.LISTENING)
+
+    def on_setting_changed(self, *_):
+        # Settings editable while running are pushed to the client as a new snapshot
+        if self.client:
+            self.update_config_from_ui()
+            self.client.update_config(self.config)
+
     def stop_client(self):
         if self.client:
             self.client.stop()
@@ -0,0 +1,96 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from server_pool import PoolMember, ServerError, RequestCancelledError
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server")
+
+
+class InProcessBackend(PoolMember):
+    """Runs an ASRBackend inside the client, skipping WAV encoding and HTTP.
+
+    The model is loaded and run on one dedicated worker thread, like the server's
+    single dispatch thread, and receives the float32 frames directly. Silence is
+    trimmed with the server's trim settings before inference.
+    """
+
+    def __init__(self, backend_type, config, priority=0):
+        super().__init__(f"in-process:{backend_type}", backend_type, priority)
+        self.backend_type = backend_type
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="asr-inprocess")
+        self.loaded = threading.Event()
+        self.load_error = None
+        self.tokens = {}
+        self.tokens_lock = threading.Lock()
+        self.trim_settings = None
+        self.worker.submit(self._load, config)
+
+    def _load(self, config):
+        # Backends import their modules relative to the server directory
+        if SERVER_DIR not in sys.path:
+            sys.path.insert(0, SERVER_DIR)
+        try:
+            from backends import create_backend
+            from audio import trim_silence, trim_settings
+            self.trim_silence = trim_silence
+            self.trim_settings = trim_settings(config.get("server", {}))
+            print(f"Loading {self.backend_type} backend in-process...")
+            self.backend = create_backend(self.backend_type, config=config)
+        except Exception as e:
+            self.load_error = e
+            print(f"Failed to load in-process backend {self.backend_type}: {e}")
+        finally:
+            self.loaded.set()
+
+    def probe(self):
+        return self.loaded.is_set() and self.load_error is None
+
+    def transcribe(self, audio_data, sample_rate, settings, request_id, timeout, on_partial=None):
+        if not self.loaded.wait(timeout):
+            raise ServerError(f"{self.name} is still loading")
+        if self.load_error is not None:
+            raise ServerError(f"{self.name} failed to load: {self.load_error}")
+        from cancellation import CancellationToken
+
+        if self.trim_settings is not None:
+            bounds = self.trim_silence(audio_data, sample_rate, **self.trim_settings)
+            if bounds is None:
+                print("No speech in audio, skipping inference")
+                return ""
+            audio_data = audio_data[bounds[0]:bounds[1]]
+
+        token = CancellationToken(request_id, timeout)
+        with self.tokens_lock:
+            self.tokens[request_id] = token
+        kwargs = {k: v for k, v in settings.items() if k not in ("system_prompt", "extra_replace") and v is not None}
+
+        def run():
+            token.raise_if_cancelled()
+            if on_partial is None:
+                return self.backend.transcribe(audio_data, sample_rate, system_prompt=settings.get("system_prompt"), cancel_token=token, **kwargs)
+            text = ""
+            for piece in self.backend.transcribe_stream(audio_data, sample_rate, system_prompt=settings.get("system_prompt"), cancel_token=token, **kwargs):
+                text += piece
+                on_partial(text)
+            return text
+
+        try:
+            text = self.worker.submit(run).result()
+        except Exception as e:
+            if token.is_cancelled():
+                raise RequestCancelledError(f"request {request_id} was cancelled") from e
+            raise
+        finally:
+            with self.tokens_lock:
+                self.tokens.pop(request_id, None)
+        if token.is_cancelled():
+            raise RequestCancelledError(f"request {request_id} was cancelled")
+        return text
+
+    def cancel(self, request_id):
+        with self.tokens_lock:
+            token = self.tokens.get(request_id)
+        if token is not None:
+            token.cancel("cancelled by client")
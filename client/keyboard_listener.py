@@ -1,51 +1,167 @@
 import socket
 import os
-import keyboard
 import sys
 import time
+import glob
+import fcntl
+import select
+import struct
 import argparse
 
 SOCKET_PATH = "/tmp/glm_asr_keyboard.sock"
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--hotkey", type=str, default="f12")
-    args = parser.parse_args()
-    hotkey = args.hotkey
+# Datagram frame sent to the client: event type and key press time (ns, CLOCK_REALTIME)
+EVENT_FORMAT = "<BQ"
+EVENT_SIZE = struct.calcsize(EVENT_FORMAT)
+EVENT_UP = 0
+EVENT_DOWN = 1
 
-    if os.geteuid() != 0:
-        print("Keyboard listener must be run as root (sudo).")
-        sys.exit(1)
+# struct input_event: struct timeval, __u16 type, __u16 code, __s32 value
+INPUT_EVENT_FORMAT = "llHHi"
+INPUT_EVENT_SIZE = struct.calcsize(INPUT_EVENT_FORMAT)
+EV_KEY = 0x01
+KEY_MAX = 0x2ff
 
-    print(f"Keyboard listener started. Listening for {hotkey}...")
+# Linux input-event-codes for the keys the GUI offers plus letters and digits
+KEY_CODES = {
+    "esc": 1, "backspace": 14, "tab": 15, "enter": 28, "ctrl": 29, "shift": 42,
+    "right shift": 54, "alt": 56, "space": 57, "caps lock": 58, "num lock": 69,
+    "scroll lock": 70, "right ctrl": 97, "right alt": 100, "home": 102, "up": 103,
+    "page up": 104, "left": 105, "right": 106, "end": 107, "down": 108,
+    "page down": 109, "insert": 110, "delete": 111, "pause": 119, "menu": 139,
+    "print screen": 99,
+    "f1": 59, "f2": 60, "f3": 61, "f4": 62, "f5": 63, "f6": 64, "f7": 65,
+    "f8": 66, "f9": 67, "f10": 68, "f11": 87, "f12": 88,
+    "f13": 183, "f14": 184, "f15": 185, "f16": 186, "f17": 187, "f18": 188,
+    "f19": 189, "f20": 190, "f21": 191, "f22": 192, "f23": 193, "f24": 194,
+}
+for _i, _c in enumerate("1234567890"):
+    KEY_CODES[_c] = 2 + _i
+for _row, _start in (("qwertyuiop", 16), ("asdfghjkl", 30), ("zxcvbnm", 44)):
+    for _i, _c in enumerate(_row):
+        KEY_CODES[_c] = _start + _i
+
+
+def eviocgbit(event_type, length):
+    # _IOC(_IOC_READ, 'E', 0x20 + event_type, length)
+    return (2 << 30) | (length << 16) | (ord("E") << 8) | (0x20 + event_type)
 
-    def send_event(event_type):
+
+def device_has_key(fd, code):
+    length = KEY_MAX // 8 + 1
+    try:
+        bits = fcntl.ioctl(fd, eviocgbit(EV_KEY, length), bytes(length))
+    except OSError:
+        return False
+    return bool(bits[code // 8] & (1 << (code % 8)))
+
+
+def open_keyboards(code, opened):
+    """Opens every input device that can produce the key code and isn't open yet."""
+    for path in sorted(glob.glob("/dev/input/event*")):
+        if path in opened.values():
+            continue
         try:
-            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
-                s.connect(SOCKET_PATH)
-                s.sendall(event_type.encode())
-        except Exception:
+            fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        except OSError:
+            continue
+        if device_has_key(fd, code):
+            opened[fd] = path
+        else:
+            os.close(fd)
+    return opened
+
+
+class EventSender:
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    def send(self, event_type, timestamp_ns):
+        try:
+            self.sock.sendto(struct.pack(EVENT_FORMAT, event_type, timestamp_ns), self.socket_path)
+        except OSError:
             # Silently fail if main.py is not listening yet
             pass
 
+
+def run_evdev(code, sender):
+    devices = open_keyboards(code, {})
+    if not devices:
+        return False
+    print(f"Reading {len(devices)} input device(s) directly: {', '.join(devices.values())}")
+    pressed = False
+    while True:
+        readable, _, _ = select.select(list(devices), [], [], 5.0)
+        if not readable:
+            # Pick up keyboards plugged in since the last scan
+            open_keyboards(code, devices)
+            continue
+        for fd in readable:
+            try:
+                data = os.read(fd, INPUT_EVENT_SIZE * 64)
+            except OSError:
+                # Device unplugged
+                os.close(fd)
+                del devices[fd]
+                continue
+            for offset in range(0, len(data) - INPUT_EVENT_SIZE + 1, INPUT_EVENT_SIZE):
+                sec, usec, ev_type, ev_code, value = struct.unpack_from(INPUT_EVENT_FORMAT, data, offset)
+                if ev_type != EV_KEY or ev_code != code:
+                    continue
+                timestamp_ns = sec * 1_000_000_000 + usec * 1000
+                # value 2 is autorepeat while held, which must not toggle recording again
+                if value == 1 and not pressed:
+                    pressed = True
+                    sender.send(EVENT_DOWN, timestamp_ns)
+                elif value == 0 and pressed:
+                    pressed = False
+                    sender.send(EVENT_UP, timestamp_ns)
+
+
+def run_keyboard_library(hotkey, sender):
+    import keyboard
+
     def on_hotkey(e):
         if e.event_type == keyboard.KEY_DOWN:
-            send_event("DOWN")
+            sender.send(EVENT_DOWN, time.time_ns())
         elif e.event_type == keyboard.KEY_UP:
-            send_event("UP")
+            sender.send(EVENT_UP, time.time_ns())
 
     keyboard.hook_key(hotkey, on_hotkey)
-    
     try:
         while True:
             time.sleep(1)
-    except (KeyboardInterrupt, EOFError, OSError):
-        pass
     finally:
         try:
             keyboard.unhook_all()
         except:
             pass
 
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hotkey", type=str, default="f12")
+    parser.add_argument("--socket", type=str, default=SOCKET_PATH)
+    args = parser.parse_args()
+    hotkey = args.hotkey
+
+    if os.geteuid() != 0:
+        print("Keyboard listener must be run as root (sudo).")
+        sys.exit(1)
+
+    print(f"Keyboard listener started. Listening for {hotkey}...")
+    sender = EventSender(args.socket)
+
+    try:
+        code = KEY_CODES.get(hotkey.lower())
+        if code is None or not run_evdev(code, sender):
+            # Key names evdev can't map, or no readable devices: fall back to the keyboard library
+            print("Falling back to the keyboard library")
+            run_keyboard_library(hotkey, sender)
+    except (KeyboardInterrupt, EOFError, OSError):
+        pass
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,39 @@
+import numpy as np
+
+
+class LevelMeter:
+    """Single-producer, single-consumer ring of per-block audio levels.
+
+    The audio callback publishes one level and one peak per block; the GUI reads
+    whatever arrived since its last frame on its own timer. Only the producer
+    writes the ring and count, and a torn read at worst shows one stale column,
+    so neither side takes a lock or schedules Tk callbacks from the audio thread.
+    """
+
+    def __init__(self, history=256):
+        self.history = history
+        self.levels = np.zeros(history, dtype=np.float32)
+        self.peaks = np.zeros(history, dtype=np.float32)
+        # Total blocks published; the newest entry is at (count - 1) % history
+        self.count = 0
+
+    def publish(self, indata):
+        samples = np.asarray(indata, dtype=np.float32).reshape(-1)
+        # Same scale as the original progress bar: norm * 10 / 100
+        level = min(1.0, float(np.linalg.norm(samples)) / 10)
+        peak = float(np.abs(samples).max()) if samples.size else 0.0
+        i = self.count % self.history
+        self.levels[i] = level
+        self.peaks[i] = min(1.0, peak)
+        self.count += 1
+
+    def read(self, since):
+        """Returns (count, level, peaks) with the peaks published after `since`, oldest first."""
+        count = self.count
+        if count == 0:
+            return count, 0.0, np.zeros(0, dtype=np.float32)
+        new = min(count - since, self.history)
+        indices = np.arange(count - new, count) % self.history
+        # The level shown is the loudest block since the last frame, so short peaks aren't missed
+        level = float(self.levels[indices].max()) if new > 0 else float(self.levels[(count - 1) % self.history])
+        return count, level, self.peaks[indices].copy()
@@ -5,19 +5,27 @@ import threading
 import queue
 import numpy as np
 import sounddevice as sd
-import torch
-import torchaudio
-from silero_vad import load_silero_vad
-import pyperclip
 import socket
 import subprocess
 import atexit
-import io
-import wave
-import requests
 import argparse
 import json
-import opencc
+import uuid
+import copy
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dictation import SegmentPipeline
+from postprocess import backend_config_key, postprocess_text
+from capture_store import CaptureStore, to_capture_pcm
+from keyboard_listener import EVENT_FORMAT, EVENT_SIZE, EVENT_DOWN
+from recorder_state import RecorderState, RecorderStateMachine, CAPTURE_STATES
+from text_output import TextOutput, ProgressiveTyper, uinput_keys
+from audio_frontend import AudioFrontend, FRONTEND_SAMPLE_RATE, negotiate_input_format
+from vad import SileroVAD, EnergyGate, CascadeVAD
+from server_pool import ServerPool, HttpServer, RequestCancelledError
+from inprocess import InProcessBackend
+from shm_transport import UnixSocketServer, UNIX_URL_PREFIX
 
 def load_config():
     config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
@@ -35,6 +43,8 @@ def load_config():
     }
 
 CONFIG = load_config()
+LOCAL_SERVER_URL = "http://localhost:8000"
+LOCAL_UNIX_SOCKET = "/tmp/wtako_asr.sock"
 
 def save_config(config):
     config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
@@ -63,40 +73,80 @@ def set_mute(mute=True):
         print(f"Error setting mute: {e}")
 
 class ASRClient:
+    # Observer events and their callback arguments:
+    #   state_changed(old_state, new_state)  RecorderState values
+    #   level(block)                         mono float32 audio block, from the recording thread
+    #   utterance_started()                  VAD detected the start of speech
+    #   utterance_finished(duration_s, cancelled)
+    #   result(text)                         final text, before it is typed
+    #   timing(name, seconds)                "hotkey", "asr_request" and "text_output" spans
+    EVENTS = ("state_changed", "level", "utterance_started", "utterance_finished", "partial", "result", "timing")
+
     def __init__(self, config=None):
-        self.config = config if config is not None else CONFIG
+        self.listeners = {event: [] for event in self.EVENTS}
+        self.update_config(config if config is not None else CONFIG)
         
-        # Determine ASR server URL from config
-        if self.config.get("use_local_server"):
-            self.asr_server_url = "http://localhost:8000"
-        else:
-            self.asr_server_url = self.config.get("default_asr_server", "http://localhost:8000")
-            
-        print(f"Using ASR server: {self.asr_server_url}")
+        self.pool = self.build_server_pool()
+        for member in self.pool.ranked(0):
+            print(f"Using ASR server: {member.name} (backend {member.backend}, priority {member.priority})")
         
         print("Loading Silero VAD model...")
-        self.vad_model = load_silero_vad()
+        self.vad_model = SileroVAD(self.config.get("vad_model_path"))
+        if self.config.get("vad_gate", True):
+            # Frames the energy gate rules out as silence never reach Silero
+            shadow_model = SileroVAD(self.config.get("vad_model_path")) if self.config.get("vad_shadow", False) else None
+            gate = EnergyGate(margin_db=self.config.get("vad_gate_margin_db", 6.0))
+            self.vad_model = CascadeVAD(self.vad_model, gate, shadow_model)
         
         self.uinput_device = self.setup_uinput()
-        self.is_recording_dict = {"active": False, "internal_active": False, "cancel": False}
+        self.text_output = TextOutput(self.uinput_device, self.config.get("text_output", {}))
+        self.state = RecorderStateMachine()
+        self.state.add_listener(lambda old, new: self.emit("state_changed", old, new))
         self.stop_event = threading.Event()
         self.audio_queue = queue.Queue()
+        self.speculation_stats = {"hits": 0, "misses": 0, "saved_s": 0.0}
+        self.hotkey_delays = deque(maxlen=100)
+
+        # Opt-in store of every utterance with its result, for replaying real traffic
+        self.capture_store = None
+        capture_config = self.config.get("capture", {})
+        if capture_config.get("enabled"):
+            capture_dir = capture_config.get("dir", "~/.local/share/wtako-asr-ime/captures")
+            self.capture_store = CaptureStore(capture_dir, max_bytes=int(capture_config.get("max_mb", 2048) * 1024 ** 2))
+            self.capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="asr-capture")
+            print(f"Capturing utterances to {capture_dir}")
         
-        self.input_device, self.input_sample_rate, self.input_channels = self.find_device(self.config.get("audio_devices", []))
-        if self.input_device is None:
+        input_device, input_sample_rate, input_channels = self.find_device(self.config.get("audio_devices", []))
+        if input_device is None:
             print("Warning: Could not find suitable input device. Using default.")
-            self.input_device = None
-            self.input_sample_rate = 48000
-            self.input_channels = 1
-        else:
-            print(f"Using device {self.input_device}: {sd.query_devices(self.input_device)['name']} at {self.input_sample_rate}Hz, {self.input_channels} channels")
+        self.set_input_device(input_device, input_sample_rate, input_channels)
+
+    def set_input_device(self, device, default_rate, default_channels):
+        self.input_device = device
+        self.input_sample_rate, self.input_channels = negotiate_input_format(device, default_rate, default_channels)
+        name = sd.query_devices(device, "input")['name']
+        print(f"Using device {device}: {name} at {self.input_sample_rate}Hz, {self.input_channels} channels")
+
+    def update_config(self, config):
+        """Swaps in a snapshot of config. The snapshot is never mutated, so a request
+        that already read self.config keeps consistent settings until it finishes."""
+        self.config = copy.deepcopy(config)
+
+    def on(self, event, callback):
+        if event not in self.listeners:
+            raise ValueError(f"Unknown ASRClient event: {event}")
+        self.listeners[event].append(callback)
+
+    def emit(self, event, *args):
+        for callback in self.listeners[event]:
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Error in {event} listener: {e}")
 
     def setup_uinput(self):
         import uinput
-        return uinput.Device([
-            uinput.KEY_LEFTCTRL,
-            uinput.KEY_V,
-        ])
+        return uinput.Device(uinput_keys())
 
     def find_device(self, name_substrings):
         devices = sd.query_devices()
@@ -110,116 +160,220 @@ class ASRClient:
     def wayland_type(self, text):
         if not text: return
         print(f"Typing: {text}")
-        import uinput
-        old_clipboard = ""
-        try:
-            old_clipboard = pyperclip.paste()
-        except: pass
-        pyperclip.copy(text)
-        time.sleep(0.1)
-        self.uinput_device.emit_combo([uinput.KEY_LEFTCTRL, uinput.KEY_V])
-        time.sleep(0.2)
-        if old_clipboard:
-            try: pyperclip.copy(old_clipboard)
-            except: pass
+        start_time = time.perf_counter()
+        if self.text_output.type_text(text):
+            self.emit("timing", "text_output", time.perf_counter() - start_time)
 
-    def check_server_ready(self):
-        try:
-            # Simple GET request to check if server is up
-            response = requests.get(self.asr_server_url, timeout=1)
-            # Even if it returns 405 (Method Not Allowed) for GET, it means the server is listening
-            return True
-        except:
-            return False
-
-    def send_to_asr(self, audio_data, sample_rate):
-        # Get system prompt from config
+    def build_server_pool(self):
+        """Builds the server pool from asr_servers, plus the local server when it is enabled.
+
+        Without asr_servers the pool holds just the local server or default_asr_server.
+        """
+        client_id = self.config.get("client_id") or socket.gethostname()
         backend = self.config.get("asr_backend", "glm")
-        if backend == "sherpa-onnx/sense-voice":
-            backend = "sensevoice"
-        
-        # Convert to WAV in memory
-        with io.BytesIO() as bio:
-            with wave.open(bio, 'wb') as wav_file:
-                wav_file.setnchannels(1)
-                wav_file.setsampwidth(2) # 16-bit
-                wav_file.setframerate(sample_rate)
-                # Convert float32 to int16
-                audio_int16 = (audio_data * 32767).astype(np.int16)
-                wav_file.writeframes(audio_int16.tobytes())
-            
-            wav_data = bio.getvalue()
-        
+        members = [
+            self.create_server(server["url"], server.get("backend", backend), server.get("priority", 0), client_id)
+            for server in self.config.get("asr_servers", [])
+        ]
+        if self.config.get("use_local_server"):
+            local_priority = self.config.get("local_server_priority", 100)
+            local_mode = self.config.get("local_backend_mode", "server")
+            local_url = LOCAL_SERVER_URL
+            if local_mode == "unix":
+                local_url = UNIX_URL_PREFIX + self.config.get("local_unix_socket", LOCAL_UNIX_SOCKET)
+            if local_mode == "inprocess":
+                # The model runs in this process and gets the float32 buffer without WAV or HTTP
+                members.append(InProcessBackend(backend, self.config, local_priority))
+            elif not any(m.name == local_url for m in members):
+                # Without other servers the local one is the only member; otherwise it's the fallback
+                members.append(self.create_server(local_url, backend, local_priority, client_id))
+        elif not members:
+            members.append(self.create_server(self.config.get("default_asr_server", LOCAL_SERVER_URL), backend, 0, client_id))
+        pool = ServerPool(members, hedge_percentile=self.config.get("hedge_percentile"), probe_interval_s=self.config.get("server_probe_interval_s", 10))
+        pool.start_probing()
+        return pool
+
+    def create_server(self, url, backend, priority, client_id):
+        if url.startswith(UNIX_URL_PREFIX):
+            return UnixSocketServer(url, backend, priority, client_id, arena_mb=self.config.get("shm_arena_mb", 16))
+        return HttpServer(url, backend, priority, client_id)
+
+    def check_server_ready(self):
+        return self.pool.probe_all()
+
+    def cancel_request(self, request_id):
+        self.pool.cancel(request_id)
+
+    def cancel_inflight_requests(self):
+        self.pool.cancel_all()
+
+    def request_settings(self, config, member):
+        """Settings sent with a request: the config section of the member's backend."""
+        return dict(config.get(backend_config_key(member.backend), {}))
+
+    def send_to_asr(self, audio_data, sample_rate, request_id=None, on_partial=None):
+        """Returns the post-processed result, or None if the request failed or was cancelled.
+        With on_partial the result is streamed and on_partial gets the post-processed text
+        received so far."""
+        request_id = request_id or uuid.uuid4().hex
+        config = self.config
+        start_time = time.time()
+        partial = None
+        if on_partial:
+            first_partial = []
+
+            def partial(raw_text, member):
+                if not first_partial:
+                    first_partial.append(True)
+                    self.emit("timing", "first_partial", time.time() - start_time)
+                on_partial(postprocess_text(raw_text, config, config.get(backend_config_key(member.backend), {}), verbose=False))
         try:
-            files = {'audio': ('audio.wav', wav_data, 'audio/wav')}
-            
-            # Prepare data with all settings from the current backend config
-            data = {}
-            backend_config = self.config.get(backend, {})
-            for k, v in backend_config.items():
-                if v is not None:
-                    # If the value is a dict or list, send it as a JSON string
-                    if isinstance(v, (dict, list)):
-                        data[k] = json.dumps(v)
-                    else:
-                        data[k] = str(v)
-                
-            response = requests.post(self.asr_server_url, files=files, data=data, timeout=60)
-            if response.status_code == 200:
-                response.encoding = 'utf-8'
-                text = response.text
-                
-                # Apply OpenCC immediately after receiving server response
-                opencc_mode = self.config.get("opencc_convert")
-                if opencc_mode:
-                    try:
-                        converter = opencc.OpenCC(opencc_mode)
-                        text = converter.convert(text)
-                        print(f"OpenCC converted ({opencc_mode}): {text}")
-                    except Exception as e:
-                        print(f"OpenCC conversion error: {e}")
-
-                # Apply extra_replace if configured for the current backend
-                extra_replace = backend_config.get("extra_replace")
-                if extra_replace and isinstance(extra_replace, dict):
-                    for old, new in extra_replace.items():
-                        text = text.replace(old, new)
-                    print(f"Extra replace applied: {text}")
-
-                return text
-            else:
-                print(f"ASR Error: {response.status_code} - {response.text}")
+            raw_text, member = self.pool.transcribe(audio_data, sample_rate, lambda m: self.request_settings(config, m), request_id, timeout=60, on_partial=partial)
+        except RequestCancelledError:
+            print(f"ASR request {request_id} was cancelled")
+            return None
         except Exception as e:
             print(f"ASR Request failed: {e}")
-        return ""
+            return None
+        latency = time.time() - start_time
+        self.emit("timing", "asr_request", latency)
+        backend = backend_config_key(member.backend)
+        backend_config = config.get(backend, {})
+        text = postprocess_text(raw_text, config, backend_config)
+        if self.capture_store:
+            self.capture_executor.submit(self.capture_utterance, audio_data, sample_rate, config, backend, member.name, backend_config, raw_text, text, latency)
+        return text
+
+    def capture_utterance(self, audio_data, sample_rate, config, backend, server, backend_config, raw_text, text, latency):
+        try:
+            settings = {k: v for k, v in backend_config.items() if k != "extra_replace"}
+            settings["opencc_convert"] = config.get("opencc_convert")
+            self.capture_store.append(
+                to_capture_pcm(audio_data, sample_rate),
+                backend=backend, server=server, settings=settings,
+                raw_text=raw_text, text=text, latency_s=latency,
+            )
+        except Exception as e:
+            print(f"Capture failed: {e}")
 
     def audio_callback(self, indata, frames, time_info, status):
         if status: print(f"Audio Status: {status}", file=sys.stderr)
-        if self.is_recording_dict["active"] or self.is_recording_dict["internal_active"]:
+        if self.state.state == RecorderState.RECORDING:
             self.audio_queue.put(indata.copy())
 
+    def start_speculation(self, executor, audio_data):
+        request_id = uuid.uuid4().hex
+        spec = {"request_id": request_id, "started": time.time(), "finished": None}
+
+        def run():
+            try:
+                return self.send_to_asr(audio_data, FRONTEND_SAMPLE_RATE, request_id=request_id)
+            finally:
+                spec["finished"] = time.time()
+
+        print(f"VAD: Short pause, starting speculative request {request_id[:8]}")
+        spec["future"] = executor.submit(run)
+        return spec
+
+    def abandon_speculation(self, spec):
+        self.speculation_stats["misses"] += 1
+        if not spec["future"].done():
+            threading.Thread(target=self.cancel_request, args=(spec["request_id"],), daemon=True).start()
+
+    def commit_speculation(self, spec):
+        """Returns the speculative result, or None if its request failed, in which case
+        the utterance has to be sent again."""
+        committed_at = time.time()
+        text = spec["future"].result()
+        if text is None:
+            self.speculation_stats["misses"] += 1
+            if self.state.cancelled:
+                return ""
+            print("VAD: Speculative request failed, sending the utterance normally")
+            return None
+        # Without speculation the request would have started at committed_at, so the
+        # saving is the head start, capped by how long the request actually took.
+        duration = spec["finished"] - spec["started"]
+        saved = min(committed_at - spec["started"], duration)
+        self.speculation_stats["hits"] += 1
+        self.speculation_stats["saved_s"] += saved
+        print(f"VAD: Speculative result committed, saved {saved * 1000:.0f}ms")
+        return text
+
+    def report_speculation_stats(self):
+        stats = self.speculation_stats
+        total = stats["hits"] + stats["misses"]
+        if total == 0:
+            return
+        avg_saved = stats["saved_s"] / stats["hits"] * 1000 if stats["hits"] else 0
+        print(f"Speculation: {stats['hits']}/{total} hits ({stats['hits'] / total:.0%}), avg saved {avg_saved:.0f}ms per hit")
+
+    def type_result(self, text):
+        print(f"Result: {text}")
+        self.emit("result", text)
+        self.wayland_type(text)
+
+    def stream_result(self, audio_data):
+        """Transcribes with streaming: partial text is emitted as it arrives and, with
+        stream_typing, typed into the focused window progressively."""
+        typer = None
+        if self.config.get("stream_typing", False):
+            typer = ProgressiveTyper(self.wayland_type, self.config.get("stream_holdback_chars", 4))
+
+        def on_partial(text):
+            self.emit("partial", text)
+            if typer:
+                typer.update(text)
+
+        text = self.send_to_asr(audio_data, FRONTEND_SAMPLE_RATE, on_partial=on_partial)
+        if not text:
+            return
+        if typer is None:
+            self.type_result(text)
+            return
+        print(f"Result: {text}")
+        self.emit("result", text)
+        typer.finish(text)
+
     def recording_loop(self):
-        VAD_SAMPLE_RATE = 16000
         FRAME_DURATION_MS = 32
         PADDING_DURATION_MS = 640
         max_silent_frames = int(PADDING_DURATION_MS / FRAME_DURATION_MS)
 
+        # Continuous dictation: a shorter pause closes a segment which is transcribed
+        # while recording continues; the long timeout still ends the whole recording.
+        continuous = self.config.get("continuous_dictation", False)
+        segment_pause_ms = self.config.get("segment_pause_ms", 320)
+        max_segment_silent_frames = max(1, int(segment_pause_ms / FRAME_DURATION_MS))
+        segments = None
+        if continuous:
+            segments = SegmentPipeline(lambda audio, rate: self.send_to_asr(audio, rate), self.type_result,
+                                       max_workers=self.config.get("segment_workers", 2), is_cancelled=lambda: self.state.cancelled)
+
+        # Speculative end-of-speech: start transcribing after a short pause and either
+        # commit the result when the silence timeout confirms it or cancel it if speech resumes.
+        speculative_pause_ms = self.config.get("speculative_pause_ms", 0)
+        speculative = bool(speculative_pause_ms) and not continuous and speculative_pause_ms < PADDING_DURATION_MS
+        speculative_silent_frames = max(1, int(speculative_pause_ms / FRAME_DURATION_MS)) if speculative else None
+        spec_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="asr-speculative") if speculative else None
+
         while not self.stop_event.is_set():
-            if not self.is_recording_dict["active"]:
-                time.sleep(0.1)
-                continue
-            
+            if not self.state.wait_for_state((RecorderState.TRIGGERED,)):
+                break
+
             if not self.check_server_ready():
                 print("ASR Server not ready. Waiting...")
-                time.sleep(1)
+                # Retry in a second unless the hotkey cancels the attempt first
+                if self.state.wait_for(lambda m: m.cancelled, timeout=1):
+                    self.state.transition(RecorderState.IDLE)
                 continue
-                
-            self.is_recording_dict["internal_active"] = True
+
             print("Triggered! Playing sound...")
             play_sound(self.config.get("sound_up"), wait=True)
             set_mute(True)
             # Wait a bit for the system to actually mute and for any residual audio to clear
             time.sleep(0.1)
+            self.state.transition(RecorderState.RECORDING)
             print("Muted. VAD Listening...")
             
             recorded_audio = []
@@ -230,37 +384,39 @@ class ASRClient:
                     self.audio_queue.get_nowait()
                 except queue.Empty:
                     break
+            # Built per cycle so a device change from the GUI takes effect
+            frontend = AudioFrontend(self.input_sample_rate, self.input_channels)
+            self.vad_model.reset()
+            pending_frames = deque()
             active = False
             speech_detected = False
+            segment_has_speech = False
+            segment_count = 0
+            speculation = None
+            committed_text = None
             
             while not self.stop_event.is_set():
-                if self.is_recording_dict.get("cancel"):
+                if self.state.cancelled:
                     print("VAD: Cancelled by user")
                     recorded_audio = []
+                    if speculation:
+                        self.abandon_speculation(speculation)
+                        speculation = None
                     break
 
-                try:
-                    chunk = self.audio_queue.get(timeout=0.1)
-                except queue.Empty:
+                if not pending_frames:
+                    chunk = self.audio_queue.get()
+                    if chunk is None:
+                        # Woken up by a cancel or stop
+                        continue
+                    pending_frames.extend(frontend.process(chunk))
                     continue
-                
-                if self.input_channels > 1:
-                    chunk_mono = np.mean(chunk, axis=1, keepdims=False).reshape(-1, 1)
-                else:
-                    chunk_mono = chunk.reshape(-1, 1)
 
-                chunk_tensor = torch.from_numpy(chunk_mono.copy()).to(torch.float32).T
-                if self.input_sample_rate != VAD_SAMPLE_RATE:
-                    resampler_vad = torchaudio.transforms.Resample(self.input_sample_rate, VAD_SAMPLE_RATE)
-                    chunk_vad_tensor = resampler_vad(chunk_tensor)
-                else:
-                    chunk_vad_tensor = chunk_tensor
-
-                if chunk_vad_tensor.shape[1] < 512:
-                    chunk_vad_tensor = torch.nn.functional.pad(chunk_vad_tensor, (0, 512 - chunk_vad_tensor.shape[1]))
+                # 16 kHz mono frame shared by the meter, the VAD and the upload buffer
+                frame = pending_frames.popleft()
+                self.emit("level", frame)
 
-                with torch.no_grad():
-                    speech_prob = self.vad_model(chunk_vad_tensor.squeeze(0), VAD_SAMPLE_RATE).item()
+                speech_prob = self.vad_model(frame)
                 
                 is_speech = speech_prob > 0.5
                 
@@ -269,56 +425,112 @@ class ASRClient:
                         print(f"VAD: Speech started (prob: {speech_prob:.2f})")
                         active = True
                         speech_detected = True
+                        utterance_start = time.time()
+                        self.emit("utterance_started")
                     num_silent_frames = 0
-                    recorded_audio.append(chunk_mono)
+                    segment_has_speech = True
+                    recorded_audio.append(frame)
+                    if speculation:
+                        print("VAD: Speech resumed, cancelling speculative request")
+                        self.abandon_speculation(speculation)
+                        speculation = None
                 elif active:
-                    recorded_audio.append(chunk_mono)
+                    recorded_audio.append(frame)
                     num_silent_frames += 1
+                    if continuous and segment_has_speech and num_silent_frames == max_segment_silent_frames:
+                        segment_count += 1
+                        print(f"VAD: Pause detected, sending segment {segment_count} ({len(recorded_audio)} chunks)")
+                        segments.submit(np.concatenate(recorded_audio), FRONTEND_SAMPLE_RATE)
+                        recorded_audio = []
+                        segment_has_speech = False
+                    if speculative and speculation is None and num_silent_frames == speculative_silent_frames:
+                        speculation = self.start_speculation(spec_executor, np.concatenate(recorded_audio))
                     if num_silent_frames > max_silent_frames:
                         print("VAD: Silence timeout")
                         active = False
+                        if speculation:
+                            committed_text = self.commit_speculation(speculation)
+                            speculation = None
                         break
                 elif not speech_detected:
                     pass
 
-            if recorded_audio:
+            if recorded_audio and not self.state.cancelled:
+                # Audio the front end still holds: frames not yet seen by the VAD, the
+                # resampler's delay line and the last partial frame
+                recorded_audio.extend(pending_frames)
+                recorded_audio.extend(frontend.flush())
+            if speech_detected:
+                self.emit("utterance_finished", time.time() - utterance_start, self.state.cancelled)
+            if not self.state.cancelled:
+                self.state.transition(RecorderState.PROCESSING)
+            if continuous:
+                # Trailing audio after the last segment is only silence unless speech resumed
+                if recorded_audio and segment_has_speech and not self.state.cancelled:
+                    segments.submit(np.concatenate(recorded_audio), FRONTEND_SAMPLE_RATE)
+                # Wait for in-flight segments so the cycle ends only after everything is typed
+                segments.drain()
+            elif committed_text is not None:
+                if committed_text:
+                    self.type_result(committed_text)
+            elif recorded_audio:
                 print(f"Processing {len(recorded_audio)} chunks of audio...")
-                full_audio = np.concatenate(recorded_audio).flatten()
-                text = self.send_to_asr(full_audio, self.input_sample_rate)
-                if text:
-                    print(f"Result: {text}")
-                    self.wayland_type(text)
+                full_audio = np.concatenate(recorded_audio)
+                if self.config.get("stream_results", False):
+                    self.stream_result(full_audio)
+                else:
+                    text = self.send_to_asr(full_audio, FRONTEND_SAMPLE_RATE)
+                    if text:
+                        self.type_result(text)
             
-            self.is_recording_dict["active"] = False
-            self.is_recording_dict["internal_active"] = False
-            self.is_recording_dict["cancel"] = False
+            self.state.transition(RecorderState.IDLE)
+            if isinstance(self.vad_model, CascadeVAD):
+                report = self.vad_model.report()
+                if report:
+                    print(report)
+            if speculative:
+                self.report_speculation_stats()
             print("Recording cycle finished. Waiting for next trigger.")
             play_sound(self.config.get("sound_down"))
             set_mute(False)
 
+        if segments:
+            segments.close()
+        if spec_executor:
+            spec_executor.shutdown(wait=False)
+
+    def handle_hotkey_down(self):
+        if self.state.trigger():
+            if self.config.get("prewarm", True):
+                # Lets an idle server reload its model while the user is speaking
+                self.pool.prewarm()
+        else:
+            self.cancel_inflight_requests()
+            # Wake the recording loop if it is waiting for audio
+            self.audio_queue.put(None)
+
     def socket_listener(self):
         socket_path = self.config.get("socket_path", "/tmp/glm_asr_keyboard.sock")
         if os.path.exists(socket_path):
             os.remove(socket_path)
-        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as s:
             s.bind(socket_path)
             os.chmod(socket_path, 0o666)
-            s.listen()
+            s.settimeout(1.0)
             print(f"Listening for keyboard events on {socket_path}...")
             while not self.stop_event.is_set():
-                s.settimeout(1.0)
                 try:
-                    conn, addr = s.accept()
-                    with conn:
-                        data = conn.recv(1024)
-                        if data == b"DOWN":
-                            if self.is_recording_dict["active"]:
-                                self.is_recording_dict["cancel"] = True
-                            else:
-                                self.is_recording_dict["active"] = True
-                                self.is_recording_dict["cancel"] = False
-                        elif data == b"UP":
-                            pass
+                    data = s.recv(64)
+                    if len(data) != EVENT_SIZE:
+                        continue
+                    event_type, pressed_ns = struct.unpack(EVENT_FORMAT, data)
+                    if event_type == EVENT_DOWN:
+                        self.handle_hotkey_down()
+                        # Key press to state change, including the listener's read and send
+                        delay_ms = (time.time_ns() - pressed_ns) / 1e6
+                        self.hotkey_delays.append(delay_ms)
+                        self.emit("timing", "hotkey", delay_ms / 1000)
+                        print(f"Hotkey handled {delay_ms:.1f}ms after key press (median {np.median(self.hotkey_delays):.1f}ms)")
                 except socket.timeout: continue
                 except Exception as e:
                     if not self.stop_event.is_set(): print(f"Socket error: {e}")
@@ -335,22 +547,20 @@ class ASRClient:
         CHUNK_SIZE = int(self.input_sample_rate * 32 / 1000)
         try:
             while not self.stop_event.is_set():
-                if self.is_recording_dict["active"] or self.is_recording_dict["internal_active"]:
-                    print("Opening InputStream...")
-                    try:
-                        with sd.InputStream(device=self.input_device, 
-                                          samplerate=self.input_sample_rate, 
-                                          channels=self.input_channels, 
-                                          callback=self.audio_callback, 
-                                          blocksize=CHUNK_SIZE):
-                            while not self.stop_event.is_set() and (self.is_recording_dict["active"] or self.is_recording_dict["internal_active"]):
-                                time.sleep(0.1)
-                        print("InputStream closed.")
-                    except Exception as e:
-                        print(f"Error in InputStream: {e}")
-                        time.sleep(1)
-                else:
-                    time.sleep(0.1)
+                if not self.state.wait_for_state(CAPTURE_STATES):
+                    break
+                print("Opening InputStream...")
+                try:
+                    with sd.InputStream(device=self.input_device, 
+                                      samplerate=self.input_sample_rate, 
+                                      channels=self.input_channels, 
+                                      callback=self.audio_callback, 
+                                      blocksize=CHUNK_SIZE):
+                        self.state.wait_for(lambda m: m.state not in CAPTURE_STATES)
+                    print("InputStream closed.")
+                except Exception as e:
+                    print(f"Error in InputStream: {e}")
+                    self.stop_event.wait(1)
         except KeyboardInterrupt:
             self.stop_event.set()
             print("\nExiting...")
@@ -358,12 +568,16 @@ class ASRClient:
     def start_keyboard_subprocess(self):
         print("Starting keyboard listener with sudo...")
         hotkey = self.config.get("hotkey", "f12")
-        cmd = ["sudo", sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "keyboard_listener.py"), "--hotkey", hotkey]
+        socket_path = self.config.get("socket_path", "/tmp/glm_asr_keyboard.sock")
+        cmd = ["sudo", sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "keyboard_listener.py"), "--hotkey", hotkey, "--socket", socket_path]
         # Suppress stderr to avoid "No such device" tracebacks on exit
         self.keyboard_proc = subprocess.Popen(cmd, stderr=subprocess.DEVNULL)
         return self.keyboard_proc
 
     def start_local_server(self):
+        if self.config.get("local_backend_mode", "server") == "inprocess":
+            # The backend is already loading inside the pool
+            return None
         print("Starting local ASR server...")
         server_script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server", "server.py")
         backend = self.config.get("asr_backend", "glm")
@@ -371,12 +585,17 @@ class ASRClient:
         # Pass the current in-memory CONFIG as a JSON string to the server
         # This avoids overwriting config.json while ensuring the server uses latest UI settings
         cmd = [sys.executable, server_script, "--backend", backend, "--config-json", json.dumps(self.config)]
+        if self.config.get("local_backend_mode", "server") == "unix":
+            cmd += ["--unix-socket", self.config.get("local_unix_socket", LOCAL_UNIX_SOCKET)]
         self.server_proc = subprocess.Popen(cmd)
         return self.server_proc
 
     def stop(self):
         print("Stopping ASRClient...")
         self.stop_event.set()
+        self.pool.stop()
+        self.state.close()
+        self.audio_queue.put(None)
         
         # Ensure unmuted on stop
         set_mute(False)
@@ -394,6 +613,7 @@ class ASRClient:
             try:
                 # python-uinput devices don't have a close method, 
                 # but they are closed when the object is deleted.
+                self.text_output = None
                 del self.uinput_device
             except:
                 pass
@@ -436,11 +656,11 @@ if __name__ == "__main__":
     if args.asr_server:
         CONFIG["default_asr_server"] = args.asr_server
         CONFIG["use_local_server"] = False
+        CONFIG.pop("asr_servers", None)
     
     client = ASRClient(CONFIG)
     
-    if CONFIG.get("use_local_server"):
-        client.start_local_server()
+    if CONFIG.get("use_local_server") and client.start_local_server():
         # Give the server a moment to start
         time.sleep(2)
         
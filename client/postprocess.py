@@ -0,0 +1,34 @@
+import opencc
+
+_converters = {}
+
+def backend_config_key(backend):
+    """Maps an asr_backend value to the config section holding its settings."""
+    if backend == "sherpa-onnx/sense-voice":
+        return "sensevoice"
+    if backend == "sherpa-onnx/whisper":
+        return "whisper"
+    return backend
+
+def postprocess_text(text, config, backend_config, verbose=True):
+    # Apply OpenCC immediately after receiving server response
+    opencc_mode = config.get("opencc_convert")
+    if opencc_mode:
+        try:
+            converter = _converters.get(opencc_mode)
+            if converter is None:
+                converter = _converters[opencc_mode] = opencc.OpenCC(opencc_mode)
+            text = converter.convert(text)
+            if verbose:
+                print(f"OpenCC converted ({opencc_mode}): {text}")
+        except Exception as e:
+            print(f"OpenCC conversion error: {e}")
+
+    # Apply extra_replace if configured for the current backend
+    extra_replace = backend_config.get("extra_replace")
+    if extra_replace and isinstance(extra_replace, dict):
+        for old, new in extra_replace.items():
+            text = text.replace(old, new)
+        if verbose:
+            print(f"Extra replace applied: {text}")
+    return text
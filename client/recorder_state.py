@@ -0,0 +1,87 @@
+import threading
+from enum import Enum, auto
+
+
+class RecorderState(Enum):
+    IDLE = auto()
+    TRIGGERED = auto()
+    RECORDING = auto()
+    PROCESSING = auto()
+
+
+# The input stream is open only while the recorder is waiting for or capturing speech
+CAPTURE_STATES = (RecorderState.TRIGGERED, RecorderState.RECORDING)
+
+TRANSITIONS = {
+    RecorderState.IDLE: (RecorderState.TRIGGERED,),
+    RecorderState.TRIGGERED: (RecorderState.RECORDING, RecorderState.IDLE),
+    RecorderState.RECORDING: (RecorderState.PROCESSING, RecorderState.IDLE),
+    RecorderState.PROCESSING: (RecorderState.IDLE,),
+}
+
+
+class RecorderStateMachine:
+    """Recording state shared by the hotkey, recording and input stream threads.
+
+    Every change notifies a condition variable, so threads block until the state
+    they need is reached instead of polling, and an idle client never wakes up.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.state = RecorderState.IDLE
+        self.cancelled = False
+        self.closed = False
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Registers callback(old_state, new_state), called after each transition outside the lock."""
+        self._listeners.append(callback)
+
+    def _notify(self, old_state, new_state):
+        for callback in self._listeners:
+            callback(old_state, new_state)
+
+    def transition(self, new_state):
+        with self._cond:
+            old_state = self.state
+            if new_state == old_state:
+                return
+            if new_state not in TRANSITIONS[old_state]:
+                raise ValueError(f"Invalid recorder transition {old_state.name} -> {new_state.name}")
+            self.state = new_state
+            if new_state == RecorderState.TRIGGERED:
+                self.cancelled = False
+            self._cond.notify_all()
+        self._notify(old_state, new_state)
+
+    def trigger(self):
+        """Handles a hotkey press: starts a cycle when idle, otherwise cancels the current one.
+
+        Returns True when a new cycle was started.
+        """
+        with self._cond:
+            started = self.state == RecorderState.IDLE
+            if started:
+                self.state = RecorderState.TRIGGERED
+                self.cancelled = False
+            else:
+                self.cancelled = True
+            self._cond.notify_all()
+        if started:
+            self._notify(RecorderState.IDLE, RecorderState.TRIGGERED)
+        return started
+
+    def wait_for(self, predicate, timeout=None):
+        """Blocks until predicate(machine) holds, the timeout expires or the machine is closed."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.closed or predicate(self), timeout)
+            return not self.closed and predicate(self)
+
+    def wait_for_state(self, states, timeout=None):
+        return self.wait_for(lambda m: m.state in states, timeout)
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
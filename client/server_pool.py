@@ -0,0 +1,358 @@
+import io
+import json
+import time
+import wave
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import requests
+
+
+class ServerError(Exception):
+    pass
+
+
+class ServerBusyError(ServerError):
+    def __init__(self, retry_after):
+        super().__init__(f"server busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class RequestCancelledError(ServerError):
+    pass
+
+
+def encode_wav(audio_data, sample_rate):
+    with io.BytesIO() as bio:
+        with wave.open(bio, 'wb') as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2) # 16-bit
+            wav_file.setframerate(sample_rate)
+            # Convert float32 to int16
+            audio_int16 = (np.clip(audio_data, -1.0, 1.0) * 32767).astype(np.int16)
+            wav_file.writeframes(audio_int16.tobytes())
+        return bio.getvalue()
+
+
+def form_fields(settings):
+    """Encodes backend settings as multipart form fields, JSON for dicts and lists."""
+    data = {}
+    for k, v in settings.items():
+        if v is not None:
+            data[k] = json.dumps(v) if isinstance(v, (dict, list)) else str(v)
+    return data
+
+
+class PoolMember(ABC):
+    """Routing state of one recognizer: latency EWMA, recent latencies and health.
+
+    Latencies are tracked per second of audio (counting at least one second) so
+    short and long utterances can share one estimate.
+    """
+    EWMA_ALPHA = 0.3
+
+    def __init__(self, name, backend=None, priority=0):
+        self.name = name
+        self.backend = backend
+        self.priority = priority
+        self.ewma = None
+        self.latencies = deque(maxlen=50)
+        self.healthy = True
+        self.busy_until = 0.0
+        self.inflight = 0
+        self.lock = threading.Lock()
+
+    def record_success(self, latency, audio_s):
+        normalized = latency / max(audio_s, 1.0)
+        with self.lock:
+            self.ewma = normalized if self.ewma is None else self.EWMA_ALPHA * normalized + (1 - self.EWMA_ALPHA) * self.ewma
+            self.latencies.append(normalized)
+            self.healthy = True
+
+    def record_failure(self, error):
+        with self.lock:
+            if isinstance(error, ServerBusyError):
+                try:
+                    retry_after = float(error.retry_after)
+                except (TypeError, ValueError):
+                    retry_after = 1.0
+                self.busy_until = time.time() + retry_after
+            else:
+                self.healthy = False
+
+    def expected_latency(self, audio_s):
+        # Unmeasured members are tried optimistically so they get an estimate
+        if self.ewma is None:
+            return 0.0
+        return self.ewma * max(audio_s, 1.0) * (1 + self.inflight)
+
+    def latency_percentile(self, percentile, audio_s, min_samples=10):
+        with self.lock:
+            if len(self.latencies) < min_samples:
+                return None
+            return float(np.percentile(self.latencies, percentile)) * max(audio_s, 1.0)
+
+    def rank_key(self, audio_s):
+        return (not self.healthy, self.busy_until > time.time(), self.priority, self.expected_latency(audio_s))
+
+    @abstractmethod
+    def probe(self):
+        pass
+
+    @abstractmethod
+    def transcribe(self, audio_data, sample_rate, settings, request_id, timeout, on_partial=None):
+        """Returns the text. With on_partial, members that can stream call it with the
+        text received so far while decoding is still running."""
+        pass
+
+    def cancel(self, request_id):
+        pass
+
+    def prewarm(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class HttpServer(PoolMember):
+    def __init__(self, url, backend=None, priority=0, client_id=None):
+        super().__init__(url, backend, priority)
+        self.url = url
+        self.client_id = client_id
+
+    def probe(self):
+        try:
+            # Even if it returns 405 (Method Not Allowed) for GET, it means the server is listening
+            requests.get(self.url, timeout=1)
+            return True
+        except Exception:
+            return False
+
+    def transcribe(self, audio_data, sample_rate, settings, request_id, timeout, on_partial=None):
+        files = {'audio': ('audio.wav', encode_wav(audio_data, sample_rate), 'audio/wav')}
+        # The server stops generating once our own timeout would have given up on it
+        headers = {
+            'X-Request-ID': request_id,
+            'X-Request-Timeout': str(timeout),
+            'X-Client-ID': self.client_id or "",
+        }
+        if on_partial:
+            headers['Accept'] = 'text/event-stream'
+        response = requests.post(self.url, files=files, data=form_fields(settings), headers=headers, timeout=timeout, stream=bool(on_partial))
+        if response.status_code == 499:
+            raise RequestCancelledError(f"request {request_id} was cancelled")
+        if response.status_code == 503:
+            raise ServerBusyError(response.headers.get('Retry-After', '1'))
+        if response.status_code != 200:
+            raise ServerError(f"{response.status_code} - {response.text}")
+        response.encoding = 'utf-8'
+        # Servers without streaming answer with the plain text
+        if on_partial and response.headers.get('Content-Type', '').startswith('text/event-stream'):
+            return self.read_events(response, request_id, on_partial)
+        return response.text
+
+    def read_events(self, response, request_id, on_partial):
+        text = ""
+        event, data = None, []
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data.append(line[len("data:"):].strip())
+                elif not line and event:
+                    payload = json.loads("\n".join(data))
+                    if event == "partial":
+                        text += payload["text"]
+                        on_partial(text)
+                    elif event == "done":
+                        return payload["text"]
+                    elif event == "error":
+                        if payload.get("status") == 499:
+                            raise RequestCancelledError(f"request {request_id} was cancelled")
+                        raise ServerError(f"{payload.get('status')} - {payload.get('error')}")
+                    event, data = None, []
+        raise ServerError("stream ended without a result")
+
+    def prewarm(self):
+        try:
+            requests.post(f"{self.url.rstrip('/')}/prewarm", timeout=1)
+        except Exception as e:
+            print(f"Prewarm request to {self.name} failed: {e}")
+
+    def cancel(self, request_id):
+        try:
+            requests.post(f"{self.url.rstrip('/')}/cancel", headers={'X-Request-ID': request_id}, timeout=1)
+        except Exception as e:
+            print(f"Cancel request to {self.name} failed: {e}")
+
+
+class ServerPool:
+    """Routes each utterance to the best member and fails over or hedges.
+
+    Members are ranked by health, temporary overload, priority (lower first) and
+    expected latency. When hedge_percentile is set and the chosen member hasn't
+    answered within that percentile of its recent latencies, the request is also
+    sent to the next member; the first result wins and the other is cancelled.
+    """
+
+    def __init__(self, members, hedge_percentile=None, probe_interval_s=10.0):
+        self.members = members
+        self.hedge_percentile = hedge_percentile
+        self.probe_interval_s = probe_interval_s
+        # Transcription attempts can run for up to their timeout; probes, prewarms and
+        # cancels get their own workers so they never wait behind them
+        self.executor = ThreadPoolExecutor(max_workers=max(4, 2 * len(members)), thread_name_prefix="asr-pool")
+        self.control_executor = ThreadPoolExecutor(max_workers=2 * len(members) + 2, thread_name_prefix="asr-control")
+        self.lock = threading.Lock()
+        # request_id -> [(member, attempt_id)] of attempts still running
+        self.attempts = {}
+        self.cancelled = set()
+        self.stats = {"hedged": 0, "hedge_wins": 0, "failovers": 0}
+        self.stop_event = threading.Event()
+
+    def ranked(self, audio_s):
+        return sorted(self.members, key=lambda m: m.rank_key(audio_s))
+
+    def probe_all(self):
+        """Probes every member and returns True as soon as one of them is healthy.
+        The other probes keep running and record their result when they finish."""
+        def record(future, member):
+            member.healthy = future.exception() is None and future.result()
+
+        pending = set()
+        for member in self.members:
+            future = self.control_executor.submit(member.probe)
+            future.add_done_callback(lambda f, m=member: record(f, m))
+            pending.add(future)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            if any(future.exception() is None and future.result() for future in done):
+                return True
+        return False
+
+    def start_probing(self):
+        def loop():
+            while not self.stop_event.wait(self.probe_interval_s):
+                self.probe_all()
+        if len(self.members) > 1:
+            threading.Thread(target=loop, daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+        for member in self.members:
+            member.close()
+
+    def prewarm(self):
+        """Tells the member the next request will most likely go to, and the hedge
+        target if hedging is on, that a request is coming."""
+        ranked = self.ranked(1.0)
+        for member in ranked[:2 if self.hedge_percentile else 1]:
+            self.control_executor.submit(member.prewarm)
+
+    def _attempt(self, member, audio_data, sample_rate, settings, attempt_id, timeout, on_partial=None):
+        audio_s = len(audio_data) / sample_rate
+        with member.lock:
+            member.inflight += 1
+        start_time = time.time()
+        try:
+            text = member.transcribe(audio_data, sample_rate, settings, attempt_id, timeout, on_partial)
+            member.record_success(time.time() - start_time, audio_s)
+            return text
+        except RequestCancelledError:
+            raise
+        except Exception as e:
+            member.record_failure(e)
+            raise
+        finally:
+            with member.lock:
+                member.inflight -= 1
+
+    def transcribe(self, audio_data, sample_rate, settings_for, request_id, timeout=60, on_partial=None):
+        """Returns (text, member). settings_for(member) gives the settings to send to it.
+
+        on_partial(text, member) receives the text streamed so far. Streamed requests
+        are not hedged, since partial text may already be on screen. After a failover
+        the new member's partials start over from the beginning.
+        """
+        audio_s = len(audio_data) / sample_rate
+        remaining = self.ranked(audio_s)
+        if not remaining:
+            raise ServerError("No ASR servers configured")
+        pending = {}
+        errors = []
+        hedged = False
+        start_time = time.time()
+        with self.lock:
+            self.attempts[request_id] = []
+
+        def launch():
+            member = remaining.pop(0)
+            with self.lock:
+                attempts = self.attempts[request_id]
+                # Hedges and failovers get their own IDs so each can be cancelled separately
+                attempt_id = f"{request_id}-{len(attempts)}" if attempts else request_id
+                attempts.append((member, attempt_id))
+            partial = (lambda text: on_partial(text, member)) if on_partial else None
+            future = self.executor.submit(self._attempt, member, audio_data, sample_rate, settings_for(member), attempt_id, timeout, partial)
+            pending[future] = (member, attempt_id)
+
+        try:
+            launch()
+            primary = next(iter(pending.values()))[0]
+            while pending:
+                hedge_delay = None
+                if self.hedge_percentile and not on_partial and not hedged and remaining:
+                    hedge_delay = primary.latency_percentile(self.hedge_percentile, audio_s)
+                    if hedge_delay is not None:
+                        hedge_delay = max(0.0, hedge_delay - (time.time() - start_time))
+                done, _ = wait(list(pending), timeout=hedge_delay, return_when=FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    self.stats["hedged"] += 1
+                    print(f"{primary.name} slower than p{self.hedge_percentile}, hedging to {remaining[0].name}")
+                    launch()
+                    continue
+                for future in done:
+                    member, attempt_id = pending.pop(future)
+                    try:
+                        text = future.result()
+                    except Exception as e:
+                        if request_id in self.cancelled:
+                            raise RequestCancelledError(f"request {request_id} was cancelled")
+                        errors.append(f"{member.name}: {e}")
+                        print(f"ASR server {member.name} failed: {e}")
+                        if not pending and remaining:
+                            self.stats["failovers"] += 1
+                            print(f"Failing over to {remaining[0].name}")
+                            launch()
+                        continue
+                    # First result wins; the other attempt is cancelled on its server
+                    for loser, loser_id in pending.values():
+                        self.control_executor.submit(loser.cancel, loser_id)
+                    if hedged and member is not primary:
+                        self.stats["hedge_wins"] += 1
+                    return text, member
+            raise ServerError("All ASR servers failed: " + "; ".join(errors))
+        finally:
+            with self.lock:
+                self.attempts.pop(request_id, None)
+                self.cancelled.discard(request_id)
+
+    def cancel(self, request_id):
+        with self.lock:
+            attempts = list(self.attempts.get(request_id, []))
+            if attempts:
+                self.cancelled.add(request_id)
+        for member, attempt_id in attempts:
+            member.cancel(attempt_id)
+        return bool(attempts)
+
+    def cancel_all(self):
+        with self.lock:
+            request_ids = list(self.attempts)
+        for request_id in request_ids:
+            threading.Thread(target=self.cancel, args=(request_id,), daemon=True).start()
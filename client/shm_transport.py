@@ -0,0 +1,207 @@
+import json
+import time
+import socket
+import struct
+import threading
+from multiprocessing import shared_memory
+import numpy as np
+
+from server_pool import PoolMember, ServerError, ServerBusyError, RequestCancelledError
+
+UNIX_URL_PREFIX = "unix://"
+# Messages are JSON objects preceded by their length, as read by server/unix_listener.py
+HEADER = struct.Struct("!I")
+# Offsets are aligned so the server's float32 views start on a cache line
+ALIGNMENT = 64
+
+
+def recv_exact(sock, size, deadline):
+    data = bytearray()
+    while len(data) < size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("no response before the request deadline")
+        sock.settimeout(remaining)
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def recv_message(sock, deadline):
+    header = recv_exact(sock, HEADER.size, deadline)
+    if header is None:
+        return None
+    body = recv_exact(sock, HEADER.unpack(header)[0], deadline)
+    return None if body is None else json.loads(body)
+
+
+def send_message(sock, message):
+    body = json.dumps(message).encode('utf-8')
+    sock.sendall(HEADER.pack(len(body)) + body)
+
+
+class SharedAudioArena:
+    """Shared-memory segment holding the PCM of in-flight requests.
+
+    Space is handed out first-fit at aligned offsets and released once the server
+    has answered, so concurrent requests (hedges, batch jobs) don't overwrite each other.
+    A request that fails without an answer may still be read by the server, so the
+    whole arena is retired instead: it hands out no more space and is unlinked once
+    its other requests are done. The server's mapping stays valid after the unlink.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.used = {}  # offset -> nbytes
+        self.retired = False
+        self.lock = threading.Lock()
+
+    def allocate(self, nbytes):
+        """Returns the offset of nbytes of free space, or None if there isn't enough."""
+        with self.lock:
+            if self.retired:
+                return None
+            offset = 0
+            for start in sorted(self.used):
+                if start - offset >= nbytes:
+                    break
+                offset = -(-(start + self.used[start]) // ALIGNMENT) * ALIGNMENT
+            if offset + nbytes > self.size:
+                return None
+            self.used[offset] = nbytes
+            return offset
+
+    def release(self, offset):
+        with self.lock:
+            self.used.pop(offset, None)
+            if not self.retired or self.used:
+                return
+        self.close()
+
+    def retire(self):
+        with self.lock:
+            if self.retired:
+                return
+            self.retired = True
+            if self.used:
+                return
+        self.close()
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+class UnixSocketServer(PoolMember):
+    """Server on this host reached through a Unix socket, with audio in shared memory.
+
+    The float32 PCM is written once into the shared arena and the request carries only
+    a small JSON descriptor, so there is no WAV encoding, multipart body or TCP stack.
+    Audio larger than the free arena space gets a segment of its own for that request.
+    """
+
+    def __init__(self, url, backend=None, priority=0, client_id=None, arena_mb=16):
+        super().__init__(url, backend, priority)
+        self.path = url[len(UNIX_URL_PREFIX):]
+        self.client_id = client_id
+        self.arena_bytes = int(arena_mb * 1024 ** 2)
+        self.arena = None
+
+    def request(self, message, timeout, on_partial=None):
+        # One deadline for the whole exchange, not a timeout per recv
+        deadline = time.monotonic() + timeout
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(self.path)
+            send_message(sock, message)
+            text = ""
+            while True:
+                response = recv_message(sock, deadline)
+                if response is None:
+                    raise ServerError("connection closed without a response")
+                if "partial" not in response:
+                    return response
+                text += response["partial"]
+                on_partial(text)
+
+    def probe(self):
+        try:
+            return self.request({"op": "ping"}, timeout=1)["status"] == 200
+        except Exception:
+            return False
+
+    def transcribe(self, audio_data, sample_rate, settings, request_id, timeout, on_partial=None):
+        audio = np.asarray(audio_data, dtype=np.float32)
+        nbytes = max(audio.nbytes, 1)
+        with self.lock:
+            if self.arena is None:
+                self.arena = SharedAudioArena(self.arena_bytes)
+            arena = self.arena
+        offset = arena.allocate(nbytes)
+        own = None
+        if offset is None:
+            own = shared_memory.SharedMemory(create=True, size=nbytes)
+        shm = own if own is not None else arena.shm
+        response = None
+        try:
+            np.ndarray(audio.shape, dtype=np.float32, buffer=shm.buf, offset=offset or 0)[:] = audio
+            response = self.request({
+                "op": "transcribe",
+                "request_id": request_id,
+                "timeout": timeout,
+                "client_id": self.client_id,
+                "shm": shm.name,
+                "offset": offset or 0,
+                "length": len(audio),
+                "sample_rate": sample_rate,
+                "settings": {k: v for k, v in settings.items() if v is not None},
+                "ephemeral": own is not None,
+                "stream": bool(on_partial),
+            }, timeout, on_partial)
+        finally:
+            # Unlinking our own segment is safe either way, the server keeps its mapping
+            if own is not None:
+                own.close()
+                own.unlink()
+            else:
+                if response is None:
+                    # The server may still be reading this space
+                    self.cancel(request_id)
+                    self.retire_arena(arena)
+                arena.release(offset)
+        status = response.get("status")
+        if status == 499:
+            raise RequestCancelledError(f"request {request_id} was cancelled")
+        if status == 503:
+            raise ServerBusyError(response.get("retry_after", 1))
+        if status != 200:
+            raise ServerError(f"{status} - {response.get('error')}")
+        return response["text"]
+
+    def retire_arena(self, arena):
+        with self.lock:
+            if self.arena is arena:
+                self.arena = None
+        print(f"Retiring shared audio arena of {self.name} after a request without response")
+        arena.retire()
+
+    def prewarm(self):
+        try:
+            self.request({"op": "prewarm"}, timeout=1)
+        except Exception as e:
+            print(f"Prewarm request to {self.name} failed: {e}")
+
+    def cancel(self, request_id):
+        try:
+            self.request({"op": "cancel", "request_id": request_id}, timeout=1)
+        except Exception as e:
+            print(f"Cancel request to {self.name} failed: {e}")
+
+    def close(self):
+        with self.lock:
+            arena, self.arena = self.arena, None
+        if arena is not None:
+            arena.retire()
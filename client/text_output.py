@@ -0,0 +1,221 @@
+import os
+import time
+import shutil
+import threading
+import subprocess
+from collections import deque
+import pyperclip
+
+# US-layout key for every printable ASCII character: (uinput key name, needs shift)
+ASCII_KEYS = {" ": ("KEY_SPACE", False), "\n": ("KEY_ENTER", False), "\t": ("KEY_TAB", False)}
+for _c in "abcdefghijklmnopqrstuvwxyz":
+    ASCII_KEYS[_c] = (f"KEY_{_c.upper()}", False)
+    ASCII_KEYS[_c.upper()] = (f"KEY_{_c.upper()}", True)
+for _c, _shifted in zip("1234567890", "!@#$%^&*()"):
+    ASCII_KEYS[_c] = (f"KEY_{_c}", False)
+    ASCII_KEYS[_shifted] = (f"KEY_{_c}", True)
+for _name, _plain, _shifted in (
+    ("KEY_MINUS", "-", "_"), ("KEY_EQUAL", "=", "+"), ("KEY_LEFTBRACE", "[", "{"),
+    ("KEY_RIGHTBRACE", "]", "}"), ("KEY_BACKSLASH", "\\", "|"), ("KEY_SEMICOLON", ";", ":"),
+    ("KEY_APOSTROPHE", "'", "\""), ("KEY_GRAVE", "`", "~"), ("KEY_COMMA", ",", "<"),
+    ("KEY_DOT", ".", ">"), ("KEY_SLASH", "/", "?"),
+):
+    ASCII_KEYS[_plain] = (_name, False)
+    ASCII_KEYS[_shifted] = (_name, True)
+
+# Keys the virtual keyboard registers: paste shortcut plus everything used for typing
+UINPUT_KEY_NAMES = sorted({"KEY_LEFTCTRL", "KEY_LEFTSHIFT", "KEY_V"} | {name for name, _ in ASCII_KEYS.values()})
+
+
+def uinput_keys():
+    import uinput
+    return [getattr(uinput, name) for name in UINPUT_KEY_NAMES]
+
+
+class ClipboardPaste:
+    """Copies the text, confirms the clipboard holds it, then sends Ctrl+V.
+
+    The previous clipboard is restored in the background so the caller doesn't wait
+    for the target application to finish reading the paste.
+    """
+    name = "clipboard"
+
+    def __init__(self, uinput_device, config):
+        self.uinput_device = uinput_device
+        self.timeout = config.get("clipboard_timeout_ms", 200) / 1000
+        self.restore = config.get("restore_clipboard", True)
+        self.restore_delay = config.get("restore_delay_ms", 150) / 1000
+        self._lock = threading.Lock()
+        self._restore_timer = None
+        self._saved_clipboard = None
+
+    def available(self, text):
+        return self.uinput_device is not None
+
+    def wait_for_clipboard(self, text):
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            try:
+                if pyperclip.paste() == text:
+                    return True
+            except Exception:
+                pass
+            time.sleep(0.005)
+        return False
+
+    def type(self, text):
+        import uinput
+        with self._lock:
+            if self._restore_timer is not None:
+                # A restore is still pending: keep the clipboard saved before that paste
+                self._restore_timer.cancel()
+                self._restore_timer = None
+            elif self.restore:
+                try:
+                    self._saved_clipboard = pyperclip.paste()
+                except Exception:
+                    self._saved_clipboard = None
+            pyperclip.copy(text)
+            if not self.wait_for_clipboard(text):
+                print("Clipboard did not confirm the new text in time, pasting anyway")
+            self.uinput_device.emit_combo([uinput.KEY_LEFTCTRL, uinput.KEY_V])
+            if self.restore and self._saved_clipboard:
+                self._restore_timer = threading.Timer(self.restore_delay, self.restore_clipboard)
+                self._restore_timer.daemon = True
+                self._restore_timer.start()
+
+    def restore_clipboard(self):
+        with self._lock:
+            self._restore_timer = None
+            saved, self._saved_clipboard = self._saved_clipboard, None
+            if saved:
+                try: pyperclip.copy(saved)
+                except Exception: pass
+
+
+class UinputTyping:
+    """Types short ASCII results key by key, leaving the clipboard untouched.
+
+    Keys are sent as US-layout scancodes, so this is only correct with a US-compatible layout.
+    """
+    name = "uinput"
+
+    def __init__(self, uinput_device, config):
+        self.uinput_device = uinput_device
+        self.max_chars = config.get("uinput_max_chars", 64)
+
+    def available(self, text):
+        return self.uinput_device is not None and len(text) <= self.max_chars and all(c in ASCII_KEYS for c in text)
+
+    def type(self, text):
+        import uinput
+        shift = uinput.KEY_LEFTSHIFT
+        for c in text:
+            name, shifted = ASCII_KEYS[c]
+            key = getattr(uinput, name)
+            if shifted:
+                self.uinput_device.emit_combo([shift, key])
+            else:
+                self.uinput_device.emit_click(key)
+
+
+class WtypeInput:
+    """Types through the compositor's virtual keyboard protocol using wtype.
+
+    This is zwp_virtual_keyboard_v1, not the input-method protocol: wtype uploads a
+    keymap containing the characters it types, so it handles any Unicode text
+    without the clipboard and independent of the layout. Only compositors that
+    implement the protocol (wlroots-based ones) support it; it disables itself
+    after a failure.
+    """
+    name = "wtype"
+
+    def __init__(self, config):
+        self.path = shutil.which("wtype")
+        self.enabled = self.path is not None and bool(os.environ.get("WAYLAND_DISPLAY"))
+
+    def available(self, text):
+        return self.enabled
+
+    def type(self, text):
+        result = subprocess.run([self.path, "--", text], capture_output=True, timeout=10)
+        if result.returncode != 0:
+            self.enabled = False
+            raise RuntimeError(result.stderr.decode(errors="replace").strip() or f"wtype exited with {result.returncode}")
+
+
+# Layout-independent strategies only
+AUTO_ORDER = ["wtype", "clipboard"]
+
+
+class TextOutput:
+    """Injects results into the focused window with the fastest strategy that fits.
+
+    text_output.strategy selects one strategy ("clipboard", "uinput", "wtype"), or
+    "auto" to use wtype where supported and paste otherwise. uinput sends US-layout
+    keycodes and types the wrong characters on other layouts, so auto never picks it;
+    it has to be selected explicitly. A strategy that fails falls through to the next one.
+    """
+
+    def __init__(self, uinput_device, config=None):
+        config = config or {}
+        self.preferred = config.get("strategy", "auto")
+        self.clipboard = ClipboardPaste(uinput_device, config)
+        self.strategies = {
+            "uinput": UinputTyping(uinput_device, config),
+            "wtype": WtypeInput(config),
+            "clipboard": self.clipboard,
+        }
+        self.timings = {name: deque(maxlen=100) for name in self.strategies}
+
+    def candidates(self, text):
+        order = AUTO_ORDER if self.preferred == "auto" else [self.preferred, "clipboard"]
+        return [self.strategies[name] for name in dict.fromkeys(order) if name in self.strategies and self.strategies[name].available(text)]
+
+    def type_text(self, text):
+        if not text:
+            return None
+        for strategy in self.candidates(text):
+            start_time = time.perf_counter()
+            try:
+                strategy.type(text)
+            except Exception as e:
+                print(f"Text output via {strategy.name} failed: {e}")
+                continue
+            elapsed_ms = (time.perf_counter() - start_time) * 1000
+            self.timings[strategy.name].append(elapsed_ms)
+            print(f"Typed {len(text)} chars via {strategy.name} in {elapsed_ms:.1f}ms")
+            return strategy.name
+        print("No text output strategy available")
+        return None
+
+
+class ProgressiveTyper:
+    """Types a result while it is still streaming in.
+
+    update() gets the post-processed text so far and types what was added, except
+    the last holdback characters, which a later piece can still change through
+    OpenCC phrase conversion or extra_replace. finish() types the rest of the final text.
+    """
+
+    def __init__(self, type_fn, holdback=4):
+        self.type_fn = type_fn
+        self.holdback = holdback
+        self.typed = ""
+        self.lock = threading.Lock()
+
+    def update(self, text):
+        with self.lock:
+            stable = text[:max(0, len(text) - self.holdback)]
+            if len(stable) > len(self.typed) and stable.startswith(self.typed):
+                self.type_fn(stable[len(self.typed):])
+                self.typed = stable
+
+    def finish(self, text):
+        with self.lock:
+            if not text.startswith(self.typed):
+                # Typed text can't be taken back; continue after it
+                print(f"Streamed text {self.typed!r} differs from the final result {text!r}")
+            if len(text) > len(self.typed):
+                self.type_fn(text[len(self.typed):])
+            self.typed = text
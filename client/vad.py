@@ -0,0 +1,171 @@
+import os
+import importlib.util
+import numpy as np
+import onnxruntime as ort
+
+VAD_SAMPLE_RATE = 16000
+FRAME_SAMPLES = 512
+# Silero prepends the last 64 samples of the previous frame at 16 kHz
+CONTEXT_SAMPLES = 64
+# After this many frames skipped by the energy gate the recurrent state is cleared,
+# since it no longer describes the audio that precedes the next scored frame
+STATE_RESET_FRAMES = 8
+
+
+def find_silero_model():
+    """Locates silero_vad.onnx inside the installed silero_vad package without importing it,
+    since importing silero_vad pulls in torch."""
+    spec = importlib.util.find_spec("silero_vad")
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    for location in spec.submodule_search_locations:
+        path = os.path.join(location, "data", "silero_vad.onnx")
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class SileroVAD:
+    """Silero VAD on onnxruntime for 512-sample 16 kHz frames.
+
+    The recurrent state (2, 1, 128) and the 64-sample context are carried between
+    calls explicitly; reset() clears both at the start of each recording. Frames that
+    are not scored must still go through skip() so the context stays contiguous.
+    """
+
+    def __init__(self, model_path=None):
+        model_path = model_path or find_silero_model()
+        if not model_path or not os.path.exists(model_path):
+            raise FileNotFoundError("Silero VAD ONNX model not found. Install silero-vad or set vad_model_path in the config.")
+        options = ort.SessionOptions()
+        # One frame every 32 ms: a single thread is plenty and avoids waking a thread pool
+        options.intra_op_num_threads = 1
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.sr = np.array(VAD_SAMPLE_RATE, dtype=np.int64)
+        # Context followed by the current frame, reused for every call
+        self.input = np.zeros((1, CONTEXT_SAMPLES + FRAME_SAMPLES), dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        self.state = np.zeros((2, 1, 128), dtype=np.float32)
+        self.input[:] = 0.0
+        self.skipped = 0
+
+    def __call__(self, frame):
+        """Returns the speech probability of one frame."""
+        # The tail of the previous input becomes this frame's context
+        self.input[0, :CONTEXT_SAMPLES] = self.input[0, -CONTEXT_SAMPLES:]
+        self.input[0, CONTEXT_SAMPLES:] = frame
+        out, self.state = self.session.run(None, {"input": self.input, "state": self.state, "sr": self.sr})
+        self.skipped = 0
+        return float(out[0, 0])
+
+    def skip(self, frame):
+        """Advances the context past a frame that isn't scored."""
+        self.input[0, :CONTEXT_SAMPLES] = self.input[0, -CONTEXT_SAMPLES:]
+        self.input[0, CONTEXT_SAMPLES:] = frame
+        self.skipped += 1
+        if self.skipped == STATE_RESET_FRAMES:
+            self.state[:] = 0.0
+
+
+class EnergyGate:
+    """Marks frames that are clearly silent from their energy and zero-crossing rate.
+
+    The noise floor follows the level of frames judged non-speech, quickly at first
+    and slowly afterwards. A frame is silent when it is within margin_db of the floor,
+    unless a high zero-crossing rate suggests a quiet fricative, in which case it is
+    left to the neural model.
+    """
+
+    def __init__(self, margin_db=6.0, initial_floor_db=-60.0, fricative_zcr=0.25):
+        self.margin_db = margin_db
+        self.noise_floor_db = initial_floor_db
+        self.fricative_zcr = fricative_zcr
+        self.observed = 0
+
+    def features(self, frame):
+        energy_db = 10 * np.log10(float(np.dot(frame, frame)) / len(frame) + 1e-10)
+        zcr = np.count_nonzero(np.signbit(frame[1:]) != np.signbit(frame[:-1])) / len(frame)
+        return energy_db, zcr
+
+    def is_silent(self, energy_db, zcr):
+        if energy_db < self.noise_floor_db + self.margin_db / 2:
+            return True
+        return energy_db < self.noise_floor_db + self.margin_db and zcr < self.fricative_zcr
+
+    def update_floor(self, energy_db):
+        """Feeds the level of a non-speech frame into the noise floor estimate."""
+        self.observed += 1
+        rate = 0.2 if self.observed < 15 else 0.05
+        if energy_db < self.noise_floor_db:
+            # Follow drops immediately so the gate never becomes less selective than needed
+            self.noise_floor_db = energy_db
+        else:
+            self.noise_floor_db += rate * (energy_db - self.noise_floor_db)
+
+
+class CascadeVAD:
+    """Energy gate in front of Silero: only frames the gate can't rule out are scored.
+
+    With a shadow_model a second Silero instance scores every frame as well, and report()
+    compares the cascade with it: speech frames the gate skipped and how far the
+    detected end of speech moved.
+    """
+
+    def __init__(self, model, gate=None, shadow_model=None, threshold=0.5):
+        self.model = model
+        self.gate = gate or EnergyGate()
+        self.shadow_model = shadow_model
+        self.threshold = threshold
+        self.total_frames = 0
+        self.total_skipped = 0
+        self.reset()
+
+    def reset(self):
+        self.model.reset()
+        if self.shadow_model is not None:
+            self.shadow_model.reset()
+        self.frames = 0
+        self.skipped = 0
+        self.missed_speech = 0
+        self.last_speech = None
+        self.shadow_last_speech = None
+
+    def __call__(self, frame):
+        """Returns the speech probability of one frame, 0.0 for frames the gate skipped."""
+        self.frames += 1
+        self.total_frames += 1
+        energy_db, zcr = self.gate.features(frame)
+        if self.gate.is_silent(energy_db, zcr):
+            self.skipped += 1
+            self.total_skipped += 1
+            self.model.skip(frame)
+            self.gate.update_floor(energy_db)
+            prob = 0.0
+        else:
+            prob = self.model(frame)
+            if prob < self.threshold:
+                self.gate.update_floor(energy_db)
+        if prob >= self.threshold:
+            self.last_speech = self.frames
+
+        if self.shadow_model is not None:
+            shadow_prob = self.shadow_model(frame)
+            if shadow_prob >= self.threshold:
+                self.shadow_last_speech = self.frames
+                if prob < self.threshold:
+                    self.missed_speech += 1
+        return prob
+
+    def report(self, frame_ms=32):
+        if not self.frames:
+            return None
+        text = (f"VAD: gate skipped {self.skipped}/{self.frames} frames this recording, "
+                f"{self.total_skipped}/{self.total_frames} ({self.total_skipped / self.total_frames:.0%}) overall")
+        if self.shadow_model is not None:
+            text += f"; shadow: {self.missed_speech} speech frames missed"
+            if self.last_speech is not None and self.shadow_last_speech is not None:
+                text += f", end of speech {(self.last_speech - self.shadow_last_speech) * frame_ms:+d}ms vs always-on Silero"
+        return text
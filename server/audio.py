@@ -0,0 +1,79 @@
+import io
+import wave
+import numpy as np
+
+def decode_wav(data):
+    """Decodes 16-bit PCM WAV bytes into mono float32 audio and its sample rate."""
+    with io.BytesIO(data) as bio:
+        with wave.open(bio, 'rb') as wav_file:
+            params = wav_file.getparams()
+            frames = wav_file.readframes(params.nframes)
+    audio = np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768.0
+    if params.nchannels > 1:
+        audio = audio.reshape(-1, params.nchannels).mean(axis=1)
+    return audio, params.framerate
+
+def load_audio(path, target_sample_rate=16000, block_seconds=10):
+    """Reads any soundfile-supported file as mono float32 at target_sample_rate.
+
+    The file is read and resampled block by block with a streaming resampler, so
+    long recordings never need a second full-length copy at the source rate.
+    """
+    import soundfile as sf
+    import soxr
+
+    with sf.SoundFile(path) as f:
+        source_rate = f.samplerate
+        resampler = None
+        if source_rate != target_sample_rate:
+            resampler = soxr.ResampleStream(source_rate, target_sample_rate, 1, dtype="float32")
+        chunks = []
+        block_size = int(block_seconds * source_rate)
+        while True:
+            block = f.read(block_size, dtype="float32", always_2d=True)
+            last = len(block) < block_size
+            mono = block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+            if resampler is not None:
+                mono = resampler.resample_chunk(mono, last=last)
+            if len(mono):
+                chunks.append(mono)
+            if last:
+                break
+    if not chunks:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(chunks).astype(np.float32, copy=False)
+
+def trim_silence(audio, sample_rate, margin_s=0.2, threshold_db=-50.0, relative_db=35.0, min_speech_s=0.06, frame_s=0.02):
+    """Finds the region of audio that contains speech, by frame energy.
+
+    A frame counts as voiced when its level is above threshold_db (dBFS) and within
+    relative_db of the loudest frame, so quiet background noise next to speech is
+    dropped too. Returns (start, end) sample bounds widened by margin_s on each side,
+    or None when less than min_speech_s of the audio is voiced.
+    """
+    frame = max(1, int(frame_s * sample_rate))
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return None
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    energy_db = 10 * np.log10(np.einsum("ij,ij->i", frames, frames) / frame + 1e-10)
+    threshold = max(threshold_db, float(energy_db.max()) - relative_db)
+    voiced = np.flatnonzero(energy_db > threshold)
+    if len(voiced) * frame < min_speech_s * sample_rate:
+        return None
+    margin = int(margin_s * sample_rate)
+    start = max(0, int(voiced[0]) * frame - margin)
+    end = min(len(audio), (int(voiced[-1]) + 1) * frame + margin)
+    return start, end
+
+def trim_settings(server_config):
+    """Reads the trim_silence() keyword arguments from the server config section, or
+    returns None when trimming is disabled."""
+    if not server_config.get("trim_silence", True):
+        return None
+    return {
+        "margin_s": server_config.get("trim_margin_ms", 200) / 1000,
+        "threshold_db": server_config.get("trim_threshold_db", -50.0),
+        "relative_db": server_config.get("trim_relative_db", 35.0),
+        "min_speech_s": server_config.get("min_speech_ms", 60) / 1000,
+    }
@@ -0,0 +1,23 @@
+BACKEND_TYPES = ["glm", "glm-onnx", "sensevoice", "sherpa-onnx/sense-voice", "whisper", "sherpa-onnx/whisper", "null"]
+
+def create_backend(backend_type, config=None):
+    # Import lazily so a backend's heavy dependencies are only loaded when it's used
+    if backend_type == "glm":
+        from .glm_backend import GLMBackend
+        return GLMBackend(config=config)
+    elif backend_type == "glm-onnx":
+        from .glm_onnx_backend import GLMOnnxBackend
+        return GLMOnnxBackend(config=config)
+    elif backend_type == "sensevoice" or backend_type == "sherpa-onnx/sense-voice":
+        from .sensevoice_backend import SenseVoiceBackend
+        return SenseVoiceBackend(config=config)
+    elif backend_type == "whisper":
+        from .whisper_backend import WhisperBackend
+        return WhisperBackend(config=config)
+    elif backend_type == "sherpa-onnx/whisper":
+        from .sherpa_whisper_backend import SherpaWhisperBackend
+        return SherpaWhisperBackend(config=config)
+    elif backend_type == "null":
+        from .null_backend import NullBackend
+        return NullBackend(config=config)
+    raise ValueError(f"Unknown backend type: {backend_type}")
@@ -1,9 +1,57 @@
+import threading
+import contextlib
+import contextvars
 from abc import ABC, abstractmethod
 
 class ASRBackend(ABC):
     def __init__(self, config=None):
         self.config = config or {}
+        self.offloaded = None
 
     @abstractmethod
     def transcribe(self, audio_data, sample_rate, system_prompt=None, history=None, **kwargs):
         pass
+
+    def transcribe_stream(self, audio_data, sample_rate, system_prompt=None, history=None, **kwargs):
+        """Yields the transcription in pieces as it is decoded. Backends without
+        incremental output yield the whole result once."""
+        text = self.transcribe(audio_data, sample_rate, system_prompt, history, **kwargs)
+        if text:
+            yield text
+
+    def offload(self, drop=False):
+        """Frees the model's memory while the server is idle: moves it to CPU RAM, or
+        with drop releases it entirely. Returns False if there is nothing to free."""
+        return False
+
+    def reload(self):
+        """Undoes offload() before the next transcription."""
+        pass
+
+
+# Context manager factory entered by helper threads that run inference for the current
+# request. The server sets it so that per-thread tools such as the profiler's stack
+# sampler follow the request onto those threads.
+helper_thread_context = contextvars.ContextVar("helper_thread_context", default=None)
+
+
+def stream_generate(generate, inputs, generate_kwargs, errors):
+    """Runs generate() on a helper thread for a TextIteratorStreamer in generate_kwargs.
+
+    An exception is kept in errors and ends the stream, so the consumer doesn't wait forever.
+    """
+    enter = helper_thread_context.get()
+    try:
+        with enter() if enter else contextlib.nullcontext():
+            generate(inputs, generate_kwargs)
+    except Exception as e:
+        errors.append(e)
+        generate_kwargs["streamer"].end()
+
+
+def start_stream_generate(generate, inputs, generate_kwargs, errors):
+    """Starts stream_generate() on a daemon thread that inherits the caller's context."""
+    context = contextvars.copy_context()
+    thread = threading.Thread(target=context.run, args=(stream_generate, generate, inputs, generate_kwargs, errors), daemon=True)
+    thread.start()
+    return thread
@@ -1,49 +1,216 @@
+import copy
+import os
 import time
+from collections import OrderedDict
 import torch
 import torchaudio
 import numpy as np
-from transformers import AutoModelForSeq2SeqLM, AutoProcessor
-from .base import ASRBackend
+from transformers import AutoConfig, AutoModelForSeq2SeqLM, AutoProcessor, GenerationConfig, StoppingCriteriaList, TextIteratorStreamer
+from .base import ASRBackend, start_stream_generate
+from .stopping import CancelStoppingCriteria
+from .glm_prompt import prepare_glm_inputs, TARGET_SAMPLE_RATE
 
 MODEL_ID = "zai-org/GLM-ASR-Nano-2512"
-TARGET_SAMPLE_RATE = 16000
+
+def cpu_supports_bf16():
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
 
 class GLMBackend(ASRBackend):
     def __init__(self, config=None):
         super().__init__(config)
+        # Prefilled KV caches for the prompt tokens preceding the audio, keyed by
+        # those token IDs, so a fixed system prompt is only prefilled once
+        self.prompt_cache = OrderedDict()
+        self.prompt_cache_size = self.config.get("glm", {}).get("prompt_cache_size", 8)
+        self.load()
+        self.audio_token_id = getattr(self.model.config, "audio_token_id", None)
+        if self.audio_token_id is None and hasattr(self.processor, "audio_token"):
+            self.audio_token_id = self.processor.tokenizer.convert_tokens_to_ids(self.processor.audio_token)
+
+    def load(self):
         print("Loading GLM-ASR model...")
+        glm_config = self.config.get("glm", {})
+        device = glm_config.get("device", "auto")
+        if device == "cpu" or (device == "auto" and not torch.cuda.is_available()):
+            self.load_cpu_model(glm_config)
+        else:
+            self.processor = self.load_pretrained(AutoProcessor)
+            self.model = self.load_model(dtype="auto", device_map="auto")
+        self.device_model = self.model.device
+
+    def offload(self, drop=False):
+        on_gpu = self.device_model.type != "cpu"
+        # A model split across devices by device_map can't simply be moved back
+        split = len(set(getattr(self.model, "hf_device_map", {}).values())) > 1
+        if not drop and (not on_gpu or split):
+            if not on_gpu:
+                return False
+            drop = True
+        # The cached prefills live on the model's device
+        self.prompt_cache.clear()
+        if drop:
+            self.model = None
+        else:
+            self.model.to("cpu")
+        self.offloaded = "dropped" if drop else "cpu"
+        if on_gpu:
+            torch.cuda.empty_cache()
+        return True
+
+    def reload(self):
+        if self.offloaded == "dropped":
+            self.load()
+        else:
+            self.model.to(self.device_model)
+        self.offloaded = None
+
+    def load_pretrained(self, cls, **kwargs):
         try:
-            self.processor = AutoProcessor.from_pretrained(MODEL_ID, local_files_only=True)
-            self.model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_ID, dtype="auto", device_map="auto", local_files_only=True)
+            return cls.from_pretrained(MODEL_ID, local_files_only=True, **kwargs)
         except Exception as e:
             print(f"Local model files not found or error loading locally: {e}. Attempting to download/load from internet...")
-            self.processor = AutoProcessor.from_pretrained(MODEL_ID)
-            self.model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_ID, dtype="auto", device_map="auto")
-        self.device_model = self.model.device
+            return cls.from_pretrained(MODEL_ID, **kwargs)
+
+    def load_model(self, **kwargs):
+        return self.load_pretrained(AutoModelForSeq2SeqLM, **kwargs)
+
+    def load_cpu_model(self, glm_config):
+        num_threads = glm_config.get("num_threads") or os.cpu_count()
+        torch.set_num_threads(num_threads)
+        self.processor = self.load_pretrained(AutoProcessor)
+
+        cpu_dtype = glm_config.get("cpu_dtype", "int8")
+        if cpu_dtype == "bf16" and not cpu_supports_bf16():
+            print("GLM-ASR: CPU has no native bf16 support, using fp32")
+            cpu_dtype = "fp32"
+        print(f"GLM-ASR: CPU mode ({cpu_dtype}, {num_threads} threads)")
+
+        if cpu_dtype == "bf16":
+            self.model = self.load_model(dtype=torch.bfloat16, device_map="cpu")
+        elif cpu_dtype == "int8":
+            self.model = self.load_int8_model(glm_config)
+        else:
+            self.model = self.load_model(dtype=torch.float32, device_map="cpu")
+        self.model.eval()
+
+    def load_int8_model(self, glm_config):
+        """Dynamically quantizes the linear layers to int8, caching the quantized weights.
+
+        Only the state_dict is cached and loaded with weights_only, so nothing is unpickled
+        from the cache directory. On a cache hit the module structure is rebuilt from the
+        config with its parameters on the meta device and empty int8 linear layers, and the
+        cached tensors are assigned into it, so the fp32 model is never materialized.
+        """
+        config = self.load_pretrained(AutoConfig)
+        revision = getattr(config, "_commit_hash", None)
+        cache_dir = os.path.expanduser(glm_config.get("quantized_cache_dir", "~/.cache/wtako-asr-ime"))
+        # The packed int8 weights depend on the model revision and the torch version that built them
+        cache_path = os.path.join(cache_dir, f"glm-asr-nano-{revision}-int8-torch{torch.__version__}.pt") if revision else None
+        if cache_path and os.path.exists(cache_path):
+            start_time = time.time()
+            try:
+                model = self.quantized_skeleton(config)
+                model.load_state_dict(torch.load(cache_path, weights_only=True), assign=True)
+                print(f"GLM-ASR: loaded quantized weights from {cache_path} in {time.time() - start_time:.2f}s")
+                return model
+            except Exception as e:
+                print(f"GLM-ASR: ignoring quantized cache {cache_path}: {e}")
 
-    def transcribe(self, audio_data, sample_rate, system_prompt=None, history=None, **kwargs):
         start_time = time.time()
+        model = self.load_model(dtype=torch.float32, device_map="cpu")
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        print(f"GLM-ASR: quantized linear layers to int8 in {time.time() - start_time:.2f}s")
+        if cache_path is None:
+            print("GLM-ASR: model revision unknown, not caching quantized weights")
+            return model
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            torch.save(model.state_dict(), cache_path)
+            print(f"GLM-ASR: saved quantized weights to {cache_path}")
+        except Exception as e:
+            print(f"GLM-ASR: could not cache quantized weights: {e}")
+        return model
+
+    def quantized_skeleton(self, config):
+        """Returns the int8 model structure without weights: parameters on the meta device,
+        linear layers replaced the way quantize_dynamic() replaces them."""
+        from accelerate import init_empty_weights
+        # Buffers such as rotary frequencies are not in the state_dict, so they are built for real
+        with init_empty_weights(include_buffers=False):
+            model = AutoModelForSeq2SeqLM.from_config(config)
+        for module in list(model.modules()):
+            for name, child in list(module.named_children()):
+                if type(child) is torch.nn.Linear:
+                    setattr(module, name, torch.ao.nn.quantized.dynamic.Linear(
+                        child.in_features, child.out_features, bias_=child.bias is not None, dtype=torch.qint8))
+        try:
+            model.generation_config = self.load_pretrained(GenerationConfig)
+        except Exception as e:
+            print(f"GLM-ASR: no generation config, using the model config's defaults: {e}")
+        return model
+
+    def get_prompt_cache(self, input_ids):
+        """Returns a copy of the cached prefill of the text before the first audio token
+        and that token's position, or (None, 0) if there is nothing to cache."""
+        if not self.prompt_cache_size or self.audio_token_id is None or not isinstance(input_ids, torch.Tensor):
+            return None, 0
+        audio_positions = (input_ids[0] == self.audio_token_id).nonzero()
+        if len(audio_positions) == 0:
+            return None, 0
+        prefix_len = int(audio_positions[0])
+        if prefix_len == 0:
+            return None, 0
+
+        prefix_ids = input_ids[:, :prefix_len]
+        key = tuple(prefix_ids[0].tolist())
+        cache = self.prompt_cache.get(key)
+        if cache is None:
+            with torch.no_grad():
+                cache = self.model(input_ids=prefix_ids, use_cache=True).past_key_values
+            self.prompt_cache[key] = cache
+            if len(self.prompt_cache) > self.prompt_cache_size:
+                self.prompt_cache.popitem(last=False)
+            print(f"GLM-ASR: cached prefill for {prefix_len} prompt tokens")
+        else:
+            self.prompt_cache.move_to_end(key)
+        # The prefill below appends to the cache in place, so each request gets its own copy
+        return copy.deepcopy(cache), prefix_len
+
+    def prefill(self, inputs):
+        """Continues the cached text prefix with the audio and the rest of the prompt except
+        its last token, in one forward pass that merges the audio features itself.
+
+        generate() then starts from a cache that already holds the audio and only has text
+        tokens left to process. Passing the audio to generate() together with a non-empty
+        cache is not safe: depending on the transformers version, its prefill step drops
+        the input features once the cache position is past 0 and the audio is silently lost.
+        """
+        input_ids = inputs.get("input_ids")
+        past_key_values, prefix_len = self.get_prompt_cache(input_ids)
+        if past_key_values is None:
+            return None
+        end = input_ids.shape[1] - 1
+        if int(input_ids[0, end]) == self.audio_token_id:
+            return None
+        attention_mask = inputs.get("attention_mask")
+        audio_inputs = {k: v for k, v in inputs.items() if k not in ("input_ids", "attention_mask")}
+        with torch.no_grad():
+            self.model(input_ids=input_ids[:, prefix_len:end], attention_mask=attention_mask[:, :end] if attention_mask is not None else None,
+                       past_key_values=past_key_values, use_cache=True, **audio_inputs)
+        return past_key_values
+
+    def prepare(self, audio_data, sample_rate, system_prompt, history, cancel_token):
         audio_tensor = torch.from_numpy(audio_data).to(torch.float32)
         if sample_rate != TARGET_SAMPLE_RATE:
             resampler = torchaudio.transforms.Resample(sample_rate, TARGET_SAMPLE_RATE)
             audio_tensor = resampler(audio_tensor.unsqueeze(0)).squeeze(0)
         
-        if system_prompt or history:
-            messages = []
-            if system_prompt:
-                messages.append({"role": "system", "content": system_prompt})
-            if history:
-                messages.extend(history)
-            
-            messages.append({"role": "user", "content": [{"type": "audio", "audio": audio_tensor.cpu().numpy()}]})
-            
-            for msg in messages:
-                if isinstance(msg["content"], str):
-                    msg["content"] = [{"type": "text", "text": msg["content"]}]
-            
-            inputs = self.processor.apply_chat_template(messages, add_generation_prompt=True, tokenize=True, return_dict=True, sampling_rate=TARGET_SAMPLE_RATE)
-        else:
-            inputs = self.processor.apply_transcription_request(audio_tensor, sampling_rate=TARGET_SAMPLE_RATE)
+        inputs = prepare_glm_inputs(self.processor, audio_tensor.cpu().numpy(), system_prompt, history)
             
         inputs = {k: v.to(self.device_model) if isinstance(v, torch.Tensor) else v for k, v in inputs.items()}
         if hasattr(self.model, "dtype"):
@@ -51,8 +218,39 @@ class GLMBackend(ASRBackend):
                 if isinstance(v, torch.Tensor) and v.is_floating_point():
                     inputs[k] = v.to(self.model.dtype)
 
+        generate_kwargs = {}
+        if cancel_token is not None:
+            generate_kwargs["stopping_criteria"] = StoppingCriteriaList([CancelStoppingCriteria(cancel_token)])
+        return inputs, generate_kwargs
+
+    def generate(self, inputs, generate_kwargs):
+        past_key_values = None
+        # A failed cached attempt could not be retried without streaming the text
+        # twice, so streamed requests skip the prompt cache
+        if "streamer" not in generate_kwargs:
+            try:
+                past_key_values = self.prefill(inputs)
+            except Exception as e:
+                print(f"GLM-ASR: prompt cache disabled, prefill failed: {e}")
+                self.prompt_cache_size = 0
+                self.prompt_cache.clear()
+
         with torch.no_grad():
-            outputs = self.model.generate(**inputs, do_sample=False, max_new_tokens=500)
+            if past_key_values is not None:
+                # The audio is already in the cache, so only the token IDs are passed on
+                text_inputs = {k: v for k, v in inputs.items() if k in ("input_ids", "attention_mask")}
+                try:
+                    return self.model.generate(**text_inputs, past_key_values=past_key_values, do_sample=False, max_new_tokens=500, **generate_kwargs)
+                except Exception as e:
+                    print(f"GLM-ASR: prompt cache disabled, cached generate failed: {e}")
+                    self.prompt_cache_size = 0
+                    self.prompt_cache.clear()
+            return self.model.generate(**inputs, do_sample=False, max_new_tokens=500, **generate_kwargs)
+
+    def transcribe(self, audio_data, sample_rate, system_prompt=None, history=None, **kwargs):
+        start_time = time.time()
+        inputs, generate_kwargs = self.prepare(audio_data, sample_rate, system_prompt, history, kwargs.get("cancel_token"))
+        outputs = self.generate(inputs, generate_kwargs)
         
         decoded = self.processor.batch_decode(outputs[:, inputs["input_ids"].shape[1]:], skip_special_tokens=True)
         text = decoded[0] if decoded else ""
@@ -60,3 +258,22 @@ class GLMBackend(ASRBackend):
         duration = time.time() - start_time
         print(f"GLM-ASR took {duration:.2f}s")
         return text
+
+    def transcribe_stream(self, audio_data, sample_rate, system_prompt=None, history=None, **kwargs):
+        start_time = time.time()
+        inputs, generate_kwargs = self.prepare(audio_data, sample_rate, system_prompt, history, kwargs.get("cancel_token"))
+        streamer = TextIteratorStreamer(self.processor.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        generate_kwargs["streamer"] = streamer
+        errors = []
+        thread = start_stream_generate(self.generate, inputs, generate_kwargs, errors)
+        first_token_time = None
+        for piece in streamer:
+            if piece:
+                if first_token_time is None:
+                    first_token_time = time.time()
+                    print(f"GLM-ASR first text after {first_token_time - start_time:.2f}s")
+                yield piece
+        thread.join()
+        if errors:
+            raise errors[0]
+        print(f"GLM-ASR took {time.time() - start_time:.2f}s")
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import numpy as np
+import onnxruntime as ort
+import librosa
+from transformers import AutoProcessor
+from .base import ASRBackend
+from .glm_prompt import prepare_glm_inputs, TARGET_SAMPLE_RATE
+
+ORT_NUMPY_TYPES = {
+    "tensor(float)": np.float32,
+    "tensor(float16)": np.float16,
+    "tensor(int64)": np.int64,
+    "tensor(int32)": np.int32,
+    "tensor(bool)": np.bool_,
+}
+
+def to_numpy(value):
+    return value.numpy() if hasattr(value, "numpy") else np.asarray(value)
+
+class GLMOnnxBackend(ASRBackend):
+    """GLM-ASR through onnxruntime, using graphs produced by server/export_glm_onnx.py."""
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        print("Loading GLM-ASR ONNX model...")
+        onnx_config = self.config.get("glm-onnx", {})
+        model_dir = onnx_config.get("model_dir", "glm-asr-nano-onnx")
+        provider = onnx_config.get("provider", "cpu")
+        self.max_new_tokens = onnx_config.get("max_new_tokens", 500)
+        self.max_context = onnx_config.get("max_context", 4096)
+
+        if not os.path.exists(os.path.join(model_dir, "decoder.onnx")):
+            raise FileNotFoundError(f"GLM-ASR ONNX model not found in {model_dir}. Run server/export_glm_onnx.py first.")
+        with open(os.path.join(model_dir, "glm_onnx_config.json"), "r") as f:
+            self.meta = json.load(f)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = onnx_config.get("num_threads", 0)
+        if provider == "cuda":
+            providers = ["CUDAExecutionProvider", "CPUExecutionProvider"]
+            self.device = "cuda"
+        else:
+            providers = ["CPUExecutionProvider"]
+            self.device = "cpu"
+        self.encoder = ort.InferenceSession(os.path.join(model_dir, "audio_encoder.onnx"), options, providers=providers)
+        self.decoder = ort.InferenceSession(os.path.join(model_dir, "decoder.onnx"), options, providers=providers)
+        self.encoder_input_types = {i.name: ORT_NUMPY_TYPES.get(i.type, np.float32) for i in self.encoder.get_inputs()}
+
+        self.processor = AutoProcessor.from_pretrained(model_dir)
+        # fp16 on disk and memory-mapped; rows are cast to fp32 as they're looked up
+        self.embed_tokens = np.load(os.path.join(model_dir, "embed_tokens.npy"), mmap_mode="r")
+        self.audio_token_id = self.meta["audio_token_id"]
+        self.eos_token_ids = set(self.meta["eos_token_ids"])
+        self.past_names = [i.name for i in self.decoder.get_inputs() if i.name.startswith("past_")]
+        self.present_names = [o.name for o in self.decoder.get_outputs() if o.name.startswith("present_")]
+
+        # IO buffers are allocated once and reused by every decode step
+        vocab_size = self.decoder.get_outputs()[0].shape[-1]
+        if not isinstance(vocab_size, int):
+            vocab_size = self.embed_tokens.shape[0]
+        self.logits = np.empty((1, vocab_size), dtype=np.float32)
+        self.attention_mask = np.ones((1, self.max_context), dtype=np.int64)
+        self.position_ids = np.arange(self.max_context, dtype=np.int64).reshape(1, -1)
+        self.step_embeds = np.empty((1, 1, self.meta["hidden_size"]), dtype=np.float32)
+        self.empty_past = np.zeros((1, self.meta["num_kv_heads"], 0, self.meta["head_dim"]), dtype=np.float32)
+
+    def encode_prompt(self, inputs):
+        input_ids = to_numpy(inputs["input_ids"]).astype(np.int64)[0]
+        encoder_inputs = {
+            name: to_numpy(inputs[name]).astype(dtype)
+            for name, dtype in self.encoder_input_types.items()
+        }
+        audio_embeds = self.encoder.run(None, encoder_inputs)[0]
+
+        embeds = self.embed_tokens[input_ids].astype(np.float32)
+        audio_positions = input_ids == self.audio_token_id
+        if audio_positions.sum() != audio_embeds.shape[0]:
+            raise ValueError(f"Audio token count {audio_positions.sum()} doesn't match encoder output {audio_embeds.shape[0]}")
+        embeds[audio_positions] = audio_embeds
+        return embeds[np.newaxis]
+
+    def greedy_decode(self, inputs_embeds, cancel_token=None):
+        binding = self.decoder.io_binding()
+        past_values = [ort.OrtValue.ortvalue_from_numpy(self.empty_past, self.device, 0) for _ in self.past_names]
+        embeds = inputs_embeds
+        total_len = inputs_embeds.shape[1]
+        generated = []
+
+        for _ in range(self.max_new_tokens):
+            if total_len > self.max_context:
+                print("GLM-ASR ONNX: context limit reached")
+                break
+            step_len = embeds.shape[1]
+            binding.clear_binding_inputs()
+            binding.clear_binding_outputs()
+            binding.bind_cpu_input("inputs_embeds", embeds)
+            binding.bind_cpu_input("attention_mask", self.attention_mask[:, :total_len])
+            binding.bind_cpu_input("position_ids", self.position_ids[:, total_len - step_len:total_len])
+            for name, value in zip(self.past_names, past_values):
+                binding.bind_ortvalue_input(name, value)
+            binding.bind_output("logits", "cpu", 0, np.float32, list(self.logits.shape), self.logits.ctypes.data)
+            # KV outputs stay on the execution device and are fed straight back in
+            for name in self.present_names:
+                binding.bind_output(name, self.device)
+            self.decoder.run_with_iobinding(binding)
+            past_values = binding.get_outputs()[1:]
+
+            token = int(self.logits[0].argmax())
+            if token in self.eos_token_ids:
+                break
+            generated.append(token)
+            if cancel_token is not None and cancel_token.is_cancelled():
+                break
+            self.step_embeds[0, 0] = self.embed_tokens[token]
+            embeds = self.step_embeds
+            total_len += 1
+        return generated
+
+    def transcribe(self, audio_data, sample_rate, system_prompt=None, history=None, **kwargs):
+        start_time = time.time()
+        cancel_token = kwargs.get("cancel_token")
+        if sample_rate != TARGET_SAMPLE_RATE:
+            audio_data = librosa.resample(audio_data, orig_sr=sample_rate, target_sr=TARGET_SAMPLE_RATE)
+
+        inputs = prepare_glm_inputs(self.processor, audio_data.astype(np.float32), system_prompt, history)
+        inputs_embeds = self.encode_prompt(inputs)
+        tokens = self.greedy_decode(inputs_embeds, cancel_token)
+        text = self.processor.tokenizer.decode(tokens, skip_special_tokens=True)
+
+        print(f"GLM-ASR ONNX took {time.time() - start_time:.2f}s ({len(tokens)} tokens)")
+        return text
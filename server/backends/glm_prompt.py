@@ -0,0 +1,19 @@
+TARGET_SAMPLE_RATE = 16000
+
+def prepare_glm_inputs(processor, audio, system_prompt=None, history=None):
+    """Builds GLM-ASR model inputs for 16 kHz float32 audio, shared by the torch and ONNX backends."""
+    if system_prompt or history:
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        if history:
+            messages.extend(history)
+
+        messages.append({"role": "user", "content": [{"type": "audio", "audio": audio}]})
+
+        for msg in messages:
+            if isinstance(msg["content"], str):
+                msg["content"] = [{"type": "text", "text": msg["content"]}]
+
+        return processor.apply_chat_template(messages, add_generation_prompt=True, tokenize=True, return_dict=True, sampling_rate=TARGET_SAMPLE_RATE)
+    return processor.apply_transcription_request(audio, sampling_rate=TARGET_SAMPLE_RATE)
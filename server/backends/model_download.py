@@ -0,0 +1,83 @@
+import os
+import shutil
+import hashlib
+import tarfile
+import tempfile
+import requests
+
+def sha256_file(path):
+    sha256_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for byte_block in iter(lambda: f.read(4096), b""):
+            sha256_hash.update(byte_block)
+    return sha256_hash.hexdigest()
+
+def extract_archive(archive_path, model_dir):
+    """Extracts a .tar.bz2 into model_dir, dropping the archive's top-level directory,
+    so model_dir may be named differently from the archive."""
+    os.makedirs(model_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".extract-", dir=os.path.dirname(os.path.abspath(model_dir)))
+    try:
+        with tarfile.open(archive_path, "r:bz2") as tar:
+            tar.extractall(path=staging)
+        entries = os.listdir(staging)
+        source = os.path.join(staging, entries[0]) if len(entries) == 1 and os.path.isdir(os.path.join(staging, entries[0])) else staging
+        for name in os.listdir(source):
+            target = os.path.join(model_dir, name)
+            # A re-download replaces the directories of the previous copy too
+            if os.path.isdir(target) and not os.path.islink(target):
+                shutil.rmtree(target)
+            os.replace(os.path.join(source, name), target)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+def ensure_model(model_dir, model_url, check_file, expected_sha256=None):
+    """Downloads and extracts a sherpa-onnx model archive unless check_file is present and valid.
+
+    The archive is expected to unpack into model_dir. Without an expected checksum the
+    digest of the downloaded file is recorded in <check_file>.sha256 and later starts
+    verify against that.
+    """
+    model_filename = os.path.basename(model_url)
+    model_path = os.path.join(model_dir, check_file)
+    pin_path = model_path + ".sha256"
+    pinned = expected_sha256 is not None
+    if not pinned and os.path.exists(pin_path):
+        with open(pin_path) as f:
+            expected_sha256 = f.read().strip() or None
+
+    if os.path.exists(model_path):
+        if expected_sha256 is None:
+            print(f"Model file {model_path} has no recorded checksum, it is not verified")
+            return
+        # Verify existing model
+        if sha256_file(model_path) == expected_sha256:
+            return
+        print(f"Model file {model_path} checksum mismatch. Re-downloading...")
+
+    print(f"Downloading model to {model_dir}...")
+    if not os.path.exists(model_dir):
+        os.makedirs(model_dir, exist_ok=True)
+
+    response = requests.get(model_url, stream=True)
+    if response.status_code != 200:
+        raise Exception(f"Failed to download model from {model_url}")
+    with open(model_filename, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=8192):
+            f.write(chunk)
+
+    print(f"Extracting {model_filename}...")
+    extract_archive(model_filename, model_dir)
+    os.remove(model_filename)
+
+    # Verify after download
+    digest = sha256_file(model_path)
+    if pinned and digest != expected_sha256:
+        print(f"Warning: Downloaded model checksum mismatch! Expected {expected_sha256}, got {digest}")
+        return
+    if expected_sha256 is not None and digest != expected_sha256:
+        print(f"Warning: {model_path} changed upstream, recorded {expected_sha256}, got {digest}")
+    if not pinned:
+        with open(pin_path, "w") as f:
+            f.write(digest + "\n")
+        print(f"Downloaded {model_path} (sha256 {digest}, recorded in {pin_path})")
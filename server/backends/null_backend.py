@@ -0,0 +1,12 @@
+from .base import ASRBackend
+
+
+class NullBackend(ASRBackend):
+    """Returns a fixed text without running a model, for measuring transport and server overhead."""
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        self.text = self.config.get("null", {}).get("text", "")
+
+    def transcribe(self, audio_data, sample_rate, system_prompt=None, history=None, **kwargs):
+        return self.text
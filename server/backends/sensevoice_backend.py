@@ -2,10 +2,27 @@ import time
 import numpy as np
 import sherpa_onnx
 import os
-import hashlib
-import requests
-import tarfile
 from .base import ASRBackend
+from .model_download import ensure_model
+
+def split_segments(audio, sample_rate, max_segment_s, search_s=2.0, frame_s=0.02):
+    """Returns (start, end) sample ranges of at most max_segment_s, cut at the quietest
+    frame in the last search_s before each limit so words aren't split."""
+    max_len = int(max_segment_s * sample_rate)
+    frame = int(frame_s * sample_rate)
+    segments = []
+    start = 0
+    while len(audio) - start > max_len:
+        search_start = max(start + frame, start + max_len - int(search_s * sample_rate))
+        window = audio[search_start:start + max_len]
+        count = len(window) // frame
+        energy = np.square(window[:count * frame].reshape(count, frame)).sum(axis=1)
+        cut = search_start + int(np.argmin(energy)) * frame + frame // 2
+        segments.append((start, cut))
+        start = cut
+    segments.append((start, len(audio)))
+    return segments
+
 
 class SenseVoiceBackend(ASRBackend):
     def __init__(self, config=None):
@@ -37,48 +54,11 @@ class SenseVoiceBackend(ASRBackend):
     def _ensure_model(self, model_dir):
         model_url = "https://github.com/k2-fsa/sherpa-onnx/releases/download/asr-models/sherpa-onnx-sense-voice-zh-en-ja-ko-yue-int8-2024-07-17.tar.bz2"
         expected_sha256 = "c71f0ce00bec95b07744e116345e33d8cbbe08cef896382cf907bf4b51a2cd51"
-        model_filename = os.path.basename(model_url)
-        model_path = os.path.join(model_dir, "model.int8.onnx")
-
-        if os.path.exists(model_path):
-            # Verify existing model
-            sha256_hash = hashlib.sha256()
-            with open(model_path, "rb") as f:
-                for byte_block in iter(lambda: f.read(4096), b""):
-                    sha256_hash.update(byte_block)
-            if sha256_hash.hexdigest() == expected_sha256:
-                return
-            else:
-                print(f"Model file {model_path} checksum mismatch. Re-downloading...")
-
-        print(f"Downloading SenseVoice model to {model_dir}...")
-        if not os.path.exists(model_dir):
-            os.makedirs(model_dir, exist_ok=True)
-
-        response = requests.get(model_url, stream=True)
-        if response.status_code == 200:
-            with open(model_filename, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            
-            print(f"Extracting {model_filename}...")
-            with tarfile.open(model_filename, "r:bz2") as tar:
-                tar.extractall(path=".")
-            
-            os.remove(model_filename)
-            
-            # Verify after download
-            sha256_hash = hashlib.sha256()
-            with open(model_path, "rb") as f:
-                for byte_block in iter(lambda: f.read(4096), b""):
-                    sha256_hash.update(byte_block)
-            if sha256_hash.hexdigest() != expected_sha256:
-                print(f"Warning: Downloaded model checksum mismatch! Expected {expected_sha256}, got {sha256_hash.hexdigest()}")
-        else:
-            raise Exception(f"Failed to download model from {model_url}")
+        ensure_model(model_dir, model_url, "model.int8.onnx", expected_sha256)
 
     def transcribe(self, audio_data, sample_rate, system_prompt=None, history=None, **kwargs):
         start_time = time.time()
+        cancel_token = kwargs.get("cancel_token")
         
         language = kwargs.get("language", self.language)
 
@@ -90,16 +70,17 @@ class SenseVoiceBackend(ASRBackend):
             audio_data = librosa.resample(audio_data, orig_sr=sample_rate, target_sr=16000)
             sample_rate = 16000
 
-        stream = self.recognizer.create_stream()
-        stream.accept_waveform(sample_rate, audio_data)
-        # If language is overridden in kwargs, we might need a different recognizer or 
-        # just pass it if the recognizer supports it per-stream.
-        # sherpa-onnx OfflineRecognizer.from_sense_voice doesn't seem to support per-stream language easily if it's fixed at init.
-        # However, SenseVoice is often used with 'auto'.
-        
-        self.recognizer.decode_stream(stream)
-        
-        text = stream.result.text
+        # A single sherpa-onnx decode can't be interrupted, so long audio is decoded in
+        # segments with a cancellation check before each one
+        texts = []
+        for start, end in split_segments(audio_data, sample_rate, self.config.get("max_segment_s", 20)):
+            if cancel_token is not None and cancel_token.is_cancelled():
+                break
+            stream = self.recognizer.create_stream()
+            stream.accept_waveform(sample_rate, audio_data[start:end])
+            self.recognizer.decode_stream(stream)
+            texts.append(stream.result.text)
+        text = "".join(texts)
         
         duration = time.time() - start_time
         print(f"SenseVoice took {duration:.2f}s")
@@ -0,0 +1,13 @@
+import torch
+from transformers import StoppingCriteria
+
+
+class CancelStoppingCriteria(StoppingCriteria):
+    """Stops generation as soon as the request's cancellation token fires."""
+
+    def __init__(self, cancel_token):
+        self.cancel_token = cancel_token
+
+    def __call__(self, input_ids, scores, **kwargs):
+        cancelled = self.cancel_token.is_cancelled()
+        return torch.full((input_ids.shape[0],), cancelled, dtype=torch.bool, device=input_ids.device)
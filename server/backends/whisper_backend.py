@@ -1,16 +1,20 @@
 import os
 import json
 import time
+from collections import OrderedDict
 import torch
 import librosa
-from transformers import pipeline, logging as transformers_logging
-from .base import ASRBackend
+from transformers import pipeline, logging as transformers_logging, StoppingCriteriaList, TextIteratorStreamer
+from .base import ASRBackend, start_stream_generate
+from .stopping import CancelStoppingCriteria
 
 # Suppress transformers logging
 transformers_logging.set_verbosity_error()
 
 MODEL_ID = "openai/whisper-large-v3"
 TARGET_SAMPLE_RATE = 16000
+# Whisper's window; longer audio is not streamed, see transcribe_stream()
+MAX_STREAM_SECONDS = 30
 
 class WhisperBackend(ASRBackend):
     def __init__(self, config=None):
@@ -21,6 +25,24 @@ class WhisperBackend(ASRBackend):
         self.device = whisper_config.get("device", "cuda:0" if torch.cuda.is_available() else "cpu")
         self.torch_dtype = torch.float16 if "cuda" in self.device else torch.float32
 
+        self.load()
+
+        language = whisper_config.get("language", "yue")
+        
+        self.generate_kwargs = {
+            "task": whisper_config.get("task", "translate"),
+        }
+        
+        if language and language != "auto":
+            self.generate_kwargs["language"] = language
+
+        print(self.generate_kwargs)
+
+        # Tokenized prompt IDs already on the device, keyed by system prompt
+        self.prompt_cache = OrderedDict()
+        self.prompt_cache_size = whisper_config.get("prompt_cache_size", 16)
+
+    def load(self):
         from transformers import GenerationConfig
         
         self.pipe = pipeline(
@@ -53,19 +75,42 @@ class WhisperBackend(ASRBackend):
         
         self.pipe.model.generation_config.is_multilingual = True
 
-        language = whisper_config.get("language", "yue")
-        
-        self.generate_kwargs = {
-            "task": whisper_config.get("task", "translate"),
-        }
-        
-        if language and language != "auto":
-            self.generate_kwargs["language"] = language
+    def offload(self, drop=False):
+        on_gpu = "cuda" in self.device
+        if not on_gpu and not drop:
+            return False
+        # Cached prompt IDs live on the model's device
+        self.prompt_cache.clear()
+        if drop:
+            self.pipe = None
+        else:
+            self.pipe.model.to("cpu")
+        self.offloaded = "dropped" if drop else "cpu"
+        if on_gpu:
+            torch.cuda.empty_cache()
+        return True
 
-        print(self.generate_kwargs)
+    def reload(self):
+        if self.offloaded == "dropped":
+            self.load()
+        else:
+            self.pipe.model.to(self.device)
+        self.offloaded = None
 
-    def transcribe(self, audio_data, sample_rate, system_prompt=None, history=None, **kwargs):
-        start_time = time.time()
+    def get_prompt_ids(self, system_prompt):
+        prompt_ids = self.prompt_cache.get(system_prompt)
+        if prompt_ids is None:
+            prompt_ids = self.pipe.tokenizer.get_prompt_ids(system_prompt, return_tensors="pt").to(self.device)
+            if self.prompt_cache_size:
+                self.prompt_cache[system_prompt] = prompt_ids
+                if len(self.prompt_cache) > self.prompt_cache_size:
+                    self.prompt_cache.popitem(last=False)
+        else:
+            self.prompt_cache.move_to_end(system_prompt)
+        return prompt_ids
+
+    def prepare(self, audio_data, sample_rate, system_prompt, kwargs):
+        cancel_token = kwargs.pop("cancel_token", None)
         
         if sample_rate != TARGET_SAMPLE_RATE:
             audio_data = librosa.resample(audio_data, orig_sr=sample_rate, target_sr=TARGET_SAMPLE_RATE)
@@ -87,10 +132,45 @@ class WhisperBackend(ASRBackend):
         kwargs["generation_config"] = self.pipe.model.generation_config
         
         if system_prompt:
-            kwargs["prompt_ids"] = self.pipe.tokenizer.get_prompt_ids(system_prompt, return_tensors="pt").to(self.device)
+            kwargs["prompt_ids"] = self.get_prompt_ids(system_prompt)
+
+        if cancel_token is not None:
+            kwargs["stopping_criteria"] = StoppingCriteriaList([CancelStoppingCriteria(cancel_token)])
+        return audio_data, kwargs
+
+    def transcribe(self, audio_data, sample_rate, system_prompt=None, history=None, **kwargs):
+        start_time = time.time()
+        audio_data, kwargs = self.prepare(audio_data, sample_rate, system_prompt, kwargs)
 
         result = self.pipe(audio_data, generate_kwargs=kwargs)
         text = result["text"].strip()
         
         print(f"Whisper-v3-large took {time.time() - start_time:.2f}s")
         return text
+
+    def transcribe_stream(self, audio_data, sample_rate, system_prompt=None, history=None, **kwargs):
+        if len(audio_data) / sample_rate > MAX_STREAM_SECONDS:
+            # Longer audio goes through long-form generation, which calls generate() once
+            # per 30 s window, and each call ends the streamer. The stream would stop
+            # after the first window, so such requests are answered in one piece.
+            yield from super().transcribe_stream(audio_data, sample_rate, system_prompt, history, **kwargs)
+            return
+        start_time = time.time()
+        audio_data, kwargs = self.prepare(audio_data, sample_rate, system_prompt, kwargs)
+        # skip_prompt drops the decoder prompt (prompt_ids and task tokens) that generate() emits first
+        kwargs["streamer"] = TextIteratorStreamer(self.pipe.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors = []
+        generate = lambda audio, generate_kwargs: self.pipe(audio, generate_kwargs=generate_kwargs)
+        thread = start_stream_generate(generate, audio_data, kwargs, errors)
+        started = False
+        for piece in kwargs["streamer"]:
+            # Match transcribe(), which strips the result
+            if not started:
+                piece = piece.lstrip()
+                started = bool(piece)
+            if piece:
+                yield piece
+        thread.join()
+        if errors:
+            raise errors[0]
+        print(f"Whisper-v3-large took {time.time() - start_time:.2f}s")
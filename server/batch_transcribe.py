@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from audio import load_audio
+from client_modules import load_client_module
+from backends import BACKEND_TYPES, create_backend
+
+# Post-processing is shared with the client, which applies it to live dictation
+postprocess = load_client_module("postprocess")
+backend_config_key, postprocess_text = postprocess.backend_config_key, postprocess.postprocess_text
+
+# Offline transcription of a directory or manifest of recordings:
+#
+#   uv run server/batch_transcribe.py recordings/ --output results.jsonl --workers 4
+#
+# Results are appended to the JSONL output as each file finishes, and files already
+# present there are skipped, so an interrupted run resumes where it stopped.
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".ogg", ".mp3", ".m4a", ".opus")
+TARGET_SAMPLE_RATE = 16000
+
+_worker = {}
+
+
+def list_inputs(source):
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            for name in files:
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    paths.append(os.path.join(root, name))
+        return sorted(paths)
+
+    # Manifest: one path per line, or JSONL objects with a "path" field
+    paths = []
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            path = json.loads(line)["path"] if line.startswith("{") else line
+            paths.append(path if os.path.isabs(path) else os.path.join(base_dir, path))
+    return paths
+
+
+def load_completed(output_path):
+    completed = set()
+    if os.path.exists(output_path):
+        with open(output_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A partial last line from an interrupted run
+                    continue
+                if record.get("error") is None:
+                    completed.add(record["path"])
+    return completed
+
+
+def init_worker(backend_type, config):
+    _worker["backend"] = create_backend(backend_type, config=config)
+    _worker["config"] = config
+    _worker["backend_config"] = config.get(backend_config_key(backend_type), {})
+
+
+def transcribe_file(path):
+    backend_config = _worker["backend_config"]
+    kwargs = {k: v for k, v in backend_config.items() if k not in ("system_prompt", "extra_replace") and v is not None}
+    start_time = time.time()
+    try:
+        audio = load_audio(path, TARGET_SAMPLE_RATE)
+        raw_text = _worker["backend"].transcribe(audio, TARGET_SAMPLE_RATE, system_prompt=backend_config.get("system_prompt"), **kwargs)
+        text = postprocess_text(raw_text, _worker["config"], backend_config)
+        return {"path": path, "text": text, "raw_text": raw_text, "duration_s": len(audio) / TARGET_SAMPLE_RATE, "latency_s": time.time() - start_time, "error": None}
+    except Exception as e:
+        return {"path": path, "text": "", "raw_text": "", "duration_s": 0.0, "latency_s": time.time() - start_time, "error": str(e)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk offline transcription")
+    parser.add_argument("source", help="Directory of audio files, or a manifest (one path per line or JSONL with \"path\")")
+    parser.add_argument("--output", default="transcripts.jsonl", help="JSONL output file (appended to, used for resume)")
+    parser.add_argument("--backend", type=str, default="sensevoice", choices=BACKEND_TYPES)
+    parser.add_argument("--workers", type=int, default=1, help="Processes, each with its own backend instance (use 1 for a single GPU)")
+    parser.add_argument("--config", type=str, help="Path to config.json (defaults to client/config.json)")
+    args = parser.parse_args()
+
+    config_path = args.config or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "client", "config.json")
+    config = {}
+    if os.path.exists(config_path):
+        with open(config_path, "r") as f:
+            config = json.load(f)
+
+    paths = list_inputs(args.source)
+    completed = load_completed(args.output)
+    pending = [p for p in paths if p not in completed]
+    print(f"{len(paths)} files, {len(completed)} already done, {len(pending)} to transcribe")
+    if not pending:
+        return
+
+    start_time = time.time()
+    done = failed = 0
+    audio_seconds = 0.0
+    # spawn so CUDA-backed backends initialize cleanly in each worker
+    context = multiprocessing.get_context("spawn")
+    with open(args.output, "a", encoding="utf-8") as out, \
+            ProcessPoolExecutor(max_workers=args.workers, mp_context=context, initializer=init_worker, initargs=(args.backend, config)) as pool:
+        futures = [pool.submit(transcribe_file, path) for path in pending]
+        for future in as_completed(futures):
+            record = future.result()
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            if record["error"]:
+                failed += 1
+                print(f"Failed {record['path']}: {record['error']}")
+            else:
+                done += 1
+                audio_seconds += record["duration_s"]
+            elapsed = time.time() - start_time
+            print(f"[{done + failed}/{len(pending)}] {os.path.basename(record['path'])} ({record['latency_s']:.1f}s) "
+                  f"{(done + failed) / elapsed * 3600:.0f} files/h")
+
+    elapsed = time.time() - start_time
+    print(f"Finished {done} files ({failed} failed) in {elapsed:.1f}s: "
+          f"{done / elapsed * 3600:.0f} files/hour, {audio_seconds / elapsed:.1f}x real time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import select
+import socket
+import threading
+import time
+
+
+class CancelledError(Exception):
+    pass
+
+
+class CancellationToken:
+    def __init__(self, request_id=None, timeout=None):
+        self.request_id = request_id
+        self.reason = None
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self._event = threading.Event()
+
+    def cancel(self, reason="cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def is_cancelled(self):
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() > self.deadline:
+            self.cancel("deadline exceeded")
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self.is_cancelled():
+            raise CancelledError(self.reason)
+
+
+class CancellationRegistry:
+    """Tracks the tokens of in-flight requests so they can be cancelled by request ID."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = {}
+
+    def register(self, request_id, timeout=None):
+        token = CancellationToken(request_id, timeout)
+        if request_id:
+            with self._lock:
+                self._tokens[request_id] = token
+        return token
+
+    def unregister(self, token):
+        if token.request_id:
+            with self._lock:
+                if self._tokens.get(token.request_id) is token:
+                    del self._tokens[token.request_id]
+
+    def cancel(self, request_id, reason="cancelled"):
+        with self._lock:
+            token = self._tokens.get(request_id)
+        if token is None:
+            return False
+        token.cancel(reason)
+        return True
+
+
+def watch_disconnect(connection, cancel_token, done_event):
+    """Cancels the token if the client closes the connection before done_event is set.
+
+    The request has been fully read, so the socket only becomes readable again if
+    the client closes the connection.
+    """
+    while not done_event.is_set():
+        try:
+            readable, _, _ = select.select([connection], [], [], 0.5)
+            if readable and not connection.recv(1, socket.MSG_PEEK):
+                cancel_token.cancel("client disconnected")
+                return
+        except (OSError, ValueError):
+            cancel_token.cancel("client disconnected")
+            return
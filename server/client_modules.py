@@ -0,0 +1,25 @@
+import os
+import sys
+import importlib.util
+
+CLIENT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "client")
+
+
+def load_client_module(name):
+    """Imports client/<name>.py by path.
+
+    Putting client/ on sys.path would let every client module shadow a server module
+    of the same name, so only the requested module is loaded, under its own name.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.spec_from_file_location(name, os.path.join(CLIENT_DIR, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return module
@@ -0,0 +1,134 @@
+import os
+import json
+import argparse
+import numpy as np
+import torch
+from transformers import AutoModelForSeq2SeqLM, AutoProcessor, DynamicCache
+
+# Exports GLM-ASR-Nano into an audio encoder graph, a KV-cached decoder graph and a
+# token embedding table for the glm-onnx backend:
+#
+#   uv run server/export_glm_onnx.py --output glm-asr-nano-onnx
+
+MODEL_ID = "zai-org/GLM-ASR-Nano-2512"
+
+
+def cache_layer(cache, layer_idx):
+    # DynamicCache keeps per-layer objects in newer transformers, flat lists in older ones
+    if hasattr(cache, "layers"):
+        return cache.layers[layer_idx].keys, cache.layers[layer_idx].values
+    return cache.key_cache[layer_idx], cache.value_cache[layer_idx]
+
+
+class AudioEncoder(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_features, input_features_mask):
+        features = self.model.get_audio_features(input_features, input_features_mask)
+        if not isinstance(features, torch.Tensor):
+            features = features.pooler_output if getattr(features, "pooler_output", None) is not None else features[0]
+        return features.reshape(-1, features.shape[-1])
+
+
+class Decoder(torch.nn.Module):
+    def __init__(self, model, num_layers):
+        super().__init__()
+        self.decoder = model.get_decoder()
+        self.lm_head = model.get_output_embeddings()
+        self.num_layers = num_layers
+
+    def forward(self, inputs_embeds, attention_mask, position_ids, *past):
+        cache = DynamicCache()
+        for i in range(self.num_layers):
+            cache.update(past[2 * i], past[2 * i + 1], i)
+        outputs = self.decoder(inputs_embeds=inputs_embeds, attention_mask=attention_mask, position_ids=position_ids, past_key_values=cache, use_cache=True)
+        # Only the last position is needed for greedy decoding
+        logits = self.lm_head(outputs.last_hidden_state[:, -1, :])
+        present = []
+        for i in range(self.num_layers):
+            present.extend(cache_layer(outputs.past_key_values, i))
+        return (logits, *present)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export GLM-ASR to ONNX")
+    parser.add_argument("--output", type=str, default="glm-asr-nano-onnx", help="Output directory")
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+    os.makedirs(args.output, exist_ok=True)
+
+    print(f"Loading {MODEL_ID}...")
+    processor = AutoProcessor.from_pretrained(MODEL_ID)
+    model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_ID, dtype=torch.float32, device_map="cpu")
+    model.eval()
+    processor.save_pretrained(args.output)
+
+    text_config = model.config.get_text_config()
+    num_layers = text_config.num_hidden_layers
+    num_kv_heads = getattr(text_config, "num_key_value_heads", text_config.num_attention_heads)
+    head_dim = getattr(text_config, "head_dim", None) or text_config.hidden_size // text_config.num_attention_heads
+    hidden_size = text_config.hidden_size
+
+    # Dummy inputs come from a real request so the encoder sees valid shapes
+    sample = processor.apply_transcription_request(np.zeros(16000, dtype=np.float32), sampling_rate=16000)
+    input_features = sample["input_features"].to(torch.float32)
+    input_features_mask = sample["input_features_mask"]
+
+    print("Exporting audio encoder...")
+    torch.onnx.export(
+        AudioEncoder(model), (input_features, input_features_mask), os.path.join(args.output, "audio_encoder.onnx"),
+        input_names=["input_features", "input_features_mask"], output_names=["audio_embeds"],
+        dynamic_axes={"input_features": {0: "batch", 2: "frames"}, "input_features_mask": {0: "batch", 1: "frames"}, "audio_embeds": {0: "audio_tokens"}},
+        opset_version=args.opset, dynamo=False,
+    )
+
+    print("Exporting decoder...")
+    seq_len, past_len = 3, 2
+    past = []
+    past_names, present_names, dynamic_axes = [], [], {
+        "inputs_embeds": {1: "seq"}, "attention_mask": {1: "total_seq"}, "position_ids": {1: "seq"},
+    }
+    for i in range(num_layers):
+        for kind in ("key", "value"):
+            past.append(torch.zeros(1, num_kv_heads, past_len, head_dim))
+            past_names.append(f"past_{kind}_{i}")
+            present_names.append(f"present_{kind}_{i}")
+            dynamic_axes[f"past_{kind}_{i}"] = {2: "past_seq"}
+            dynamic_axes[f"present_{kind}_{i}"] = {2: "total_seq"}
+    dummy = (
+        torch.zeros(1, seq_len, hidden_size),
+        torch.ones(1, past_len + seq_len, dtype=torch.int64),
+        torch.arange(past_len, past_len + seq_len).unsqueeze(0),
+        *past,
+    )
+    torch.onnx.export(
+        Decoder(model, num_layers), dummy, os.path.join(args.output, "decoder.onnx"),
+        input_names=["inputs_embeds", "attention_mask", "position_ids", *past_names],
+        output_names=["logits", *present_names], dynamic_axes=dynamic_axes,
+        opset_version=args.opset, dynamo=False,
+    )
+
+    print("Saving token embeddings...")
+    embeddings = model.get_input_embeddings().weight.detach().to(torch.float16).numpy()
+    np.save(os.path.join(args.output, "embed_tokens.npy"), embeddings)
+
+    eos_token_id = model.generation_config.eos_token_id
+    audio_token_id = getattr(model.config, "audio_token_id", None)
+    if audio_token_id is None:
+        audio_token_id = processor.tokenizer.convert_tokens_to_ids(processor.audio_token)
+    with open(os.path.join(args.output, "glm_onnx_config.json"), "w") as f:
+        json.dump({
+            "num_layers": num_layers,
+            "num_kv_heads": num_kv_heads,
+            "head_dim": head_dim,
+            "hidden_size": hidden_size,
+            "audio_token_id": audio_token_id,
+            "eos_token_ids": eos_token_id if isinstance(eos_token_id, list) else [eos_token_id],
+        }, f, indent=4)
+    print(f"Export finished: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import time
+import threading
+from contextlib import contextmanager
+
+
+class IdleManager:
+    """Offloads the backend's model after idle_s without requests and reloads it on demand.
+
+    The lock is held for every inference, offload and reload, so the model is never
+    moved while in use. prewarm() starts the reload in the background, which lets
+    it overlap with the user still speaking when the client sends it on key press.
+    Requests are counted as warm (model resident on arrival), prewarmed (arrived
+    while a prewarm reload was still running) or cold (had to reload themselves).
+    """
+
+    def __init__(self, backend, idle_s=None, mode="cpu", metrics=None):
+        self.backend = backend
+        self.idle_s = idle_s
+        self.drop = mode == "drop"
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.loaded = True
+        self.prewarming = False
+        self.last_used = time.time()
+        self.counts = {"warm": 0, "prewarmed": 0, "cold": 0, "offloads": 0, "reloads": 0}
+        if idle_s:
+            threading.Thread(target=self._idle_loop, daemon=True, name="idle-offload").start()
+
+    def _idle_loop(self):
+        while True:
+            time.sleep(min(self.idle_s, 5))
+            if self.loaded and time.time() - self.last_used >= self.idle_s:
+                with self.lock:
+                    if self.loaded and time.time() - self.last_used >= self.idle_s:
+                        if not self._offload():
+                            print("Backend has nothing to offload, idle offload disabled")
+                            return
+
+    def _offload(self):
+        start_time = time.time()
+        try:
+            if not self.backend.offload(drop=self.drop):
+                return False
+        except Exception as e:
+            print(f"Offload failed: {e}")
+            self.last_used = time.time()
+            return True
+        self.loaded = False
+        elapsed = time.time() - start_time
+        self.counts["offloads"] += 1
+        if self.metrics:
+            self.metrics.observe("offload_s", elapsed)
+        print(f"Idle for {self.idle_s}s, {'dropped' if self.drop else 'offloaded'} model in {elapsed:.2f}s")
+        return True
+
+    def _reload(self, reason):
+        start_time = time.time()
+        self.backend.reload()
+        self.loaded = True
+        elapsed = time.time() - start_time
+        self.counts["reloads"] += 1
+        if self.metrics:
+            self.metrics.observe("reload_s", elapsed)
+        print(f"Reloaded model in {elapsed:.2f}s ({reason})")
+
+    def prewarm(self):
+        """Marks the model as about to be used and starts reloading it if it was offloaded."""
+        self.last_used = time.time()
+        if self.metrics:
+            self.metrics.increment("prewarms")
+        if not self.loaded and not self.prewarming:
+            # Set before the thread runs, so requests arriving while it waits for the
+            # lock already count as prewarmed
+            self.prewarming = True
+            threading.Thread(target=self._prewarm, daemon=True).start()
+
+    def _prewarm(self):
+        with self.lock:
+            try:
+                if not self.loaded:
+                    self._reload("prewarm")
+            except Exception as e:
+                print(f"Prewarm failed: {e}")
+            finally:
+                self.prewarming = False
+
+    @contextmanager
+    def use(self):
+        """Holds the model loaded for one inference. Must wrap the backend call."""
+        loaded_on_arrival = self.loaded
+        prewarming_on_arrival = self.prewarming
+        wait_start = self.last_used = time.time()
+        with self.lock:
+            if not self.loaded:
+                kind = "cold"
+                self._reload("request")
+            elif loaded_on_arrival:
+                kind = "warm"
+            else:
+                kind = "prewarmed" if prewarming_on_arrival else "cold"
+            if kind != "warm" and self.metrics:
+                self.metrics.observe("reload_wait_s", time.time() - wait_start)
+            self.counts[kind] += 1
+            if self.metrics:
+                self.metrics.increment(f"{kind}_requests")
+            try:
+                yield
+            finally:
+                self.last_used = time.time()
+
+    def status(self):
+        served = self.counts["warm"] + self.counts["prewarmed"] + self.counts["cold"]
+        return {
+            "loaded": self.loaded,
+            "idle_offload_s": self.idle_s,
+            "mode": "drop" if self.drop else "cpu",
+            "idle_for_s": round(time.time() - self.last_used, 1),
+            "warm_hit_rate": self.counts["warm"] / served if served else None,
+            **self.counts,
+        }
@@ -0,0 +1,39 @@
+import threading
+from collections import defaultdict
+
+
+class Metrics:
+    """Thread-safe counters and timing summaries, grouped by tenant."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(lambda: defaultdict(int))
+        self._timings = defaultdict(dict)
+
+    def increment(self, name, tenant="_all", amount=1):
+        with self._lock:
+            self._counters[tenant][name] += amount
+
+    def observe(self, name, value, tenant="_all"):
+        with self._lock:
+            stat = self._timings[tenant].get(name)
+            if stat is None:
+                stat = self._timings[tenant][name] = {"count": 0, "sum": 0.0, "max": 0.0}
+            stat["count"] += 1
+            stat["sum"] += value
+            stat["max"] = max(stat["max"], value)
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for tenant in set(self._counters) | set(self._timings):
+                entry = dict(self._counters.get(tenant, {}))
+                for name, stat in self._timings.get(tenant, {}).items():
+                    entry[name] = {
+                        "count": stat["count"],
+                        "avg": stat["sum"] / stat["count"] if stat["count"] else 0.0,
+                        "max": stat["max"],
+                        "sum": stat["sum"],
+                    }
+                result[tenant] = entry
+            return result
@@ -0,0 +1,313 @@
+import io
+import os
+import re
+import sys
+import time
+import uuid
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+from backends.base import helper_thread_context
+
+PROFILE_MODES = ("cprofile", "torch", "tracemalloc")
+
+
+def safe_name(value):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", value or uuid.uuid4().hex[:12])
+
+
+class ProfileSession:
+    """Profiling of the next `requests` requests or until `seconds` have passed."""
+
+    def __init__(self, modes, requests=None, seconds=None):
+        self.id = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        self.modes = modes
+        self.remaining = requests if requests or seconds else 1
+        self.deadline = time.time() + seconds if seconds else None
+        self.profiled = 0
+
+    def is_active(self):
+        if self.remaining is not None and self.remaining <= 0:
+            return False
+        return self.deadline is None or time.time() < self.deadline
+
+    def info(self):
+        return {"id": self.id, "modes": list(self.modes), "remaining_requests": self.remaining,
+                "deadline": self.deadline, "profiled": self.profiled, "active": self.is_active()}
+
+
+class StackSampler:
+    """Samples the stacks of one request's threads from a background thread.
+
+    Used to keep a cheap profile of every inference so slow requests can be saved
+    after the fact as collapsed stacks (flamegraph.pl / speedscope input).
+    """
+
+    def __init__(self, interval_s=0.005):
+        self.interval_s = interval_s
+        self.thread_ids = set()
+        self.stacks = Counter()
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+        threading.Thread(target=self._loop, daemon=True, name="stack-sampler").start()
+
+    def begin(self, thread_id):
+        with self.lock:
+            self.thread_ids = {thread_id}
+            self.stacks = Counter()
+        self.wake.set()
+
+    def end(self):
+        with self.lock:
+            self.thread_ids = set()
+            stacks, self.stacks = self.stacks, Counter()
+        self.wake.clear()
+        return stacks
+
+    @contextmanager
+    def follow(self):
+        """Also samples the calling thread until the block exits."""
+        thread_id = threading.get_ident()
+        with self.lock:
+            self.thread_ids.add(thread_id)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.thread_ids.discard(thread_id)
+
+    def _loop(self):
+        while True:
+            self.wake.wait()
+            time.sleep(self.interval_s)
+            with self.lock:
+                if not self.thread_ids:
+                    continue
+                frames = sys._current_frames()
+                for thread_id in self.thread_ids:
+                    frame = frames.get(thread_id)
+                    names = []
+                    while frame is not None:
+                        code = frame.f_code
+                        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    if names:
+                        self.stacks[";".join(reversed(names))] += 1
+
+
+class Profiler:
+    """On-demand profiling of inference inside the running server.
+
+    A session started through /debug/profile wraps the next requests in cProfile,
+    torch.profiler and/or tracemalloc and writes one set of artifacts per request
+    under directory/<session id>/. With slow_ms set, every request is also stack
+    sampled and the samples of requests slower than that are kept under directory/slow/.
+    """
+
+    def __init__(self, directory, slow_ms=None, max_slow_captures=50, metrics=None):
+        self.directory = os.path.expanduser(directory)
+        self.slow_s = slow_ms / 1000 if slow_ms else None
+        self.max_slow_captures = max_slow_captures
+        self.metrics = metrics
+        self.session = None
+        # tracemalloc started by a session stays on until the last request that traces
+        # with it has finished, even if a later session has replaced that session
+        self.owns_tracemalloc = False
+        self.tracing_requests = 0
+        self.lock = threading.Lock()
+        self.sampler = StackSampler() if self.slow_s else None
+
+    def start(self, modes, requests=None, seconds=None):
+        unknown = [mode for mode in modes if mode not in PROFILE_MODES]
+        if unknown:
+            raise ValueError(f"unknown profile modes: {', '.join(unknown)}")
+        if "torch" in modes and "torch" not in sys.modules:
+            raise ValueError("torch.profiler needs a torch backend (glm, whisper)")
+        with self.lock:
+            if self.session is not None and self.session.is_active():
+                raise RuntimeError(f"profile session {self.session.id} is still running")
+            self._finish()
+            self.session = ProfileSession(modes, requests, seconds)
+            if "tracemalloc" in modes and not tracemalloc.is_tracing():
+                # Tracing slows every allocation in the process, so it only runs during the session
+                tracemalloc.start(25)
+                self.owns_tracemalloc = True
+            os.makedirs(os.path.join(self.directory, self.session.id), exist_ok=True)
+            print(f"Profiling session {self.session.id} started: {', '.join(modes)}")
+            return self.session.info()
+
+    def _finish(self):
+        # A request still being profiled needs tracemalloc until it ends
+        if not self.owns_tracemalloc or self.tracing_requests:
+            return
+        session = self.session
+        if session is not None and session.is_active() and "tracemalloc" in session.modes:
+            return
+        tracemalloc.stop()
+        self.owns_tracemalloc = False
+
+    def _claim(self):
+        with self.lock:
+            session = self.session
+            if session is None:
+                return None
+            if not session.is_active():
+                self._finish()
+                return None
+            if session.remaining is not None:
+                session.remaining -= 1
+            session.profiled += 1
+            if "tracemalloc" in session.modes:
+                self.tracing_requests += 1
+            return session
+
+    def _release(self, session):
+        with self.lock:
+            if "tracemalloc" in session.modes:
+                self.tracing_requests -= 1
+            self._finish()
+
+    def status(self):
+        with self.lock:
+            session = self.session
+            self._finish()
+            return {"session": session.info() if session else None, "slow_ms": self.slow_s * 1000 if self.slow_s else None,
+                    "artifacts": self.artifacts()}
+
+    def artifacts(self):
+        names = []
+        if os.path.isdir(self.directory):
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    names.append(os.path.relpath(os.path.join(root, name), self.directory))
+        return sorted(names)
+
+    def artifact_path(self, name):
+        """Returns the path of an artifact, or None if name is not one of them."""
+        path = os.path.realpath(os.path.join(self.directory, name))
+        if not path.startswith(os.path.realpath(self.directory) + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    @contextmanager
+    def request(self, request_id):
+        """Wraps one inference. Must run on the thread that starts the inference.
+
+        cProfile (sys.monitoring since Python 3.12), torch.profiler and tracemalloc
+        already see every thread. The stack sampler follows the helper threads that
+        streaming backends start through backends.base.start_stream_generate().
+        """
+        session = self._claim()
+        if session is None and self.sampler is None:
+            yield
+            return
+        request_name = safe_name(request_id)
+        prefix = os.path.join(self.directory, session.id, request_name) if session else None
+        collectors = []
+        if session:
+            if "cprofile" in session.modes:
+                collectors.append(CProfileCollector(prefix))
+            if "torch" in session.modes:
+                collectors.append(TorchCollector(prefix))
+            if "tracemalloc" in session.modes:
+                collectors.append(TracemallocCollector(prefix))
+            if self.metrics:
+                self.metrics.increment("profiled_requests")
+        for collector in collectors:
+            collector.start()
+        follow = None
+        if self.sampler:
+            self.sampler.begin(threading.get_ident())
+            follow = helper_thread_context.set(self.sampler.follow)
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start_time
+            if follow is not None:
+                helper_thread_context.reset(follow)
+            stacks = self.sampler.end() if self.sampler else None
+            for collector in reversed(collectors):
+                try:
+                    collector.stop()
+                except Exception as e:
+                    print(f"Failed to write {type(collector).__name__} profile for {request_name}: {e}")
+            if session:
+                self._release(session)
+            if stacks and elapsed >= self.slow_s:
+                self.save_slow(request_name, elapsed, stacks)
+
+    def save_slow(self, request_name, elapsed, stacks):
+        slow_dir = os.path.join(self.directory, "slow")
+        os.makedirs(slow_dir, exist_ok=True)
+        path = os.path.join(slow_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{request_name}-{elapsed * 1000:.0f}ms.folded")
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"Slow request {request_name} ({elapsed:.2f}s), stack samples saved to {path}")
+        if self.metrics:
+            self.metrics.increment("slow_captures")
+        captures = sorted(os.listdir(slow_dir))
+        for name in captures[:-self.max_slow_captures]:
+            os.remove(os.path.join(slow_dir, name))
+
+
+class CProfileCollector:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.profile.dump_stats(self.prefix + ".prof")
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats("cumulative").print_stats(60)
+        with open(self.prefix + ".cprofile.txt", "w") as f:
+            f.write(out.getvalue())
+
+
+class TorchCollector:
+    def __init__(self, prefix):
+        import torch
+        self.prefix = prefix
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        self.cuda = torch.cuda.is_available()
+        if self.cuda:
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self.profile = torch.profiler.profile(activities=activities, record_shapes=True)
+
+    def start(self):
+        self.profile.__enter__()
+
+    def stop(self):
+        self.profile.__exit__(None, None, None)
+        self.profile.export_chrome_trace(self.prefix + ".torch.json")
+        sort_by = "self_cuda_time_total" if self.cuda else "self_cpu_time_total"
+        with open(self.prefix + ".torch.txt", "w") as f:
+            f.write(self.profile.key_averages().table(sort_by=sort_by, row_limit=50))
+
+
+class TracemallocCollector:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.before = None
+
+    def start(self):
+        tracemalloc.reset_peak()
+        self.before = tracemalloc.take_snapshot()
+
+    def stop(self):
+        after = tracemalloc.take_snapshot()
+        after.dump(self.prefix + ".tracemalloc")
+        current, peak = tracemalloc.get_traced_memory()
+        with open(self.prefix + ".tracemalloc.txt", "w") as f:
+            f.write(f"traced: {current / 1024 ** 2:.1f} MiB, peak {peak / 1024 ** 2:.1f} MiB\n\n")
+            for stat in after.compare_to(self.before, "lineno")[:40]:
+                f.write(f"{stat}\n")
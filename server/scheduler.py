@@ -0,0 +1,140 @@
+import math
+import threading
+import time
+from collections import deque
+
+from cancellation import CancelledError
+
+
+class OverloadedError(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Server overloaded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, tenant, cost, fn, cancel_token):
+        self.tenant = tenant
+        self.cost = cost
+        self.fn = fn
+        self.cancel_token = cancel_token
+        self.start_tag = 0.0
+        self.enqueued_at = time.time()
+        self.started_at = None
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class FairScheduler:
+    """Runs inference jobs one at a time with start-time fair queuing across tenants.
+
+    Each tenant has its own FIFO queue. A job's cost is its audio duration divided by
+    the tenant's weight, so a tenant sending long clips can't starve one dictating
+    short phrases. Jobs whose estimated wait would exceed max_wait_s are rejected.
+    """
+
+    def __init__(self, max_queue=32, max_wait_s=15.0, weights=None, metrics=None):
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self.weights = weights or {}
+        self.metrics = metrics
+        self.queues = {}
+        self.last_finish = {}
+        self.virtual_time = 0.0
+        self.queued = 0
+        self.current = None
+        # Seconds of service per second of audio, plus a fixed per-request overhead
+        self.rtf = 0.1
+        self.overhead = 0.2
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self._thread.start()
+
+    def estimate_service(self, cost):
+        return self.overhead + self.rtf * cost
+
+    def _estimated_wait(self, start_tag):
+        wait = 0.0
+        if self.current is not None:
+            elapsed = time.time() - self.current.started_at
+            wait += max(0.0, self.estimate_service(self.current.cost) - elapsed)
+        for queue in self.queues.values():
+            for job in queue:
+                if job.start_tag <= start_tag:
+                    wait += self.estimate_service(job.cost)
+        return wait
+
+    def submit(self, tenant, cost, fn, cancel_token=None):
+        """Queues fn() for the given tenant and blocks until it has run."""
+        job = Job(tenant, cost, fn, cancel_token)
+        weight = self.weights.get(tenant, 1.0)
+        with self._cond:
+            job.start_tag = max(self.virtual_time, self.last_finish.get(tenant, 0.0))
+            estimated_wait = self._estimated_wait(job.start_tag)
+            if self.queued >= self.max_queue or estimated_wait > self.max_wait_s:
+                if self.metrics:
+                    self.metrics.increment("rejected", tenant)
+                raise OverloadedError(max(1, math.ceil(estimated_wait)))
+            self.last_finish[tenant] = job.start_tag + cost / weight
+            self.queues.setdefault(tenant, deque()).append(job)
+            self.queued += 1
+            self._cond.notify_all()
+
+        while not job.done.wait(0.1):
+            if cancel_token is not None and cancel_token.is_cancelled():
+                with self._cond:
+                    if job.started_at is None:
+                        self._remove(job)
+                        raise CancelledError(cancel_token.reason)
+
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _remove(self, job):
+        queue = self.queues.get(job.tenant)
+        if queue and job in queue:
+            queue.remove(job)
+            self.queued -= 1
+            if not queue:
+                del self.queues[job.tenant]
+
+    def _next_job(self):
+        tenant = min(self.queues, key=lambda t: self.queues[t][0].start_tag)
+        job = self.queues[tenant].popleft()
+        self.queued -= 1
+        if not self.queues[tenant]:
+            del self.queues[tenant]
+        return job
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                while not self.queues:
+                    self._cond.wait()
+                job = self._next_job()
+                self.virtual_time = job.start_tag
+                job.started_at = time.time()
+                self.current = job
+
+            queue_wait = job.started_at - job.enqueued_at
+            try:
+                if job.cancel_token is not None:
+                    job.cancel_token.raise_if_cancelled()
+                job.result = job.fn()
+            except Exception as e:
+                job.error = e
+            service_time = time.time() - job.started_at
+
+            with self._cond:
+                self.current = None
+                if job.error is None and job.cost > 0:
+                    # Track the real-time factor with an EWMA for admission estimates
+                    self.rtf = 0.8 * self.rtf + 0.2 * max(0.0, service_time - self.overhead) / job.cost
+            if self.metrics:
+                self.metrics.observe("queue_wait_s", queue_wait, job.tenant)
+                self.metrics.observe("service_s", service_time, job.tenant)
+                self.metrics.increment("requests", job.tenant)
+            print(f"[{job.tenant}] queue wait {queue_wait:.2f}s, service {service_time:.2f}s")
+            job.done.set()
@@ -1,38 +1,289 @@
 import os
-import sys
 import time
-import numpy as np
-import io
-import wave
+import hmac
 import json
+import queue
+import threading
 from email.parser import BytesParser
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 
-from backends.glm_backend import GLMBackend
-from backends.sensevoice_backend import SenseVoiceBackend
-from backends.whisper_backend import WhisperBackend
+from audio import decode_wav, trim_silence, trim_settings
+from cancellation import CancellationRegistry, CancelledError, watch_disconnect
+from client_modules import load_client_module
+from idle import IdleManager
+from metrics import Metrics
+from profiling import Profiler
+from scheduler import FairScheduler, OverloadedError
+from unix_listener import UnixSocketListener
+
+from backends import BACKEND_TYPES, create_backend
 
 class ASRServer:
     def __init__(self, port, backend_type="glm", config=None):
         self.port = port
         self.config = config or {}
-        if backend_type == "glm":
-            self.backend = GLMBackend(config=self.config)
-        elif backend_type == "sensevoice" or backend_type == "sherpa-onnx/sense-voice":
-            self.backend = SenseVoiceBackend(config=self.config)
-        elif backend_type == "whisper":
-            self.backend = WhisperBackend(config=self.config)
-        else:
-            raise ValueError(f"Unknown backend type: {backend_type}")
-
-    def transcribe(self, audio_data, sample_rate, system_prompt=None, history=None, **kwargs):
-        return self.backend.transcribe(audio_data, sample_rate, system_prompt, history, **kwargs)
+        self.backend_type = backend_type
+        self.backend = create_backend(backend_type, config=self.config)
+        self.cancellations = CancellationRegistry()
+        self.metrics = Metrics()
+        # Requests are handled on separate threads so cancels can arrive while a
+        # transcription runs, but the model itself only serves one request at a time,
+        # picked fairly across tenants.
+        server_config = self.config.get("server", {})
+        self.scheduler = FairScheduler(
+            max_queue=server_config.get("max_queue", 32),
+            max_wait_s=server_config.get("max_wait_s", 15.0),
+            weights=server_config.get("tenant_weights", {}),
+            metrics=self.metrics,
+        )
+        # Leading and trailing silence costs model time on every request
+        self.trim_settings = trim_settings(server_config)
+
+        # Frees the model's memory after idle_offload_s without requests
+        self.idle = IdleManager(self.backend, idle_s=server_config.get("idle_offload_s"),
+                                mode=server_config.get("idle_offload_mode", "cpu"), metrics=self.metrics)
+
+        # /debug/profile is only served when a token is configured
+        self.profile_token = server_config.get("profile_token")
+        self.profiler = Profiler(server_config.get("profile_dir", "~/.local/share/wtako-asr-ime/profiles"),
+                                 slow_ms=server_config.get("profile_slow_ms"), metrics=self.metrics)
+
+        self.capture_store = None
+        capture_config = server_config.get("capture", {})
+        if capture_config.get("enabled"):
+            # The capture store lives with the client code
+            CaptureStore = load_client_module("capture_store").CaptureStore
+            capture_dir = capture_config.get("dir", "~/.local/share/wtako-asr-ime/server-captures")
+            self.capture_store = CaptureStore(capture_dir, max_bytes=int(capture_config.get("max_mb", 2048) * 1024 ** 2))
+            self.capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="asr-capture")
+            print(f"Capturing requests to {capture_dir}")
+
+    def trim(self, audio_data, sample_rate, tenant):
+        """Returns audio_data without leading and trailing silence, or None if it has no speech."""
+        if self.trim_settings is None:
+            return audio_data
+        duration = len(audio_data) / sample_rate
+        self.metrics.observe("audio_s", duration, tenant)
+        bounds = trim_silence(audio_data, sample_rate, **self.trim_settings)
+        if bounds is None:
+            self.metrics.increment("no_speech", tenant)
+            print(f"No speech in {duration:.2f}s of audio, skipping inference")
+            return None
+        start, end = bounds
+        trimmed_s = (len(audio_data) - (end - start)) / sample_rate
+        self.metrics.observe("trimmed_s", trimmed_s, tenant)
+        if trimmed_s > 0:
+            print(f"Trimmed {trimmed_s:.2f}s of {duration:.2f}s silence")
+        return audio_data[start:end]
+
+    def transcribe(self, audio_data, sample_rate, system_prompt=None, history=None, cancel_token=None, tenant="default", **kwargs):
+        speech = self.trim(audio_data, sample_rate, tenant)
+        if speech is None:
+            return ""
+
+        def run():
+            with self.idle.use(), self.profiler.request(cancel_token.request_id if cancel_token else None):
+                return self.backend.transcribe(speech, sample_rate, system_prompt, history, cancel_token=cancel_token, **kwargs)
+
+        start_time = time.time()
+        text = self.scheduler.submit(tenant, len(speech) / sample_rate, run, cancel_token)
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        self.capture(audio_data, sample_rate, tenant, system_prompt, kwargs, text, time.time() - start_time)
+        return text
+
+    def transcribe_stream(self, audio_data, sample_rate, system_prompt=None, history=None, cancel_token=None, tenant="default", **kwargs):
+        """Like transcribe(), but yields the text in pieces as the backend decodes it.
+
+        The backend's generator runs as the scheduler job on the dispatch thread and
+        hands pieces over through a queue, so streamed requests are scheduled and counted
+        like any other. Backends decode on a helper thread started with
+        start_stream_generate(), which the profiler follows.
+        """
+        speech = self.trim(audio_data, sample_rate, tenant)
+        if speech is None:
+            return
+        pieces = queue.Queue()
+        done = object()
+
+        def run():
+            with self.idle.use(), self.profiler.request(cancel_token.request_id if cancel_token else None):
+                text = ""
+                for piece in self.backend.transcribe_stream(speech, sample_rate, system_prompt, history, cancel_token=cancel_token, **kwargs):
+                    text += piece
+                    pieces.put(piece)
+                return text
+
+        def submit():
+            try:
+                self.scheduler.submit(tenant, len(speech) / sample_rate, run, cancel_token)
+                pieces.put(done)
+            except Exception as e:
+                pieces.put(e)
+
+        start_time = time.time()
+        threading.Thread(target=submit, daemon=True).start()
+        text = ""
+        while True:
+            piece = pieces.get()
+            if piece is done:
+                break
+            if isinstance(piece, Exception):
+                raise piece
+            text += piece
+            yield piece
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        self.capture(audio_data, sample_rate, tenant, system_prompt, kwargs, text, time.time() - start_time)
+
+    def capture(self, audio_data, sample_rate, tenant, system_prompt, kwargs, text, latency):
+        if not self.capture_store:
+            return
+        settings = {k: v for k, v in kwargs.items() if isinstance(v, (str, int, float, bool))}
+        settings["system_prompt"] = system_prompt
+        # Copied because Unix socket requests pass a view of the client's shared memory
+        self.capture_executor.submit(self.capture_request, audio_data.copy(), sample_rate, tenant, settings, text, latency)
+
+    def capture_request(self, audio_data, sample_rate, tenant, settings, text, latency):
+        to_capture_pcm = load_client_module("capture_store").to_capture_pcm
+        try:
+            self.capture_store.append(
+                to_capture_pcm(audio_data, sample_rate),
+                backend=self.backend_type, tenant=tenant, settings=settings,
+                raw_text=text, text=text, latency_s=latency,
+            )
+        except Exception as e:
+            print(f"Capture failed: {e}")
 
     def run(self):
         server_instance = self
         class ASRRequestHandler(BaseHTTPRequestHandler):
+            def send_json(self, status, obj):
+                body = json.dumps(obj, indent=2).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-type', 'application/json')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def authorized(self):
+                token = server_instance.profile_token
+                if not token:
+                    self.send_response(404)
+                    self.end_headers()
+                    return False
+                if not hmac.compare_digest(self.headers.get('Authorization', '').encode(), f"Bearer {token}".encode()):
+                    self.send_response(401)
+                    self.send_header('WWW-Authenticate', 'Bearer')
+                    self.end_headers()
+                    return False
+                return True
+
+            def handle_profile_get(self):
+                if not self.authorized():
+                    return
+                name = self.path.rstrip('/')[len('/debug/profile'):].lstrip('/')
+                if not name:
+                    self.send_json(200, server_instance.profiler.status())
+                    return
+                path = server_instance.profiler.artifact_path(name)
+                if path is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                with open(path, 'rb') as f:
+                    body = f.read()
+                self.send_response(200)
+                self.send_header('Content-type', 'application/octet-stream')
+                self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(path)}"')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def handle_profile_start(self):
+                content_length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(content_length)
+                if not self.authorized():
+                    return
+                try:
+                    options = json.loads(body or b'{}')
+                    session = server_instance.profiler.start(
+                        options.get('modes', ['cprofile']),
+                        requests=options.get('requests'),
+                        seconds=options.get('seconds'),
+                    )
+                except RuntimeError as e:
+                    self.send_json(409, {"error": str(e)})
+                    return
+                except (ValueError, TypeError, AttributeError) as e:
+                    self.send_json(400, {"error": str(e)})
+                    return
+                self.send_json(200, session)
+
+            def do_GET(self):
+                if self.path.startswith('/debug/profile'):
+                    self.handle_profile_get()
+                elif self.path.rstrip('/') == '/stats':
+                    stats = server_instance.metrics.snapshot()
+                    stats["_model"] = server_instance.idle.status()
+                    self.send_json(200, stats)
+                else:
+                    self.send_response(405)
+                    self.end_headers()
+
             def do_POST(self):
+                if self.path.rstrip('/') == '/cancel':
+                    self.handle_cancel()
+                elif self.path.rstrip('/') == '/prewarm':
+                    server_instance.idle.prewarm()
+                    self.send_response(202)
+                    self.end_headers()
+                elif self.path.rstrip('/') == '/debug/profile':
+                    self.handle_profile_start()
+                else:
+                    self.handle_transcribe()
+
+            def handle_cancel(self):
+                content_length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(content_length).decode('utf-8').strip()
+                request_id = self.headers.get('X-Request-ID') or body
+                found = server_instance.cancellations.cancel(request_id, reason="cancelled by client")
+                print(f"Cancel request for {request_id}: {'found' if found else 'not found'}")
+                self.send_response(200 if found else 404)
+                self.end_headers()
+
+            def write_event(self, event, data):
+                self.wfile.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+
+            def send_stream(self, pieces, cancel_token):
+                """Sends pieces as server-sent events: partial per piece, then done with the full text.
+
+                Errors before the first piece get a plain status code; later ones an error event.
+                """
+                piece = next(pieces, None)
+                self.send_response(200)
+                self.send_header('Content-type', 'text/event-stream; charset=utf-8')
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+                text = ""
+                try:
+                    while piece is not None:
+                        text += piece
+                        self.write_event("partial", {"text": piece})
+                        piece = next(pieces, None)
+                    self.write_event("done", {"text": text})
+                except OSError:
+                    cancel_token.cancel("client disconnected")
+                except Exception as e:
+                    status = 499 if isinstance(e, CancelledError) else 500
+                    print(f"Request {cancel_token.request_id} failed while streaming: {e}")
+                    try:
+                        self.write_event("error", {"status": status, "error": str(e)})
+                    except OSError:
+                        pass
+
+            def handle_transcribe(self):
                 content_type = self.headers.get('Content-Type', '')
                 system_prompt = None
                 audio_np = None
@@ -54,16 +305,8 @@ class ASRServer:
                                 if name == 'system_prompt':
                                     system_prompt = part.get_payload(decode=True).decode('utf-8')
                                 elif name == 'audio':
-                                    audio_data_bytes = part.get_payload(decode=True)
-                                    audio_file = io.BytesIO(audio_data_bytes)
                                     try:
-                                        with wave.open(audio_file, 'rb') as wav_file:
-                                            params = wav_file.getparams()
-                                            frames = wav_file.readframes(params.nframes)
-                                            audio_np = np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768.0
-                                            sample_rate = params.framerate
-                                            if params.nchannels > 1:
-                                                audio_np = audio_np.reshape(-1, params.nchannels).mean(axis=1)
+                                        audio_np, sample_rate = decode_wav(part.get_payload(decode=True))
                                     except Exception as e:
                                         print(f"Error parsing WAV from multipart: {e}")
                     except Exception as e:
@@ -73,14 +316,7 @@ class ASRServer:
                     content_length = int(self.headers.get('Content-Length', 0))
                     post_data = self.rfile.read(content_length)
                     try:
-                        with io.BytesIO(post_data) as bio:
-                            with wave.open(bio, 'rb') as wav_file:
-                                params = wav_file.getparams()
-                                frames = wav_file.readframes(params.nframes)
-                                audio_np = np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768.0
-                                sample_rate = params.framerate
-                                if params.nchannels > 1:
-                                    audio_np = audio_np.reshape(-1, params.nchannels).mean(axis=1)
+                        audio_np, sample_rate = decode_wav(post_data)
                     except Exception as e:
                         print(f"Error parsing raw WAV: {e}")
 
@@ -113,14 +349,51 @@ class ASRServer:
                     except Exception:
                         pass
 
-                text = server_instance.transcribe(audio_np, sample_rate, system_prompt=system_prompt, **extra_kwargs)
+                timeout = None
+                try:
+                    timeout = float(self.headers.get('X-Request-Timeout', 0)) or None
+                except ValueError:
+                    pass
+                cancel_token = server_instance.cancellations.register(self.headers.get('X-Request-ID'), timeout=timeout)
+                done_event = threading.Event()
+                threading.Thread(target=watch_disconnect, args=(self.connection, cancel_token, done_event), daemon=True).start()
+                tenant = self.headers.get('X-Client-ID') or self.client_address[0]
+                try:
+                    if 'text/event-stream' in self.headers.get('Accept', ''):
+                        pieces = server_instance.transcribe_stream(audio_np, sample_rate, system_prompt=system_prompt, cancel_token=cancel_token, tenant=tenant, **extra_kwargs)
+                        self.send_stream(pieces, cancel_token)
+                        return
+                    text = server_instance.transcribe(audio_np, sample_rate, system_prompt=system_prompt, cancel_token=cancel_token, tenant=tenant, **extra_kwargs)
+                except OverloadedError as e:
+                    print(f"Rejecting request from {tenant}: {e}")
+                    self.send_response(503)
+                    self.send_header('Retry-After', str(e.retry_after))
+                    self.end_headers()
+                    self.wfile.write(str(e).encode('utf-8'))
+                    return
+                except CancelledError as e:
+                    print(f"Request {cancel_token.request_id} cancelled: {e}")
+                    try:
+                        self.send_response(499)
+                        self.end_headers()
+                        self.wfile.write(b"Cancelled")
+                    except OSError:
+                        pass
+                    return
+                finally:
+                    done_event.set()
+                    server_instance.cancellations.unregister(cancel_token)
                 
                 self.send_response(200)
                 self.send_header('Content-type', 'text/plain; charset=utf-8')
                 self.end_headers()
                 self.wfile.write(text.encode('utf-8'))
 
-        httpd = HTTPServer(('0.0.0.0', self.port), ASRRequestHandler)
+        unix_socket = self.config.get("server", {}).get("unix_socket")
+        if unix_socket:
+            UnixSocketListener(self, unix_socket).start()
+
+        httpd = ThreadingHTTPServer(('0.0.0.0', self.port), ASRRequestHandler)
         print(f"HTTP ASR Server listening on port {self.port}...")
         try:
             httpd.serve_forever()
@@ -131,9 +404,10 @@ class ASRServer:
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="ASR Server")
     parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
-    parser.add_argument("--backend", type=str, default="glm", choices=["glm", "sensevoice", "sherpa-onnx/sense-voice", "whisper"], help="ASR backend to use")
+    parser.add_argument("--backend", type=str, default="glm", choices=BACKEND_TYPES, help="ASR backend to use")
     parser.add_argument("--config", type=str, help="Path to config.json")
     parser.add_argument("--config-json", type=str, help="JSON string of config")
+    parser.add_argument("--unix-socket", type=str, help="Also accept shared-memory requests on this Unix socket path")
     args = parser.parse_args()
 
     config = {}
@@ -152,5 +426,8 @@ if __name__ == "__main__":
             with open(default_config, 'r') as f:
                 config = json.load(f)
 
+    if args.unix_socket:
+        config.setdefault("server", {})["unix_socket"] = args.unix_socket
+
     server = ASRServer(args.port, backend_type=args.backend, config=config)
     server.run()
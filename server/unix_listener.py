@@ -0,0 +1,191 @@
+import os
+import json
+import stat
+import struct
+import threading
+import socketserver
+from collections import OrderedDict
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+
+from cancellation import CancelledError, watch_disconnect
+from scheduler import OverloadedError
+
+# Messages are JSON objects preceded by their length
+HEADER = struct.Struct("!I")
+MAX_MESSAGE_BYTES = 1 << 20
+
+
+def recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def recv_message(sock):
+    header = recv_exact(sock, HEADER.size)
+    if header is None:
+        return None
+    (size,) = HEADER.unpack(header)
+    if size > MAX_MESSAGE_BYTES:
+        raise ValueError(f"message of {size} bytes is too large")
+    body = recv_exact(sock, size)
+    return None if body is None else json.loads(body)
+
+
+def send_message(sock, message):
+    body = json.dumps(message).encode('utf-8')
+    sock.sendall(HEADER.pack(len(body)) + body)
+
+
+def attach_segment(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        # Before Python 3.13 attaching also registers the segment to be unlinked when
+        # this process exits, but it belongs to the client
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def close_segment(shm):
+    try:
+        shm.close()
+    except BufferError:
+        # A view is still alive somewhere; the mapping goes away with it
+        pass
+
+
+class SharedSegments:
+    """Client segments attached by name and kept mapped across requests."""
+
+    def __init__(self, max_segments=4):
+        self.max_segments = max_segments
+        self.segments = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        with self.lock:
+            shm = self.segments.get(name)
+            if shm is not None:
+                self.segments.move_to_end(name)
+                return shm
+            shm = attach_segment(name)
+            self.segments[name] = shm
+            while len(self.segments) > self.max_segments:
+                close_segment(self.segments.popitem(last=False)[1])
+            return shm
+
+
+class UnixSocketListener:
+    """Accepts transcription requests whose audio is in shared memory.
+
+    A request is one connection carrying a descriptor: the segment name, the offset
+    and length of float32 PCM in it, the sample rate and the backend settings. The
+    audio is read through a numpy view of the segment without copying and goes through
+    the same trimming, scheduling and cancellation as HTTP requests. With "stream" set,
+    {"partial": piece} messages precede the final response. The view is only used
+    until the response is sent, after which the client reuses the space.
+    """
+
+    def __init__(self, asr_server, path):
+        self.asr_server = asr_server
+        self.path = path
+        self.segments = SharedSegments()
+
+    def start(self):
+        try:
+            mode = os.lstat(self.path).st_mode
+        except FileNotFoundError:
+            mode = None
+        if mode is not None:
+            # Only a socket left behind by an earlier run is replaced
+            if not stat.S_ISSOCK(mode):
+                raise RuntimeError(f"{self.path} exists and is not a socket")
+            os.remove(self.path)
+        listener = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                try:
+                    message = recv_message(self.request)
+                except (OSError, ValueError) as e:
+                    print(f"Bad request on {listener.path}: {e}")
+                    return
+                if message is None:
+                    return
+                op = message.get("op")
+                if op == "ping":
+                    send_message(self.request, {"status": 200})
+                elif op == "prewarm":
+                    listener.asr_server.idle.prewarm()
+                    send_message(self.request, {"status": 202})
+                elif op == "cancel":
+                    found = listener.asr_server.cancellations.cancel(message.get("request_id"), reason="cancelled by client")
+                    print(f"Cancel request for {message.get('request_id')}: {'found' if found else 'not found'}")
+                    send_message(self.request, {"status": 200 if found else 404})
+                elif op == "transcribe":
+                    response = listener.transcribe(message, self.request)
+                    if response is not None:
+                        send_message(self.request, response)
+                else:
+                    send_message(self.request, {"status": 400, "error": f"unknown op {op}"})
+
+        # Only the user running the server may submit requests. The socket is created
+        # with these permissions, so there is no window in which others can connect.
+        old_umask = os.umask(0o177)
+        try:
+            server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        finally:
+            os.umask(old_umask)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Unix socket ASR listener on {self.path}")
+        return server
+
+    def transcribe(self, message, connection):
+        try:
+            shm = attach_segment(message["shm"]) if message.get("ephemeral") else self.segments.get(message["shm"])
+            audio_np = np.ndarray((message["length"],), dtype=np.float32, buffer=shm.buf, offset=message["offset"])
+        except (KeyError, ValueError, TypeError, FileNotFoundError) as e:
+            return {"status": 400, "error": f"bad audio descriptor: {e}"}
+
+        settings = dict(message.get("settings") or {})
+        system_prompt = settings.pop("system_prompt", None)
+        cancel_token = self.asr_server.cancellations.register(message.get("request_id"), timeout=message.get("timeout"))
+        done_event = threading.Event()
+        threading.Thread(target=watch_disconnect, args=(connection, cancel_token, done_event), daemon=True).start()
+        tenant = message.get("client_id") or "local"
+        try:
+            if message.get("stream"):
+                # Pieces go out as they are decoded, followed by the usual final response
+                text = ""
+                for piece in self.asr_server.transcribe_stream(audio_np, message["sample_rate"], system_prompt=system_prompt, cancel_token=cancel_token, tenant=tenant, **settings):
+                    text += piece
+                    send_message(connection, {"partial": piece})
+            else:
+                text = self.asr_server.transcribe(audio_np, message["sample_rate"], system_prompt=system_prompt, cancel_token=cancel_token, tenant=tenant, **settings)
+        except (BrokenPipeError, ConnectionResetError):
+            cancel_token.cancel("client disconnected")
+            return None
+        except OverloadedError as e:
+            print(f"Rejecting request from {tenant}: {e}")
+            return {"status": 503, "retry_after": e.retry_after, "error": str(e)}
+        except CancelledError as e:
+            print(f"Request {cancel_token.request_id} cancelled: {e}")
+            return {"status": 499, "error": "Cancelled"}
+        except Exception as e:
+            print(f"Error transcribing request {cancel_token.request_id}: {e}")
+            return {"status": 500, "error": str(e)}
+        finally:
+            done_event.set()
+            self.asr_server.cancellations.unregister(cancel_token)
+            del audio_np
+            if message.get("ephemeral"):
+                close_segment(shm)
+        return {"status": 200, "text": text}